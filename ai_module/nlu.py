@@ -7,9 +7,13 @@ from openai import OpenAI
 from openai.types.chat import ChatCompletion
 import asyncio
 from tenacity import retry, stop_after_attempt, wait_exponential
+from bot.utils.deadline import Deadline, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
+# Share of the remaining response budget the NLU stage may use; the rest is left for the database and generation
+NLU_BUDGET_SHARE = 0.4
+
 class NLUProcessor:
     def __init__(self):
         self.api_key = app_settings.AI_API_KEY.get_secret_value()
@@ -38,7 +42,8 @@ class NLUProcessor:
             "и entities (сущности), которые явно указаны в тексте. Не отвечай на вопрос, не выдумывай данные, "
             "не интерпретируй неявные фразы. Дата должна быть только в формате дд.мм.гггг. "
             "Если дата указана иначе (например, 'завтра'), не добавляй сущность date. "
-            "Если сущность не указана — не включай её в JSON.\n\n"
+            "Если сущность не указана — не включай её в JSON. "
+            "Если у сущности несколько значений (несколько дат, имен, отделов), верни их JSON-списком.\n\n"
             "Возможные интенты:\n"
             "- find_employee: Поиск сотрудника или информации о сотруднике\n"
             "- find_by_position: Поиск сотрудников по должности\n"
@@ -48,6 +53,7 @@ class NLUProcessor:
             "- task_info: Задачи\n"
             "- availability: Свободен ли сотрудник\n"
             "- lunch_game_invite: Найти коллег по интересам\n"
+            "- count_info: Подсчет количества (сколько сотрудников, задач, мероприятий)\n"
             "- general_question: Общий вопрос\n"
             "- unknown: Неопределено\n\n"
             "Возможные сущности:\n"
@@ -56,10 +62,19 @@ class NLUProcessor:
             "- position: должность\n"
             "- info_type: тип запрашиваемой информации (education, hire_date, phone_number, job_title)\n"
             "- project: проект\n"
+            "- interest: интерес или навык для lunch_game_invite (например, 'настольные игры', 'python')\n"
             "- date: дата (только в формате дд.мм.гггг)\n"
+            "- period: период для birthday_info и event_info (today, tomorrow, this_week, next_week, this_month, "
+            "next_month или название месяца, например 'март')\n"
+            "- time: время в формате ЧЧ:ММ (например, для availability)\n"
+            "- weekday: день недели для повторяющихся запросов ('по пятницам' -> 'пятница')\n"
             "- event_type: тип события\n"
             "- task_keyword: ключ задачи\n"
-            "- location: место"
+            "- location: место\n"
+            "- target: что считать для count_info (employees, events, tasks)\n"
+            "- status: статус задачи (open, pending, in_progress, completed)\n"
+            "- priority: приоритет задачи (low, medium, high)\n"
+            "- group_by: поле группировки для count_info (department, position, status, priority, type)"
         )
 
     def _validate_nlu_result(self, result: str) -> Optional[Dict[str, Any]]:
@@ -107,27 +122,41 @@ class NLUProcessor:
         """
         Call the AI API with retry logic.
         """
+        return await self._request(messages)
+
+    async def _request(self, messages: list, timeout: Optional[float] = None) -> Optional[ChatCompletion]:
+        """
+        Single AI API call. Used directly under a deadline: a 4-10 s retry wait
+        would spend most of the NLU share sleeping.
+        """
+        # The HTTP timeout matches the stage budget so the worker thread does not outlive it
+        options = {"timeout": timeout} if timeout is not None else {}
         try:
             response = await asyncio.to_thread(
                 self.client.chat.completions.create,
                 model=self.model,
                 messages=messages,
-                temperature=0.1  # Low temperature for more consistent results
+                temperature=0.1,  # Low temperature for more consistent results
+                **options
             )
             return response
         except Exception as e:
             logger.error(f"Error calling AI API: {e}")
             raise
 
-    async def process_query(self, user_query: str) -> Optional[Dict[str, Any]]:
+    async def process_query(self, user_query: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
         """
         Process a user query through the NLU pipeline.
 
         Args:
             user_query: The user's input text
+            deadline: Response deadline; NLU takes NLU_BUDGET_SHARE of the remaining time
 
         Returns:
             Dict containing intent and entities or None if processing failed
+
+        Raises:
+            DeadlineExceeded: if the model did not answer within the NLU share of the deadline
         """
         if not user_query.strip():
             logger.warning("Empty query received")
@@ -140,7 +169,11 @@ class NLUProcessor:
             ]
 
             logger.debug(f"Sending request to AI model with query: {user_query}")
-            response = await self._call_ai_api(messages)
+            if deadline is None:
+                response = await self._call_ai_api(messages)
+            else:
+                budget = deadline.share(NLU_BUDGET_SHARE)
+                response = await deadline.run(self._request(messages, timeout=budget), NLU_BUDGET_SHARE, stage="nlu")
 
             if not response or not response.choices or not response.choices[0].message:
                 logger.warning("Empty or invalid response from AI model")
@@ -156,6 +189,8 @@ class NLUProcessor:
             
             return None
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error processing query: {e}")
             return None
@@ -172,20 +207,24 @@ def get_nlu_processor() -> NLUProcessor:
         _nlu_processor = NLUProcessor()
     return _nlu_processor
 
-async def process_user_query(user_query: str, system_prompt: str = None) -> Optional[Dict[str, Any]]:
+async def process_user_query(user_query: str, system_prompt: str = None,
+                             deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
     """
     Process a user query through the NLU pipeline.
 
     Args:
         user_query: The user's input text
         system_prompt: Optional custom system prompt
+        deadline: Optional response deadline (DeadlineExceeded is raised when it runs out)
 
     Returns:
         Dict containing intent and entities or None if processing failed
     """
     try:
         processor = get_nlu_processor()
-        return await processor.process_query(user_query)
+        return await processor.process_query(user_query, deadline)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error in process_user_query: {e}")
         return None
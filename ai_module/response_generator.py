@@ -1,79 +1,180 @@
 from typing import Dict, Any, Optional, List
+import html
 import json
 import logging
 import asyncio
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from openai import OpenAI
 from bot.config import app_settings
+from bot.utils.ai_request_models import entity_values
+from bot.utils.availability import parse_time
+from bot.utils.birthday_index import BirthdayService
+from bot.utils.deadline import Deadline, DeadlineExceeded
+from bot.utils.event_calendar import EventCalendarService
+from bot.utils.fanout import merge_rows
+from bot.utils.periods import parse_date, resolve_period, resolve_weekday
+from bot.utils.query_planner import plan_query
+from bot.utils.repository import Repository
 
 logger = logging.getLogger(__name__)
 
+# Share of the remaining budget for fetching context data; generation gets the rest
+FETCH_BUDGET_SHARE = 0.5
+# Seconds kept back from generation to render the fallback answer and send it
+RENDER_RESERVE = 0.5
+# Rows listed in the fallback answer when generation runs out of time
+FALLBACK_ROWS = 10
+FALLBACK_HEADER = "⌛ Не успел подготовить подробный ответ, вот что нашлось:"
+
+
+def render_context(context_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Plain rendering of fetched rows or counts, used when the model did not answer in time.
+
+    Returns None when there is nothing worth showing.
+    """
+    data = context_data.get("data")
+    if not context_data.get("found") or not data:
+        return None
+
+    lines = [FALLBACK_HEADER]
+    if isinstance(data, dict):
+        # Result of repository.aggregate: a total or counts per group
+        if data.get("groups"):
+            lines += [f"{html.escape(str(group))}: {count}" for group, count in data["groups"].items()]
+        elif data.get("count") is not None:
+            lines.append(f"Количество: {data['count']}")
+        else:
+            return None
+    else:
+        for row in data[:FALLBACK_ROWS]:
+            values = [
+                ", ".join(map(str, value)) if isinstance(value, list) else str(value)
+                for key, value in row.items() if key != "id" and value not in (None, "", [])
+            ]
+            lines.append("• " + html.escape(" — ".join(values)))
+        if len(data) > FALLBACK_ROWS:
+            lines.append(f"…и еще {len(data) - FALLBACK_ROWS}")
+    return "\n".join(lines)
+
+
 class ResponseGenerator:
-    def __init__(self, supabase_client):
+    def __init__(self, repository: Repository):
         self.client = OpenAI(
             api_key=app_settings.AI_API_KEY.get_secret_value(),
             base_url=app_settings.AI_BASE_URL
         )
-        self.supabase = supabase_client
+        self.repository = repository
         self.model = app_settings.AI_MODEL
 
-    async def _fetch_employees(self, entities: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Fetch employees based on entities."""
-        try:
-            query = self.supabase.table("employees").select("*")
-            
-            if "department" in entities:
-                query = query.ilike("department", f"%{entities['department']}%")
-            if "project" in entities:
-                query = query.contains("projects", [entities["project"]])
-            if "date" in entities:
-                # Here you would typically join with a schedule/availability table
-                # For now, we'll just filter by department and project
-                pass
-                
-            result = query.execute()
-            return result.data if result.data else []
-            
-        except Exception as e:
-            logger.error(f"Error fetching employees: {e}")
-            return []
+    @classmethod
+    def for_repository(cls, repository: Repository) -> "ResponseGenerator":
+        """One generator (and one HTTP client to the model) per repository, shared by all bots of the process."""
+        return repository.service("response_generator", cls)
+
+    async def _fetch_birthdays(self, entities: Dict[str, Any]) -> Dict[str, Any]:
+        """Birthdays come from the in-memory index instead of scanning employees."""
+        period = entity_values(entities, "period")
+        interval = resolve_period(period[0]) if period else None
+        if interval is None:
+            dates = [day for day in map(parse_date, entity_values(entities, "date")) if day]
+            today = date.today()
+            interval = (min(dates), max(dates)) if dates else (today, today + timedelta(days=6))
+
+        birthdays = await BirthdayService.for_repository(self.repository).between(*interval)
+        data = [
+            {"name": employee.get("name"), "department": employee.get("department"), "birthday": day.strftime("%d.%m")}
+            for day, employee in birthdays
+        ]
+        return {"found": bool(data), "data": data, "error": None, "query_params": entities}
+
+    async def _find_events(self, entities: Dict[str, Any], columns, limit: Optional[int]):
+        """Events from the in-memory calendar: date ranges, upcoming and recurring windows."""
+        calendar = await EventCalendarService.for_repository(self.repository).get()
+        if calendar is None:
+            return await self.repository.find_events(
+                dates=entity_values(entities, "date"),
+                types=entity_values(entities, "event_type"),
+                columns=columns,
+                limit=limit,
+            )
+
+        types = entity_values(entities, "event_type") or [None]
+        location = next(iter(entity_values(entities, "location")), None)
+        period = entity_values(entities, "period")
+        dates = [day for day in map(parse_date, entity_values(entities, "date")) if day]
+        weekday = next(iter(entity_values(entities, "weekday")), None)
+        weekday = resolve_weekday(weekday) if weekday else None
+        slot = parse_time(next(iter(entity_values(entities, "time")), None))
+
+        intervals = [interval] if period and (interval := resolve_period(period[0])) else []
+        intervals += [(day, day) for day in dates]
+        events = []
+        for event_type in types:
+            if weekday is not None:
+                # Recurring window: "every Friday after 18:00" over the period (four weeks by default)
+                start, end = intervals[0] if intervals else (date.today(), date.today() + timedelta(days=27))
+                start_minutes = slot[0] * 60 + slot[1] if slot else -1
+                events += calendar.recurring(weekday, start_minutes, 24 * 60, start, end, event_type, location)
+            elif intervals:
+                for start, end in intervals:
+                    events += calendar.between(start, end, event_type, location)
+            else:
+                events += calendar.upcoming(limit or 10, event_type=event_type, location=location)
+
+        data = merge_rows([[{column: event.get(column) for column in columns} for event in events]])
+        return (data[:limit] if limit else data), None
 
     async def _fetch_context_data(self, intent: str, entities: Dict[str, Any]) -> Dict[str, Any]:
         """Fetch relevant data from Supabase based on intent and entities."""
         context_data = {"found": False, "data": None, "error": None}
-        
+        if intent == "birthday_info":
+            return await self._fetch_birthdays(entities)
+
+        plan = plan_query(intent, entities)
+        if plan is None:
+            return context_data
+
         try:
-            if intent == "find_employee":
-                employees = await self._fetch_employees(entities)
-                context_data = {
-                    "found": bool(employees),
-                    "data": employees,
+            if plan.count_only:
+                # Count on the server (or the local store), never ship rows to the LLM
+                result = await self.repository.aggregate({"target": plan.table, **entities})
+                return {
+                    "found": result["error"] is None,
+                    "data": result,
+                    "error": result["error"],
                     "query_params": entities
                 }
-            
+
+            if intent == "find_employee":
+                # "date" would typically require a join with a schedule/availability table
+                data, error = await self.repository.find_employees(
+                    names=entity_values(entities, "employee_name"),
+                    departments=entity_values(entities, "department"),
+                    projects=entity_values(entities, "project"),
+                    columns=plan.with_columns("projects").columns,
+                    limit=plan.limit,
+                )
+
             elif intent == "event_info":
-                query = self.supabase.table("events")
-                if "date" in entities:
-                    query = query.eq("date", entities["date"])
-                if "event_type" in entities:
-                    query = query.eq("type", entities["event_type"])
-                result = query.execute()
-                context_data = {
-                    "found": bool(result.data),
-                    "data": result.data,
-                    "query_params": entities
-                }
+                data, error = await self._find_events(entities, plan.columns, plan.limit)
 
             elif intent == "task_info":
-                query = self.supabase.table("tasks")
-                if "task_keyword" in entities:
-                    query = query.ilike("description", f"%{entities['task_keyword']}%")
-                result = query.execute()
-                context_data = {
-                    "found": bool(result.data),
-                    "data": result.data,
-                    "query_params": entities
-                }
+                data, error = await self.repository.find_tasks(
+                    keywords=entity_values(entities, "task_keyword"),
+                    columns=plan.columns,
+                    limit=plan.limit,
+                )
+
+            else:
+                return context_data
+
+            context_data = {
+                "found": bool(data),
+                "data": data,
+                "error": error,
+                "query_params": entities
+            }
 
         except Exception as e:
             logger.error(f"Error fetching context data: {e}")
@@ -81,14 +182,29 @@ class ResponseGenerator:
 
         return context_data
 
-    async def generate_response(self, nlu_result: Dict[str, Any]) -> Optional[str]:
-        """Generate human-readable response based on NLU output and context data."""
+    async def _fetch_within(self, intent: str, entities: Dict[str, Any], deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """Context data within FETCH_BUDGET_SHARE of the deadline; an error entry when it runs out."""
+        if deadline is None:
+            return await self._fetch_context_data(intent, entities)
+        try:
+            return await deadline.run(self._fetch_context_data(intent, entities), FETCH_BUDGET_SHARE, stage="database")
+        except DeadlineExceeded as e:
+            logger.warning(f"Context data not fetched in time: {e}")
+            return {"found": False, "data": None, "error": "database timeout", "query_params": entities}
+
+    async def generate_response(self, nlu_result: Dict[str, Any], deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        Generate human-readable response based on NLU output and context data.
+
+        With a deadline, data fetching and generation each take their share of the
+        remaining time; if generation runs out, the fetched rows are rendered as is.
+        """
         try:
             intent = nlu_result.get("intent")
             entities = nlu_result.get("entities", {})
 
             # Fetch relevant data from Supabase
-            context_data = await self._fetch_context_data(intent, entities)
+            context_data = await self._fetch_within(intent, entities, deadline)
 
             # Prepare system prompt based on intent and context
             system_prompt = (
@@ -112,7 +228,18 @@ class ResponseGenerator:
                 {"role": "user", "content": json.dumps(user_message, ensure_ascii=False)}
             ]
 
-            response = await self._call_ai_api(messages)
+            if deadline is None:
+                response = await self._call_ai_api(messages)
+            else:
+                try:
+                    budget = deadline.share(reserve=RENDER_RESERVE)
+                    response = await deadline.run(
+                        self._call_ai_api(messages, timeout=budget), reserve=RENDER_RESERVE, stage="generation"
+                    )
+                except DeadlineExceeded as e:
+                    logger.warning(f"Generation did not finish in time, answering with raw data: {e}")
+                    return render_context(context_data)
+
             if response and response.choices and response.choices[0].message:
                 return response.choices[0].message.content.strip()
             
@@ -123,14 +250,16 @@ class ResponseGenerator:
             logger.error(f"Error generating response: {e}")
             return None
 
-    async def _call_ai_api(self, messages: List[Dict[str, str]]) -> Any:
+    async def _call_ai_api(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> Any:
         """Make the API call to the AI model."""
+        options = {"timeout": timeout} if timeout is not None else {}
         try:
             return await asyncio.to_thread(
                 self.client.chat.completions.create,
                 model=self.model,
                 messages=messages,
-                temperature=0.7  # Slightly higher temperature for more natural responses
+                temperature=0.7,  # Slightly higher temperature for more natural responses
+                **options
             )
         except Exception as e:
             logger.error(f"Error calling AI API: {e}")
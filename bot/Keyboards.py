@@ -1,5 +1,14 @@
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
+
+class EmployeesPageCallback(CallbackData, prefix="emp"):
+    """Курсор страницы списка сотрудников: направление ('next'/'prev') и id граничной записи."""
+    direction: str
+    cursor: int
+
 def get_main_menu_keyboard() -> ReplyKeyboardMarkup:
         kb = [
             [KeyboardButton(text="❓ Задать вопрос AI")],
@@ -23,4 +32,21 @@ def get_help_keyboard() -> ReplyKeyboardMarkup:
         resize_keyboard=True,
         one_time_keyboard=True
     )
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+def get_employees_page_keyboard(first_id: Optional[int], last_id: Optional[int],
+                                has_prev: bool, has_next: bool) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if has_prev and first_id is not None:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=EmployeesPageCallback(direction="prev", cursor=first_id).pack()
+        ))
+    if has_next and last_id is not None:
+        buttons.append(InlineKeyboardButton(
+            text="Вперед ➡️",
+            callback_data=EmployeesPageCallback(direction="next", cursor=last_id).pack()
+        ))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
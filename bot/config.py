@@ -60,18 +60,100 @@ class Settings(BaseSettings):
     AI_API_KEY: SecretStr
     AI_BASE_URL: str = "https://inference.api.nscale.com/v1"
     AI_MODEL: str = "Qwen/Qwen3-235B-A22B"
+    DASHSCOPE_API_KEY: Optional[str] = None
     
     # NLU settings
     NLU_CONFIDENCE_THRESHOLD: float = 0.7
     
+    # Update delivery: "polling" or "webhook"
+    DELIVERY_MODE: str = "polling"
+    WEBHOOK_BASE_URL: Optional[str] = None  # public https URL of the load balancer / instance
+    WEBHOOK_PATH: str = "/telegram/webhook"
+    WEBHOOK_SECRET: Optional[SecretStr] = None  # required in webhook mode
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SET_ON_START: bool = True
+    WEBHOOK_DRAIN_TIMEOUT: float = 20.0
+    # Alternative Bot API server (local Bot API or tools/fake_telegram.py for testing)
+    TELEGRAM_API_URL: Optional[str] = None
+
+    # Polling: the processed update offset survives restarts; the backlog is replayed in parallel
+    UPDATE_OFFSET_PATH: str = "update_offset.json"
+    BACKLOG_MAX_AGE: int = 900  # updates older than this (seconds) are skipped after downtime
+    POLLING_CONCURRENCY: int = 32
+
+    # JSON list of additional bots hosted in this process (name, token, allowed_user_ids, notifications)
+    BOTS_CONFIG_PATH: Optional[str] = None
+
+    # Worker processes; updates are sharded by chat_id hash when > 1
+    WORKERS: int = 1
+    # SQLite file shared by worker processes for cross-process caches (unset = in-process caches).
+    # Shares the SQL template cache and table versions (writes in one worker invalidate the others' stores).
+    SHARED_CACHE_PATH: Optional[str] = None
+
+    # FSM storage: "lru" (bounded in-memory), "memory" (aiogram MemoryStorage), "sqlite" or "redis"
+    FSM_STORAGE: str = "lru"
+    FSM_MAX_KEYS: int = 10000
+    FSM_TTL: int = 24 * 3600  # idle chat state is dropped after this many seconds
+    FSM_SQLITE_PATH: str = "fsm.sqlite3"
+    FSM_REDIS_URL: str = "redis://localhost:6379/0"
+
     # Response settings
-    MAX_RESPONSE_LENGTH: int = 2000
-    DEFAULT_RESPONSE_TIMEOUT: int = 30
+    MAX_RESPONSE_LENGTH: int = 2000  # longer replies are split into several messages
+    DEFAULT_RESPONSE_TIMEOUT: int = 30  # budget from receiving the update to the reply, shared by NLU, DB and generation
+
+    # Outbound message queue (Telegram allows ~30 msg/s per bot and ~1 msg/s per chat)
+    OUTBOUND_GLOBAL_RATE: float = 25.0
+    OUTBOUND_CHAT_RATE: float = 1.0
+    OUTBOUND_CHAT_BURST: float = 3
+    OUTBOUND_WORKERS: int = 16
+
+    # Per-user throttling of incoming messages
+    THROTTLE_RATE: float = 0.5  # messages/s sustained
+    THROTTLE_BURST: float = 5
+    THROTTLE_DUPLICATE_WINDOW: float = 10.0  # identical message within this window is dropped
+    THROTTLE_MAX_USERS: int = 10000
+    THROTTLE_CANCEL_STALE: bool = True  # a newer question cancels the user's unfinished one in the same chat (job executor)
+
+    # Background execution of AI requests (handlers return immediately, replies come via the outbound queue)
+    JOB_WORKERS: int = 8
+    JOB_QUEUE_MAX: int = 100
+    JOB_DEADLINE: float = 60.0  # seconds from the user's message to the reply
+    JOB_DRAIN_TIMEOUT: float = 20.0
+    JOBS_PENDING_PATH: Optional[str] = "pending_jobs.json"  # unfinished jobs are saved here on shutdown
+
+    # Group chats: only mentions, replies to the bot and (optionally) classifier-approved questions reach the AI
+    GROUP_CLASSIFIER_ENABLED: bool = True
+    GROUP_RELEVANCE_THRESHOLD: float = 0.7
 
     # Database settings
     DB_QUERY_TIMEOUT: int = 10
     MAX_QUERY_RESULTS: int = 50
 
+    # Employee directory paging (/get_employees)
+    EMPLOYEES_PAGE_SIZE: int = 10
+    EMPLOYEES_PAGE_CACHE_TTL: int = 120
+
+    # Adaptive concurrency limit for Supabase requests (AIMD)
+    DB_CONCURRENCY_INITIAL: int = 8
+    DB_CONCURRENCY_MIN: int = 2
+    DB_CONCURRENCY_MAX: int = 32
+    DB_LATENCY_TARGET_MS: int = 800
+    DB_QUEUE_TIMEOUT: float = 5.0
+    DB_QUEUE_MAX: int = 200
+
+    # Precomputed answers to frequent questions (refresh cadence, seconds)
+    MATERIALIZED_REFRESH_INTERVAL: int = 900
+
+    # Proactive notifications (birthdays, event and task reminders)
+    NOTIFICATIONS_ENABLED: bool = False
+    NOTIFICATIONS_DB: str = "notifications.sqlite3"
+    NOTIFY_HOUR: int = 9
+    EVENT_REMINDER_MINUTES: int = 60
+    NOTIFY_GLOBAL_RATE: float = 20.0  # messages/s, below Telegram's ~30/s to leave room for replies
+    NOTIFY_CHAT_RATE: float = 1.0
+    NOTIFY_WORKERS: int = 8
+
     @property
     def ALLOWED_USER_IDS(self) -> Set[int]:
         """
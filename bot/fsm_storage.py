@@ -0,0 +1,364 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в записях) SQLite-хранилище удаляет просроченные состояния
+SQLITE_PURGE_EVERY = 500
+
+# Признак "поле не меняется" при обновлении записи SQLite-хранилища
+_KEEP = object()
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+def pack_data(data: Mapping[str, Any]) -> str:
+    """Компактный JSON без пробелов; пустые данные не хранятся вовсе."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def unpack_data(raw: Union[str, bytes, None]) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    return json.loads(raw)
+
+
+class LRUMemoryStorage(BaseStorage):
+    """
+    Хранилище FSM в памяти с ограничением по числу ключей и времени простоя.
+
+    В отличие от MemoryStorage не растет бесконечно: при превышении
+    max_keys вытесняются давно не использованные чаты, а состояния,
+    к которым не обращались дольше ttl секунд, считаются сброшенными.
+    """
+
+    def __init__(self, max_keys: int = 10000, ttl: float = 24 * 3600):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        # ключ -> (состояние, данные, время последнего обращения)
+        self._records: "OrderedDict[StorageKey, Tuple[Optional[str], Dict[str, Any], float]]" = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _get(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        record = self._records.get(key)
+        if record is None:
+            return None, {}
+        state, data, touched = record
+        now = time.monotonic()
+        if now - touched > self.ttl:
+            del self._records[key]
+            return None, {}
+        self._records[key] = (state, data, now)
+        self._records.move_to_end(key)
+        return state, data
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        if state is None and not data:
+            self._records.pop(key, None)
+            return
+        self._records[key] = (state, data, time.monotonic())
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_keys:
+            self._records.popitem(last=False)
+            self.evicted += 1
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = self._get(key)
+        self._put(key, _state_name(state), data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._get(key)[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        state, _ = self._get(key)
+        self._put(key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(self._get(key)[1])
+
+    async def close(self) -> None:
+        self._records.clear()
+
+
+class SqliteStorage(BaseStorage):
+    """
+    Хранилище FSM в файле SQLite: переживает перезапуск и доступно всем
+    процессам на одной машине (режим WAL).
+
+    Запросы выполняются в отдельном потоке (asyncio.to_thread): ожидание
+    блокировки файла другим процессом не останавливает event loop.
+    Чтение и запись при изменении состояния или данных идут одной
+    транзакцией под замком соединения.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL)"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _get(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        row = self._db().execute(
+            "SELECT state, data FROM fsm WHERE key = ? AND updated_at >= ?",
+            (self.key_builder.build(key), time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], unpack_data(row[1])
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Mapping[str, Any]) -> None:
+        db = self._db()
+        db_key = self.key_builder.build(key)
+        if state is None and not data:
+            db.execute("DELETE FROM fsm WHERE key = ?", (db_key,))
+            return
+        db.execute(
+            "INSERT OR REPLACE INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+            (db_key, state, pack_data(data) if data else None, time.time()),
+        )
+        self._writes += 1
+        if self._writes % SQLITE_PURGE_EVERY == 0:
+            db.execute("DELETE FROM fsm WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def _read(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        with self._lock:
+            return self._get(key)
+
+    def _update(self, key: StorageKey, state: Any = _KEEP, data: Any = _KEEP) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                current_state, current_data = self._get(key)
+                self._put(
+                    key,
+                    current_state if state is _KEEP else state,
+                    current_data if data is _KEEP else data,
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await asyncio.to_thread(self._update, key, state=_state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await asyncio.to_thread(self._read, key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await asyncio.to_thread(self._update, key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await asyncio.to_thread(self._read, key))[1]
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер Redis (ответ вида -ERR ...)."""
+
+
+class RespClient:
+    """
+    Минимальный асинхронный клиент протокола Redis (RESP2).
+
+    Поддерживает только то, что нужно хранилищу FSM: одно соединение,
+    команды выполняются по очереди под замком, при обрыве соединение
+    открывается заново при следующей команде. Если команда прервана
+    посередине (отмена задачи, таймаут), соединение тоже закрывается: иначе
+    непрочитанный ответ достался бы следующей команде.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=self.timeout
+        )
+        try:
+            if self.password:
+                await self._call("AUTH", self.password)
+            if self.db:
+                await self._call("SELECT", self.db)
+        except BaseException:
+            # Не оставляем соединение без AUTH/SELECT: следующая команда открыла бы его заново
+            self._drop()
+            raise
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Соединение с Redis закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            return (await self._reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(payload)
+            if size < 0:
+                return None
+            return [await self._read_reply() for _ in range(size)]
+        raise ConnectionError(f"Непонятный ответ Redis: {line!r}")
+
+    async def _call(self, *args: Any) -> Any:
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), timeout=self.timeout)
+
+    async def execute(self, *args: Any) -> Any:
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._call(*args)
+                except RespError:
+                    raise  # ответ сервера прочитан целиком, соединение в порядке
+                except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    await self._reset()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # Отмена между отправкой команды и чтением ответа: ответ остался в сокете
+                    self._drop()
+                    raise
+
+    def _drop(self) -> None:
+        """Закрывает соединение без ожидания (можно вызывать и при отмене задачи)."""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _reset(self) -> None:
+        writer = self._writer
+        self._drop()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._reset()
+
+
+class RedisStorage(BaseStorage):
+    """
+    Хранилище FSM в Redis (или совместимом сервере) через RespClient.
+
+    Состояние и данные лежат в отдельных ключах с истечением ttl — простаивающие
+    чаты удаляет сам сервер. Подходит для нескольких инстансов бота.
+    """
+
+    def __init__(self, client: RespClient, ttl: float = 24 * 3600, key_builder: Optional[KeyBuilder] = None):
+        self.client = client
+        self.ttl = int(ttl)
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def _write(self, key: str, value: Optional[str]) -> None:
+        if value is None:
+            await self.client.execute("DEL", key)
+        else:
+            await self.client.execute("SET", key, value, "EX", self.ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(self.key_builder.build(key, "state"), _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.client.execute("GET", self.key_builder.build(key, "state"))
+        return value.decode() if value is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(self.key_builder.build(key, "data"), pack_data(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return unpack_data(await self.client.execute("GET", self.key_builder.build(key, "data")))
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Хранилище FSM по настройке FSM_STORAGE: "lru" (по умолчанию), "memory"
+    (MemoryStorage aiogram без ограничений), "sqlite" или "redis".
+    """
+    kind = app_settings.FSM_STORAGE.lower()
+    if kind == "sqlite":
+        logger.info(f"FSM: SQLite {app_settings.FSM_SQLITE_PATH}")
+        return SqliteStorage(app_settings.FSM_SQLITE_PATH, ttl=app_settings.FSM_TTL)
+    if kind == "redis":
+        logger.info(f"FSM: Redis {urlparse(app_settings.FSM_REDIS_URL).hostname}")
+        return RedisStorage(RespClient(app_settings.FSM_REDIS_URL), ttl=app_settings.FSM_TTL)
+    if kind == "memory":
+        return MemoryStorage()
+    if kind != "lru":
+        logger.warning(f"Неизвестный FSM_STORAGE '{app_settings.FSM_STORAGE}', используется lru")
+    return LRUMemoryStorage(max_keys=app_settings.FSM_MAX_KEYS, ttl=app_settings.FSM_TTL)
@@ -1,18 +1,36 @@
-from aiogram import Router, F
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Router
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 import json
-from datetime import datetime, timedelta
-import dashscope
+from datetime import date
 from bot.config import app_settings
+from bot.utils.database import run_query
+from bot.utils.outbound import answer
+from bot.utils.sql_templates import (
+    TemplateCache, UnsafeQueryError, describe_templates, enforce_limit, ensure_read_only,
+    parse_template_choice, render_template,
+)
+
+try:
+    import dashscope
+except ImportError:  # text-to-SQL необязателен: без dashscope /query отвечает, что недоступен
+    dashscope = None
 
 router = Router(name="ai_db_query")
+logger = logging.getLogger(__name__)
+
+# Вопрос (нормализованный) -> шаблон и параметры: повторные вопросы не требуют вызова модели
+template_cache = TemplateCache()
 
 
 async def get_table_schema():
     return """
     Table: employees
-    Columns: id, full_name, department, position, email, birthday, projects, skills, telegram_id
+    Columns: id, name, job_title, department, phone_number, hire_date, education, email, birthday, projects, skills, telegram_id
     
     Table: events
     Columns: id, title, description, date, time, location, organizer_id, participants, type
@@ -22,20 +40,14 @@ async def get_table_schema():
     """
 
 
-async def generate_sql_query(user_query: str, schema: str) -> str:
-    if not app_settings.DASHSCOPE_API_KEY:
+async def _call_model(prompt: str) -> Optional[str]:
+    """Неблокирующий вызов модели: синхронный клиент dashscope уходит в отдельный поток."""
+    if dashscope is None or not app_settings.DASHSCOPE_API_KEY:
         return None
 
-    prompt = f"""
-    Given the following database schema:
-    {schema}
-    
-    Generate a SQL query to answer this question: "{user_query}"
-    Return ONLY the SQL query, nothing else.
-    """
-
     try:
-        response = dashscope.Generation.call(
+        response = await asyncio.to_thread(
+            dashscope.Generation.call,
             model='qwen-max',
             prompt=prompt,
             api_key=app_settings.DASHSCOPE_API_KEY,
@@ -43,51 +55,118 @@ async def generate_sql_query(user_query: str, schema: str) -> str:
             max_tokens=500,
             temperature=0.1
         )
-        
+
         if response.status_code == 200:
             return response.output.choices[0].message.content.strip()
         return None
     except Exception as e:
-        print(f"Error generating SQL query: {e}")
+        logger.error(f"Error calling text-to-SQL model: {e}")
         return None
 
 
+async def choose_template(user_query: str) -> Optional[tuple]:
+    """Выбирает шаблон и параметры: из кеша (за сегодня) или одним вызовом модели."""
+    today = date.today()
+    cached = await template_cache.get(user_query, today)
+    if cached:
+        logger.info(f"Шаблон для вопроса взят из кеша: {cached[0]}")
+        return cached
+
+    prompt = f"""
+    Choose the query template that answers the question and fill its parameters.
+    Today is {today:%d.%m.%Y}. Dates must be in dd.mm.yyyy format.
+
+    Templates:
+    {describe_templates()}
+
+    Question: "{user_query}"
+    Return ONLY JSON: {{"template": "<name>", "params": {{...}}}}
+    or {{"template": null}} if no template fits.
+    """
+    raw = await _call_model(prompt)
+    choice = parse_template_choice(raw) if raw else None
+    if choice:
+        await template_cache.set(user_query, *choice, today=today)
+    return choice
+
+
+async def generate_sql_query(user_query: str, schema: str) -> Optional[str]:
+    prompt = f"""
+    Given the following database schema:
+    {schema}
+    
+    Generate a SQL query to answer this question: "{user_query}"
+    Return ONLY the SQL query, nothing else.
+    """
+    return await _call_model(prompt)
+
+
+async def build_sql(user_query: str) -> Optional[str]:
+    """
+    Строит безопасный SQL для вопроса: сначала по библиотеке шаблонов,
+    затем (если шаблон не подошел) свободной генерацией с проверкой
+    "только чтение". В любом случае результат ограничен MAX_QUERY_RESULTS строк.
+    """
+    choice = await choose_template(user_query)
+    sql = None
+    if choice:
+        name, params = choice
+        try:
+            sql = render_template(name, params)
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Не удалось заполнить шаблон '{name}' параметрами {params}: {e}")
+
+    if sql is None:
+        schema = await get_table_schema()
+        generated = await generate_sql_query(user_query, schema)
+        if not generated:
+            return None
+        sql = ensure_read_only(generated)
+
+    return enforce_limit(sql, app_settings.MAX_QUERY_RESULTS)
+
+
 @router.message(Command("query"))
-async def handle_query_command(message: Message):
-    await message.answer(
-        "🤖 Отправьте мне вопрос о сотрудниках, мероприятиях или задачах, "
-        "и я попробую найти ответ в базе данных.\n\n"
-        "Например:\n"
-        "- Сколько сотрудников в отделе разработки?\n"
-        "- Какие мероприятия запланированы на этой неделе?\n"
-        "- Сколько открытых задач с высоким приоритетом?"
-    )
-
-
-@router.message(F.text)
-async def process_query(message: Message):
-    query = message.text
+async def handle_query_command(message: Message, command: CommandObject):
+    """/query <вопрос> — ответ прямым запросом к базе; обычный текст обрабатывает ai_intent_handler."""
+    if not command.args:
+        await answer(
+            message,
+            "🤖 Отправьте после /query вопрос о сотрудниках, мероприятиях или задачах, "
+            "и я попробую найти ответ в базе данных.\n\n"
+            "Например:\n"
+            "- /query Сколько сотрудников в отделе разработки?\n"
+            "- /query Какие мероприятия запланированы на этой неделе?\n"
+            "- /query Сколько открытых задач с высоким приоритетом?"
+        )
+        return
+    await process_query(message, command.args.strip())
+
+
+async def process_query(message: Message, query: str):
     bot = message.bot
 
     try:
-        # Получаем схему базы данных
-        schema = await get_table_schema()
-        
-        # Генерируем SQL запрос с помощью AI
-        sql_query = await generate_sql_query(query, schema)
+        # Генерируем SQL запрос: шаблон из библиотеки или проверенный свободный SQL
+        try:
+            sql_query = await build_sql(query)
+        except UnsafeQueryError as e:
+            logger.warning(f"Отклонен небезопасный SQL для вопроса '{query}': {e}")
+            await answer(message, "😔 Извините, не удалось построить безопасный запрос к базе данных.")
+            return
         
         if not sql_query:
-            await message.answer("😔 Извините, не удалось сгенерировать запрос к базе данных.")
+            await answer(message, "😔 Извините, не удалось сгенерировать запрос к базе данных.")
             return
 
         # Выполняем запрос через Supabase
-        result = await bot.supabase_client.rpc(
+        result = await run_query(bot.supabase_client.rpc(
             'execute_query',
             {'query': sql_query}
-        ).execute()
+        ))
 
         if not result.data:
-            await message.answer("🤔 По вашему запросу ничего не найдено.")
+            await answer(message, "🤔 По вашему запросу ничего не найдено.")
             return
 
         # Форматируем результат
@@ -95,12 +174,12 @@ async def process_query(message: Message):
         
         if isinstance(result.data, list):
             for item in result.data[:5]:  # Ограничиваем вывод
-                response.append("\n" + json.dumps(item, ensure_ascii=False, indent=2))
+                response.append("\n" + json.dumps(item, ensure_ascii=False, indent=2, default=str))
         else:
-            response.append("\n" + json.dumps(result.data, ensure_ascii=False, indent=2))
+            response.append("\n" + json.dumps(result.data, ensure_ascii=False, indent=2, default=str))
 
-        await message.answer("\n".join(response))
+        await answer(message, "\n".join(response))
 
     except Exception as e:
-        await message.answer("😔 Произошла ошибка при выполнении запроса. Попробуйте позже.")
-        print(f"Query error: {e}") 
\ No newline at end of file
+        await answer(message, "😔 Произошла ошибка при выполнении запроса. Попробуйте позже.")
+        logger.error(f"Query error: {e}")
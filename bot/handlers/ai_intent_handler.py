@@ -1,16 +1,25 @@
 # bot/handlers/ai_intent_handler.py
 import json
 import logging
+from datetime import date, datetime
 from typing import Dict, Callable, Awaitable, Optional
 
 from aiogram import Router, types, Bot, F
 from aiogram.filters import Command
 from pydantic import ValidationError
-from supabase import Client
 from bot.config import app_settings
 
-from bot.utils.database import execute_supabase_query
+from bot.utils.repository import Repository, get_repository
 from bot.utils.ai_request_models import AIRequest, AIRequestEntities
+from bot.utils.availability import AvailabilityService, DEFAULT_EVENT_MINUTES, day_window, parse_time, to_minutes
+from bot.utils.birthday_index import BirthdayService, format_birthdays
+from bot.utils.deadline import Deadline, DeadlineExceeded
+from bot.utils.lunch_matcher import LunchMatcherService
+from bot.utils.jobs import BUSY_MESSAGE, TIMEOUT_MESSAGE, Job, get_jobs
+from bot.utils.materialized import MaterializedAnswers
+from bot.utils.outbound import answer, get_outbound
+from bot.utils.periods import parse_date, resolve_period
+from bot.utils.relevance import RelevanceGate
 
 from ai_module.nlu import NLUProcessor, process_user_query
 from ai_module.response_generator import ResponseGenerator
@@ -18,29 +27,28 @@ from ai_module.response_generator import ResponseGenerator
 router = Router(name="ai_intent_handler")
 logger = logging.getLogger(__name__)
 
+# How many employees of a department to check at most
+AVAILABILITY_DEPARTMENT_LIMIT = 50
+# How many colleagues to suggest for lunch_game_invite
+LUNCH_MATCHES = 5
+
 # Initialize processors
 nlu_processor = NLUProcessor()
 
 
-async def handle_find_employee(entities: AIRequestEntities, supabase: Client) -> str:
+async def handle_find_employee(entities: AIRequestEntities, repository: Repository) -> str:
     logger.info(f"Processing intent: find_employee, Entities: {entities}")
-    filters = []
-
-    if entities.employee_name:
-        filters.append({'column': 'name', 'operator': 'ilike', 'value': f"%{entities.employee_name}%"})
-
-    if entities.department:
-        filters.append({'column': 'department_name', 'operator': 'ilike', 'value': f"%{entities.department}%"})
+    names = entities.values('employee_name')
+    departments = entities.values('department')
 
-    if not filters:
+    if not names and not departments:
         return "Please specify an employee name or department for search."
 
-    data, error = await execute_supabase_query(
-        supabase_client=supabase,
-        table_name="employees",
-        select_columns="name, job_title, phone_number, department_name",
-        filters=filters,
-        limit=5
+    data, error = await repository.find_employees(
+        names=names,
+        departments=departments,
+        columns=("id", "name", "job_title", "phone_number", "department"),
+        limit=5 * max(1, len(names))
     )
 
     if error:
@@ -51,65 +59,162 @@ async def handle_find_employee(entities: AIRequestEntities, supabase: Client) ->
 
     response = "Found employees:\n"
     for emp in data:
-        response += f"- {emp.get('name', 'N/A')} ({emp.get('job_title', 'N/A')}), Dept: {emp.get('department_name', 'N/A')}, Tel: {emp.get('phone_number', 'N/A')}\n"
+        response += f"- {emp.get('name', 'N/A')} ({emp.get('job_title', 'N/A')}), Dept: {emp.get('department', 'N/A')}, Tel: {emp.get('phone_number', 'N/A')}\n"
 
     return response
 
 
-async def handle_availability(entities: AIRequestEntities, supabase: Client) -> str:
+async def handle_availability(entities: AIRequestEntities, repository: Repository) -> str:
     logger.info(f"Processing intent: availability, Entities: {entities}")
-    filters = []
-    response_intro = "Checking availability"
-
-    if entities.employee_name:
-        filters.append({'column': 'name', 'operator': 'ilike', 'value': f"%{entities.employee_name}%"})
-        response_intro += f" for {entities.employee_name}"
-
-    if entities.department:
-        filters.append({'column': 'department_name', 'operator': 'ilike', 'value': f"%{entities.department}%"})
-        if not entities.employee_name:  # If name not specified, search by department
-            response_intro += f" in department {entities.department}"
-
-    if entities.date:
-        response_intro += f" on {entities.date}"
+    names = entities.values('employee_name')
+    departments = entities.values('department')
 
-    if not filters:
+    if not names and not departments:
         return "To check availability, please specify an employee or department."
 
-    data, error = await execute_supabase_query(
-        supabase_client=supabase,
-        table_name="employees",
-        select_columns="name, job_title",
-        filters=filters,
-        limit=5
+    # Window to check: a time slot on a date, a whole date range, or today by default
+    period = entities.values('period')
+    dates = [day for day in map(parse_date, entities.values('date')) if day]
+    interval = resolve_period(period[0]) if period else None
+    if interval is None:
+        interval = (min(dates), max(dates)) if dates else (date.today(), date.today())
+    start_day, end_day = interval
+    slot = parse_time(entities.values('time')[0]) if entities.values('time') else None
+    if slot and start_day == end_day:
+        start = to_minutes(datetime.combine(start_day, datetime.min.time()).replace(hour=slot[0], minute=slot[1]))
+        window = (start, start + DEFAULT_EVENT_MINUTES)
+        window_text = f"on {start_day:%d.%m.%Y} at {slot[0]:02d}:{slot[1]:02d}"
+    else:
+        window = day_window(start_day, end_day)
+        window_text = f"on {start_day:%d.%m.%Y}" if start_day == end_day else \
+            f"from {start_day:%d.%m.%Y} to {end_day:%d.%m.%Y}"
+
+    data, error = await repository.find_employees(
+        names=names,
+        departments=departments,
+        columns=("id", "name", "job_title"),
+        limit=5 * max(1, len(names)) if names else AVAILABILITY_DEPARTMENT_LIMIT
     )
-
     if error:
         return f"Error: {error}"
-
     if not data:
-        return f"{response_intro}: No employees found."
+        return "No employees found to check availability."
+
+    index = await AvailabilityService.for_repository(repository).index()
+    if index is None:
+        return "Error: could not load the events calendar."
 
-    response = f"{response_intro}:\n"
+    response = f"Availability {window_text}:\n"
     for emp in data:
-        availability_status = "presumably available (actual verification needed)"
-        response += f"- {emp.get('name', 'N/A')}: {availability_status}\n"
+        events = index.busy(emp["id"], *window)
+        if events:
+            busy_with = ", ".join(
+                f"{event.get('title', 'event')}" + (f" ({event['time']})" if event.get('time') else "")
+                for event in events
+            )
+            response += f"- {emp.get('name', 'N/A')}: busy — {busy_with}\n"
+        else:
+            response += f"- {emp.get('name', 'N/A')}: free\n"
+        deadlines = index.deadlines(emp["id"], *window)
+        if deadlines:
+            response += f"  deadlines: {', '.join(task.get('title', 'task') for task in deadlines)}\n"
 
-    if not entities.date:
-        response += "\n(Date not specified, cannot check availability for a specific day)"
+    return response
 
+
+async def handle_count_info(entities: AIRequestEntities, repository: Repository) -> str:
+    logger.info(f"Processing intent: count_info, Entities: {entities}")
+    result = await repository.aggregate(entities.model_dump(exclude_none=True))
+
+    if result["error"]:
+        return f"Error: {result['error']}"
+
+    if "groups" in result:
+        groups = result["groups"] or {}
+        if not groups:
+            return f"No {result['target']} found matching your request."
+        response = f"Number of {result['target']} by {result['group_by']}:\n"
+        for value, count in sorted(groups.items(), key=lambda item: item[1], reverse=True):
+            response += f"- {value or 'N/A'}: {count}\n"
+        return response
+
+    return f"Number of {result['target']} matching your request: {result['count']}"
+
+
+async def handle_birthday_info(entities: AIRequestEntities, repository: Repository) -> str:
+    logger.info(f"Processing intent: birthday_info, Entities: {entities}")
+    birthdays = BirthdayService.for_repository(repository)
+
+    period = entities.values("period")
+    dates = [day for day in map(parse_date, entities.values("date")) if day]
+    if period:
+        interval = resolve_period(period[0])
+        if interval is None:
+            return f"Sorry, I couldn't understand the period '{period[0]}'."
+    elif dates:
+        interval = (min(dates), max(dates))
+    else:
+        # Without a period the precomputed daily digest answers the question
+        return await birthdays.daily_digest()
+
+    start, end = interval
+    title = f"{start:%d.%m.%Y}" if start == end else f"{start:%d.%m.%Y} — {end:%d.%m.%Y}"
+    return format_birthdays(await birthdays.between(start, end), title)
+
+
+async def handle_lunch_game_invite(entities: AIRequestEntities, repository: Repository) -> str:
+    logger.info(f"Processing intent: lunch_game_invite, Entities: {entities}")
+    interests = entities.values('interest') + entities.values('project')
+    names = entities.values('employee_name')
+
+    if not interests and not names:
+        return "Tell me an interest (e.g. 'board games') or a colleague's name to find matching colleagues."
+
+    matcher = await LunchMatcherService.for_repository(repository).get()
+    if matcher is None:
+        return "Error: could not load employee profiles."
+
+    if interests:
+        intro = f"Colleagues interested in {', '.join(interests)}"
+        matches = matcher.by_interests(interests, k=LUNCH_MATCHES)
+        query_terms = None
+    else:
+        data, error = await repository.find_employees(names=names[:1], columns=("id", "name"), limit=1)
+        if error:
+            return f"Error: {error}"
+        if not data:
+            return f"No employee found with name {names[0]}."
+        intro = f"Colleagues with interests similar to {data[0].get('name', names[0])}"
+        matches = matcher.similar_to(data[0]["id"], k=LUNCH_MATCHES)
+        query_terms = matcher.profiles.get(data[0]["id"], ())
+
+    if not matches:
+        return f"{intro}: no matches found."
+
+    response = f"{intro}:\n"
+    for employee_id, score in matches:
+        employee = matcher.employees.get(employee_id, {})
+        line = f"- {employee.get('name', 'N/A')} ({employee.get('department') or 'N/A'})"
+        if query_terms:
+            shared = matcher.shared_terms(employee_id, query_terms)
+            if shared:
+                line += f", common: {', '.join(shared[:5])}"
+        response += line + f" — {score:.0%} match\n"
     return response
 
 
-async def handle_unknown_intent(entities: AIRequestEntities, supabase: Client) -> str:
+async def handle_unknown_intent(entities: AIRequestEntities, repository: Repository) -> str:
     logger.info(f"Processing unknown intent or general question. Entities: {entities}")
     return "Sorry, I don't quite understand your request or this is a general question. Please try rephrasing."
 
 
 # Map of intent types to their handler functions
-INTENT_HANDLERS: Dict[str, Callable[[AIRequestEntities, Client], Awaitable[str]]] = {
+INTENT_HANDLERS: Dict[str, Callable[[AIRequestEntities, Repository], Awaitable[str]]] = {
     "find_employee": handle_find_employee,
     "availability": handle_availability,
+    "count_info": handle_count_info,
+    "birthday_info": handle_birthday_info,
+    "lunch_game_invite": handle_lunch_game_invite,
     "unknown": handle_unknown_intent,
     "general_question": handle_unknown_intent,
 }
@@ -119,16 +224,15 @@ INTENT_HANDLERS: Dict[str, Callable[[AIRequestEntities, Client], Awaitable[str]]
 async def process_ai_request(message: types.Message, bot: Bot):
     logger.debug(f"Received message for AI processing: {message.text}")
 
-    if not hasattr(bot, 'supabase_client') or not bot.supabase_client:
-        logger.error("Supabase client not found in bot object.")
-        await message.answer("Error: Supabase client is not configured.")
+    repository = get_repository(bot)
+    if not repository:
+        logger.error("Repository not found in bot object.")
+        await answer(message, "Error: Supabase client is not configured.")
         return
 
-    supabase: Client = bot.supabase_client
-
     json_payload = message.text.partition(" ")[2].strip()
     if not json_payload:
-        await message.answer("Please provide a JSON request from AI after the command.")
+        await answer(message, "Please provide a JSON request from AI after the command.")
         return
 
     try:
@@ -136,63 +240,130 @@ async def process_ai_request(message: types.Message, bot: Bot):
         ai_request = AIRequest.model_validate(ai_data)
     except json.JSONDecodeError as e:
         logger.error(f"Error decoding JSON from AI: {e}")
-        await message.answer(f"Invalid JSON from AI: {e}")
+        await answer(message, f"Invalid JSON from AI: {e}")
         return
     except ValidationError as e:
         logger.error(f"Error validating data from AI: {e.errors()}")
-        await message.answer(f"Invalid data in JSON from AI: {e.errors()}")
+        await answer(message, f"Invalid data in JSON from AI: {e.errors()}")
         return
 
     handler_function = INTENT_HANDLERS.get(ai_request.intent, handle_unknown_intent)
 
     entities_to_pass = ai_request.entities if ai_request.entities else AIRequestEntities()
 
-    response_text = await handler_function(entities_to_pass, supabase)
+    response_text = await handler_function(entities_to_pass, repository)
+
+    await answer(message, response_text)
+
+
+@router.message(Command("answers_report"))
+async def answers_report(message: types.Message, bot: Bot):
+    repository = get_repository(bot)
+    if not repository:
+        await answer(message, "Error: Supabase client is not configured.")
+        return
+    await answer(message, MaterializedAnswers.for_repository(repository).report())
 
-    await message.answer(response_text)
+
+@router.message(Command("outbound_report"))
+async def outbound_report(message: types.Message, bot: Bot):
+    sender = get_outbound(bot)
+    if not sender:
+        await answer(message, "Outbound queue is not running.")
+        return
+    await answer(message, sender.report())
+
+
+@router.message(Command("relevance_report"))
+async def relevance_report(message: types.Message, relevance_gate: Optional[RelevanceGate] = None):
+    if not relevance_gate:
+        await answer(message, "Relevance gate is not configured.")
+        return
+    await answer(message, relevance_gate.report())
 
 
-@router.message(F.text & ~Command(commands=["start", "help", "nlu"]))
-async def handle_user_message(message: types.Message, bot: Bot):
+@router.message(F.text & ~Command(commands=["start", "help", "nlu", "query", "search"]))
+async def handle_user_message(message: types.Message, bot: Bot, query: Optional[str] = None,
+                              deadline: Optional[Deadline] = None):
     """
     Process user messages through the two-stage AI pipeline:
     1. NLU processing to extract intent and entities
     2. Response generation based on the extracted information and database data
+
+    In group chats RelevanceMiddleware has already dropped messages not addressed
+    to the bot; query is the text with the bot mention removed. deadline is the
+    response budget started by DeadlineMiddleware when the update arrived.
     """
-    if not hasattr(bot, 'supabase_client') or not bot.supabase_client:
+    text = query or message.text
+    repository = get_repository(bot)
+    if not repository:
         logger.error("Supabase client not configured")
-        await message.answer("Извините, возникла ошибка конфигурации. Обратитесь к администратору.")
+        await answer(message, "Извините, возникла ошибка конфигурации. Обратитесь к администратору.")
+        return
+
+    # Frequent questions are answered from precomputed results, skipping NLU and the database
+    materialized = await MaterializedAnswers.for_repository(repository).answer(text, message.from_user.id)
+    if materialized:
+        logger.info(f"Answered from materialized results: {text}")
+        await answer(message, materialized)
         return
 
+    # The two LLM calls run as a background job: the dispatcher is released immediately
+    jobs = get_jobs(bot)
+    job = Job(chat_id=message.chat.id, user_id=message.from_user.id, text=text, message_id=message.message_id,
+              deadline_at=deadline.wall_time() if deadline else None, bot_id=bot.id)
+    if jobs is None:
+        await answer(message, await run_ai_pipeline(repository, text, deadline))
+    elif not jobs.submit(job):
+        await answer(message, BUSY_MESSAGE)
+
+
+async def run_ai_pipeline(repository: Repository, text: str, deadline: Optional[Deadline] = None) -> str:
+    """
+    NLU (intent and entities) followed by response generation; returns the reply text.
+
+    Every stage takes its share of the deadline (DEFAULT_RESPONSE_TIMEOUT when none
+    is given); database queries inside it are capped by the remaining time.
+    """
+    deadline = deadline or Deadline(app_settings.DEFAULT_RESPONSE_TIMEOUT)
+    with deadline.scope():
+        return await _run_stages(repository, text, deadline)
+
+
+async def _run_stages(repository: Repository, text: str, deadline: Deadline) -> str:
     # Stage 1: NLU Processing
-    logger.info(f"Processing message: {message.text}")
-    nlu_result = await process_user_query(message.text)
-    
+    logger.info(f"Processing message: {text}")
+    try:
+        nlu_result = await process_user_query(text, deadline=deadline)
+    except DeadlineExceeded as e:
+        logger.warning(f"NLU did not finish in time: {e}")
+        return TIMEOUT_MESSAGE
+
     if not nlu_result:
-        await message.answer(
+        return (
             "Извините, я не смог правильно понять ваш запрос. "
             "Попробуйте сформулировать его иначе."
         )
-        return
 
     # Log NLU result
     logger.info(f"NLU Result: {json.dumps(nlu_result, ensure_ascii=False)}")
 
     # Stage 2: Response Generation
     try:
-        response_generator = ResponseGenerator(bot.supabase_client)
-        response = await response_generator.generate_response(nlu_result)
-        
+        response_generator = ResponseGenerator.for_repository(repository)
+        response = await response_generator.generate_response(nlu_result, deadline)
+
         if response:
-            await message.answer(response)
-        else:
-            await message.answer(
-                "Извините, произошла ошибка при обработке вашего запроса. "
-                "Попробуйте позже или обратитесь к администратору."
-            )
+            return response
+        if deadline.expired:
+            return TIMEOUT_MESSAGE
+        return (
+            "Извините, произошла ошибка при обработке вашего запроса. "
+            "Попробуйте позже или обратитесь к администратору."
+        )
     except Exception as e:
         logger.error(f"Error in response generation: {e}")
-        await message.answer(
+        return (
             "Извините, произошла ошибка при формировании ответа. "
             "Попробуйте позже или обратитесь к администратору."
         )
@@ -200,7 +371,7 @@ async def handle_user_message(message: types.Message, bot: Bot):
 
 async def create_event(message: types.Message, entities: dict):
     try:
-        result = await message.bot.supabase_client.table("events").insert({
+        _, error = await get_repository(message.bot).insert("events", {
             "title": entities["title"],
             "description": entities.get("description", ""),
             "date": entities["date"],
@@ -208,17 +379,19 @@ async def create_event(message: types.Message, entities: dict):
             "location": entities.get("location"),
             "organizer_id": message.from_user.id,
             "type": entities.get("type", "other")
-        }).execute()
-        
-        await message.answer("✅ Мероприятие успешно создано!")
+        })
+        if error:
+            raise RuntimeError(error)
+
+        await answer(message, "✅ Мероприятие успешно создано!")
     except Exception as e:
-        await message.answer("❌ Не удалось создать мероприятие. Попробуйте позже.")
+        await answer(message, "❌ Не удалось создать мероприятие. Попробуйте позже.")
         logger.error(f"Error creating event: {e}")
 
 
 async def create_task(message: types.Message, entities: dict):
     try:
-        result = await message.bot.supabase_client.table("tasks").insert({
+        _, error = await get_repository(message.bot).insert("tasks", {
             "title": entities["title"],
             "description": entities.get("description", ""),
             "assignee_id": message.from_user.id,  # По умолчанию назначаем на создателя
@@ -226,22 +399,26 @@ async def create_task(message: types.Message, entities: dict):
             "status": "pending",
             "priority": entities.get("priority", "medium"),
             "project": entities.get("project")
-        }).execute()
-        
-        await message.answer("✅ Задача успешно создана!")
+        })
+        if error:
+            raise RuntimeError(error)
+
+        await answer(message, "✅ Задача успешно создана!")
     except Exception as e:
-        await message.answer("❌ Не удалось создать задачу. Попробуйте позже.")
+        await answer(message, "❌ Не удалось создать задачу. Попробуйте позже.")
         logger.error(f"Error creating task: {e}")
 
 
 async def update_status(message: types.Message, entities: dict):
     try:
         table = entities["entity_type"] + "s"  # events или tasks
-        result = await message.bot.supabase_client.table(table).update({
-            "status": entities["new_status"]
-        }).eq("id", entities["entity_id"]).execute()
-        
-        await message.answer("✅ Статус успешно обновлен!")
+        _, error = await get_repository(message.bot).update(
+            table, {"status": entities["new_status"]}, entities["entity_id"]
+        )
+        if error:
+            raise RuntimeError(error)
+
+        await answer(message, "✅ Статус успешно обновлен!")
     except Exception as e:
-        await message.answer("❌ Не удалось обновить статус. Попробуйте позже.")
+        await answer(message, "❌ Не удалось обновить статус. Попробуйте позже.")
         logger.error(f"Error updating status: {e}")
\ No newline at end of file
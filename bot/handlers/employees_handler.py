@@ -1,63 +1,134 @@
 # bot/handlers/employees_handler.py
 import logging
+from typing import Optional, Tuple
+
 from aiogram import Router, types, Bot
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
-from supabase import Client
 
-from  bot.utils.database import execute_supabase_query
+from bot.config import app_settings
+from bot.Keyboards import EmployeesPageCallback, get_employees_page_keyboard
+from bot.utils.cache import TTLCache
+from bot.utils.outbound import answer
+from bot.utils.repository import Page, get_repository
 
 router = Router(name="employees_commands")
 logger = logging.getLogger(__name__)
 
-@router.message(Command("get_employees"))
-async def get_employees_command(message: Message, bot: Bot):
-    logger.info(f"Получена команда /get_employees от пользователя {message.from_user.id}")
-
-    if not hasattr(bot, 'supabase_client') or not bot.supabase_client:
-        logger.error("Клиент Supabase не найден в объекте бота.")
-        await message.answer("Извините, произошла ошибка на сервере. Не удалось подключиться к базе данных.")
-        return
+EMPLOYEE_PAGE_COLUMNS = ("name", "hire_date", "department", "phone_number", "job_title")
 
-    supabase: Client = bot.supabase_client
+# Недавно показанные страницы по чату: листание назад не требует запроса к базе
+page_cache: TTLCache[Page] = TTLCache(max_size=2048, ttl=app_settings.EMPLOYEES_PAGE_CACHE_TTL)
 
-    table_name = 'employees'
 
-    columns_to_select = "name, hire_date, department, phone_number, job_title"
-
-    logger.debug(f"Запрос данных из таблицы '{table_name}', колонки: '{columns_to_select}'")
-    employees_list, error = await execute_supabase_query(supabase, table_name, columns=columns_to_select)
-
-    if error:
-        logger.error(f"Ошибка при получении данных из Supabase: {error}")
-        await message.answer(f"Не удалось получить список сотрудников: {error}")
-        return
-
-    if not employees_list:
-        logger.info(f"Данные в таблице '{table_name}' не найдены.")
-        await message.answer(f"В таблице '{table_name}' нет данных или они не были загружены.")
-        return
-
-    logger.info(f"Получено {len(employees_list)} записей из таблицы '{table_name}'.")
-
-    response_text = f"👥 Список сотрудников (из таблицы '{table_name}'):\n\n"
-    for i, employee in enumerate(employees_list):
+def format_employees_page(page: Page) -> str:
+    response_text = "👥 Список сотрудников:\n\n"
+    for employee in page.rows:
         name = employee.get('name', 'N/A')
         hire_date = employee.get('hire_date', 'N/A')
         department = employee.get('department', 'N/A')
         phone = employee.get('phone_number', 'N/A')
         job_title = employee.get('job_title', 'N/A')
 
-        entry = f"{i + 1}. 🧑‍💼 ФИО: {name}\n" \
+        entry = f"{employee.get('id')}. 🧑‍💼 ФИО: {name}\n" \
                 f"   Отдел: {department}\n" \
                 f"   📞 Телефон: {phone}\n" \
                 f"   📅 Дата приема: {hire_date}\n" \
                 f"    Должность: {job_title}\n"
         response_text += entry + "\n"
+    return response_text
+
+
+async def load_employees_page(bot: Bot, chat_id: int, direction: Optional[str] = None,
+                              cursor: Optional[int] = None) -> Tuple[Optional[Page], Optional[str]]:
+    """
+    Возвращает страницу сотрудников из кеша чата или из базы.
+
+    Args:
+        bot: Экземпляр бота с репозиторием
+        chat_id: ID чата (ключ кеша)
+        direction: 'next' или 'prev' (None — первая страница)
+        cursor: id граничной записи текущей страницы
+
+    Returns:
+        Кортеж (страница, ошибка)
+    """
+    cache_key = (chat_id, direction, cursor)
+    page = page_cache.get(cache_key)
+    if page is not None:
+        logger.debug(f"Страница сотрудников {cache_key} взята из кеша")
+        return page, None
+
+    repository = get_repository(bot)
+    if not repository:
+        return None, "Не удалось подключиться к базе данных."
+
+    page, error = await repository.page(
+        "employees",
+        EMPLOYEE_PAGE_COLUMNS,
+        app_settings.EMPLOYEES_PAGE_SIZE,
+        after_id=cursor if direction == "next" else None,
+        before_id=cursor if direction == "prev" else None,
+    )
+    if error:
+        return None, error
+
+    page_cache.set(cache_key, page)
+    if page.rows:
+        page_cache.set((chat_id, "starts", page.first_id), page)
+        page_cache.set((chat_id, "ends", page.last_id), page)
+        # Страница, с которой пришли, становится соседней: обратный переход не требует запроса
+        if direction == "next":
+            previous = page_cache.get((chat_id, "ends", cursor))
+            if previous is not None:
+                page_cache.set((chat_id, "prev", page.first_id), previous)
+        elif direction == "prev":
+            following = page_cache.get((chat_id, "starts", cursor))
+            if following is not None:
+                page_cache.set((chat_id, "next", page.last_id), following)
+    return page, None
+
 
-        if len(response_text) > 3800:  # Оставляем запас
-            response_text += "... (данных слишком много, показана часть)"
-            logger.warning("Ответ слишком длинный, обрезаем.")
-            break
+@router.message(Command("get_employees"))
+async def get_employees_command(message: Message, bot: Bot):
+    logger.info(f"Получена команда /get_employees от пользователя {message.from_user.id}")
+
+    page, error = await load_employees_page(bot, message.chat.id)
+
+    if error:
+        logger.error(f"Ошибка при получении данных из Supabase: {error}")
+        await answer(message, f"Не удалось получить список сотрудников: {error}")
+        return
+
+    if not page.rows:
+        logger.info("Данные в таблице 'employees' не найдены.")
+        await answer(message, "В таблице 'employees' нет данных или они не были загружены.")
+        return
+
+    await answer(
+        message,
+        format_employees_page(page),
+        reply_markup=get_employees_page_keyboard(page.first_id, page.last_id, page.has_prev, page.has_next)
+    )
+
+
+@router.callback_query(EmployeesPageCallback.filter())
+async def employees_page_callback(callback: CallbackQuery, callback_data: EmployeesPageCallback, bot: Bot):
+    chat_id = callback.message.chat.id if callback.message else callback.from_user.id
+    page, error = await load_employees_page(bot, chat_id, callback_data.direction, callback_data.cursor)
+
+    if error:
+        logger.error(f"Ошибка при получении страницы сотрудников: {error}")
+        await callback.answer("Не удалось загрузить страницу", show_alert=True)
+        return
+
+    if not page.rows:
+        await callback.answer("Больше сотрудников нет")
+        return
 
-    await  message.answer(response_text)
\ No newline at end of file
+    if callback.message:
+        await callback.message.edit_text(
+            format_employees_page(page),
+            reply_markup=get_employees_page_keyboard(page.first_id, page.last_id, page.has_prev, page.has_next)
+        )
+    await callback.answer()
@@ -0,0 +1,87 @@
+# bot/handlers/export_handler.py
+import logging
+import time
+from datetime import datetime
+
+from aiogram import Router, Bot
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+
+from bot.utils.export import EXPORT_COLUMNS, EXPORT_FORMATS, SpooledInputFile, export_table, xlsx_available
+from bot.utils.outbound import answer
+from bot.utils.repository import get_repository
+
+router = Router(name="export")
+logger = logging.getLogger(__name__)
+
+# Как часто (в секундах) обновлять сообщение о ходе выгрузки
+PROGRESS_INTERVAL = 2.0
+
+EXPORT_HELP = (
+    "📤 Выгрузка данных в файл.\n\n"
+    "Использование: /export <таблица> [формат]\n"
+    "Таблицы: employees, events, tasks\n"
+    "Форматы: csv (по умолчанию), xlsx\n\n"
+    "Например: /export tasks xlsx"
+)
+
+
+@router.message(Command("export"))
+async def export_command(message: Message, command: CommandObject, bot: Bot):
+    logger.info(f"Получена команда /export от пользователя {message.from_user.id}: {command.args}")
+
+    args = (command.args or "").lower().split()
+    table = args[0] if args else "employees"
+    fmt = args[1] if len(args) > 1 else "csv"
+
+    if table not in EXPORT_COLUMNS or fmt not in EXPORT_FORMATS:
+        await answer(message, EXPORT_HELP)
+        return
+
+    if fmt == "xlsx" and not xlsx_available():
+        await answer(message, "Формат xlsx сейчас недоступен, используйте csv.")
+        return
+
+    repository = get_repository(bot)
+    if not repository:
+        logger.error("Репозиторий не найден в объекте бота.")
+        await answer(message, "Извините, произошла ошибка на сервере. Не удалось подключиться к базе данных.")
+        return
+
+    # Сообщение о прогрессе идет через очередь, как и остальные ответы; ждем его, чтобы потом редактировать
+    status = await answer(message, f"⏳ Выгружаю {table}...", wait=True)
+    last_update = time.monotonic()
+
+    async def report_progress(rows: int) -> None:
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = now
+        if status is None:
+            return
+        try:
+            await status.edit_text(f"⏳ Выгружаю {table}... {rows} строк")
+        except Exception as e:
+            logger.debug(f"Не удалось обновить сообщение о прогрессе: {e}")
+
+    try:
+        file, total = await export_table(repository, table, fmt, progress=report_progress)
+    except Exception as e:
+        logger.error(f"Ошибка экспорта таблицы '{table}': {e}", exc_info=True)
+        if status is not None:
+            await status.edit_text(f"😔 Не удалось выгрузить {table}: {e}")
+        else:
+            await answer(message, f"😔 Не удалось выгрузить {table}: {e}")
+        return
+
+    filename = f"{table}_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+    try:
+        await message.answer_document(
+            SpooledInputFile(file, filename=filename),
+            caption=f"📄 {table}: {total} строк"
+        )
+        if status is not None:
+            await status.delete()
+    finally:
+        file.close()
@@ -2,6 +2,7 @@ from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message
 from ..Keyboards import get_main_menu_keyboard, get_help_keyboard
+from ..utils.outbound import answer
 
 router = Router(name="Помощник")
 
@@ -27,9 +28,8 @@ async def help_command(message: Message):
         "я постараюсь понять ваш запрос и найти нужную информацию!"
     )
     
-    await message.answer(help_text)
+    await answer(message, help_text)
 
 @router.message(F.text == "ℹ️ Помощь")
 async def text_help_button(message: Message):
-    await message.answer(help_text)
-    reply_markup=get_help_keyboard()
\ No newline at end of file
+    await answer(message, help_text, reply_markup=get_help_keyboard())
\ No newline at end of file
@@ -9,6 +9,10 @@ from datetime import datetime
 
 # Предполагается, что process_user_query находится в ai_module/nlu.py
 from ai_module.nlu import process_user_query  # Импортируем функцию process_user_query
+from bot.utils.ai_request_models import entity_values
+from bot.utils.outbound import answer
+from bot.utils.query_planner import plan_query
+from bot.utils.repository import get_repository
 #from bot.keyboards.inline import *
 #from bot.utils.utils import *
 
@@ -80,27 +84,31 @@ async def find_employees(bot: Bot, query: Dict[str, Any]) -> List[Dict[str, Any]
         Список найденных сотрудников
     """
     try:
-        if not bot.supabase_client:
+        repository = get_repository(bot)
+        if not repository:
             logging.error("Supabase client not configured")
             return []
-            
-        supabase_query = bot.supabase_client.table('employees').select('*')
-        
-        # Поиск по имени
-        if query.get('entities', {}).get('employee_name'):
-            supabase_query = supabase_query.ilike('name', f"%{query['entities']['employee_name']}%")
-            
-        # Поиск по должности
-        if query.get('entities', {}).get('position'):
-            supabase_query = supabase_query.ilike('job_title', f"%{query['entities']['position']}%")
-            
-        # Поиск по отделу
-        if query.get('entities', {}).get('department'):
-            supabase_query = supabase_query.ilike('department', f"%{query['entities']['department']}%")
-            
-        response = supabase_query.execute()
-        return response.data if response.data else []
-        
+
+        entities = query.get('entities', {})
+        plan = plan_query(query.get('intent'), entities)
+        if plan is None or plan.table != 'employees' or plan.count_only:
+            # Нужен список, а не подсчет: без info_type="count" план не уходит в ветку count_only
+            plan = plan_query("find_employee", {**entities, 'info_type': None})
+
+        # В списке нужны имя и должность, даже если запрошен конкретный тип информации
+        # Несколько значений одной сущности объединяются в один фильтр (один запрос)
+        data, error = await repository.find_employees(
+            names=entity_values(entities, 'employee_name'),
+            positions=entity_values(entities, 'position'),
+            departments=entity_values(entities, 'department'),
+            columns=plan.with_columns('name', 'job_title').columns,
+            limit=plan.limit
+        )
+        if error:
+            logging.error(f"Error querying Supabase for employees: {error}")
+            return []
+        return data or []
+
     except Exception as e:
         logging.error(f"Error querying Supabase for employees: {e}")
         return []
@@ -113,7 +121,8 @@ async def nlu_command_handler(message: types.Message):
     """
     command_parts = message.text.split(maxsplit=1)
     if len(command_parts) < 2:
-        await message.answer(
+        await answer(
+            message,
             "Пожалуйста, укажите текст запроса после команды /nlu\n"
             "Например:\n"
             "- /nlu какое образование у Виктора Ивановича\n"
@@ -132,7 +141,7 @@ async def nlu_command_handler(message: types.Message):
             employees = await find_employees(message.bot, result)
             
             if not employees:
-                await message.answer("Извините, не удалось найти сотрудников по вашему запросу.")
+                await answer(message, "Извините, не удалось найти сотрудников по вашему запросу.")
                 return
                 
             # Формируем ответ в зависимости от интента и найденных сотрудников
@@ -142,7 +151,7 @@ async def nlu_command_handler(message: types.Message):
                 if len(employees) == 1:
                     # Если найден один сотрудник, показываем подробную информацию
                     response = format_employee_info(employees[0], info_type)
-                    await message.answer(response)
+                    await answer(message, response)
                 else:
                     # Если найдено несколько сотрудников, показываем список
                     response = "Найденные сотрудники:\n\n"
@@ -151,17 +160,19 @@ async def nlu_command_handler(message: types.Message):
                         if emp.get('job_title'):
                             response += f" - {emp['job_title']}"
                         response += "\n"
-                    await message.answer(response.strip())
+                    await answer(message, response.strip())
             
                 
         except Exception as e:
             logging.error(f"Error processing response: {e}")
-            await message.answer(
+            await answer(
+                message,
                 "Произошла ошибка при обработке ответа. "
                 "Попробуйте другой запрос или обратитесь к администратору."
             )
     else:
-        await message.answer(
+        await answer(
+            message,
             "Извините, не удалось обработать ваш запрос. "
             "Попробуйте сформулировать его иначе."
         )
\ No newline at end of file
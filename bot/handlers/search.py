@@ -1,88 +1,93 @@
-from aiogram import Router, F
+import logging
+
+from aiogram import Router
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 
-from bot.models import Employee, Event, Task
-from datetime import datetime
+from bot.utils.outbound import answer
+from bot.utils.repository import get_repository
+from bot.utils.row_store import RowView
 
 router = Router(name="search")
+logger = logging.getLogger(__name__)
 
 
 @router.message(Command("search"))
-async def search_command(message: Message):
-    await message.answer(
-        "🔍 Отправьте мне поисковый запрос в свободной форме.\n"
-        "Например:\n"
-        "- Кто работает в отделе разработки?\n"
-        "- Какие мероприятия запланированы на следующей неделе?\n"
-        "- Найти задачи с высоким приоритетом"
-    )
-
-
-@router.message(F.text)
-async def process_search_query(message: Message):
-    query = message.text.lower()
-    bot = message.bot
-    
+async def search_command(message: Message, command: CommandObject):
+    """/search <текст> — поиск подстроки по сотрудникам, мероприятиям и задачам."""
+    if not command.args:
+        await answer(
+            message,
+            "🔍 Отправьте после /search поисковый запрос.\n"
+            "Например:\n"
+            "- /search разработки\n"
+            "- /search корпоратив\n"
+            "- /search отчет"
+        )
+        return
+    await process_search_query(message, command.args.strip().lower())
+
+
+async def process_search_query(message: Message, query: str):
+    repository = get_repository(message.bot)
+    if not repository:
+        logger.error("Supabase client not configured")
+        await answer(message, "Извините, возникла ошибка конфигурации. Обратитесь к администратору.")
+        return
+
     try:
-        # Поиск сотрудников
-        employees = await bot.supabase_client.table("employees").select("*").execute()
-        
-        # Поиск мероприятий
-        events = await bot.supabase_client.table("events").select("*").execute()
-        
-        # Поиск задач
-        tasks = await bot.supabase_client.table("tasks").select("*").execute()
-
-        # Преобразование результатов в модели
-        employees_data = [Employee(**emp) for emp in employees.data]
-        events_data = [Event(**event) for event in events.data]
-        tasks_data = [Task(**task) for task in tasks.data]
+        # Колоночные хранилища таблиц (без валидации каждой строки в модели), кешируются репозиторием
+        stores = {}
+        for table in ("employees", "events", "tasks"):
+            stores[table] = await repository.load_store(table)
+            if stores[table] is None:
+                raise RuntimeError(f"Не удалось загрузить таблицу '{table}'")
+
+        def contains(row: RowView, *columns: str) -> bool:
+            for column in columns:
+                value = row.get(column)
+                if isinstance(value, str) and query in value.lower():
+                    return True
+            return False
 
         # Фильтрация результатов на основе запроса
-        found_employees = [
-            emp for emp in employees_data
-            if query in emp.full_name.lower() or
-            query in emp.department.lower() or
-            any(query in proj.lower() for proj in emp.projects)
-        ]
-
-        found_events = [
-            event for event in events_data
-            if query in event.title.lower() or
-            query in event.description.lower()
-        ]
-
-        found_tasks = [
-            task for task in tasks_data
-            if query in task.title.lower() or
-            query in task.description.lower()
-        ]
+        found_employees = stores["employees"].view().filter(
+            lambda emp: contains(emp, "name", "department") or
+            any(query in proj.lower() for proj in emp.get("projects") or [])
+        )
+
+        found_events = stores["events"].view().filter(
+            lambda event: contains(event, "title", "description")
+        )
+
+        found_tasks = stores["tasks"].view().filter(
+            lambda task: contains(task, "title", "description")
+        )
 
         # Формирование ответа
         response = []
-        
+
         if found_employees:
             response.append("👥 Найденные сотрудники:")
             for emp in found_employees[:5]:  # Ограничиваем вывод
-                response.append(f"- {emp.full_name} ({emp.department})")
-        
+                response.append(f"- {emp.get('name')} ({emp.get('department')})")
+
         if found_events:
             response.append("\n📅 Найденные мероприятия:")
             for event in found_events[:5]:
-                response.append(f"- {event.title} ({event.date})")
-        
+                response.append(f"- {event.get('title')} ({event.get('date')})")
+
         if found_tasks:
             response.append("\n📋 Найденные задачи:")
             for task in found_tasks[:5]:
-                response.append(f"- {task.title} ({task.status})")
+                response.append(f"- {task.get('title')} ({task.get('status')})")
 
         if not response:
-            await message.answer("🤔 По вашему запросу ничего не найдено.")
+            await answer(message, "🤔 По вашему запросу ничего не найдено.")
             return
 
-        await message.answer("\n".join(response))
+        await answer(message, "\n".join(response))
 
     except Exception as e:
-        await message.answer("😔 Произошла ошибка при поиске. Попробуйте позже.")
-        print(f"Search error: {e}")
+        await answer(message, "😔 Произошла ошибка при поиске. Попробуйте позже.")
+        logger.error(f"Search error: {e}", exc_info=True)
@@ -1,6 +1,7 @@
 from aiogram import Router
 from aiogram.types import Message
 from aiogram.filters import Command
+from bot.utils.outbound import answer
 
 router = Router(name="start")
 
@@ -19,4 +20,4 @@ async def start_command(message: Message):
         "✨ Вы можете написать мне свой вопрос, и я постараюсь помочь!"
     )
     
-    await message.answer(welcome_text)
\ No newline at end of file
+    await answer(message, welcome_text)
\ No newline at end of file
@@ -4,6 +4,9 @@ from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, User, TelegramObject
 
+from bot.tenants import get_profile
+from bot.utils.outbound import answer
+
 class AuthMiddleware(BaseMiddleware):
     def __init__(self, allowed_ids: set[int]):
         super().__init__()
@@ -31,7 +34,10 @@ class AuthMiddleware(BaseMiddleware):
             logging.error("Не удалось получить информацию о пользователе из события")
             return None
 
-        if not self.allowed_ids or user.id in self.allowed_ids:
+        # У бота с профилем (несколько ботов в процессе) свой список разрешенных ID
+        profile = get_profile(data.get('bot'))
+        allowed_ids = profile.allowed_user_ids if profile is not None else self.allowed_ids
+        if not allowed_ids or user.id in allowed_ids:
             return await handler(event, data)
 
         # User is not authorized
@@ -40,11 +46,11 @@ class AuthMiddleware(BaseMiddleware):
 
         try:
             if isinstance(event, Message):
-                await event.answer(unauthorized_message)
+                await answer(event, unauthorized_message)
             elif isinstance(event, CallbackQuery):
                 await event.answer(unauthorized_message, show_alert=True)
                 if event.message:
-                    await event.message.answer(unauthorized_message)
+                    await answer(event.message, unauthorized_message)
         except Exception as e:
             logging.error(f"Ошибка отправки сообщения неавторизованному пользователю {user.id}: {e}")
 
@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.utils.deadline import Deadline
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    """
+    Заводит срок ответа на апдейт (DEFAULT_RESPONSE_TIMEOUT) в момент его получения.
+
+    Регистрируется первым внешним middleware на update, поэтому в бюджет
+    входит и время в остальных middleware. Обработчики получают срок как
+    deadline и передают его по конвейеру.
+    """
+
+    def __init__(self, budget: float):
+        super().__init__()
+        self.budget = budget
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        data["deadline"] = Deadline(self.budget)
+        return await handler(event, data)
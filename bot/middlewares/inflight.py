@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class InflightMiddleware(BaseMiddleware):
+    """
+    Считает апдейты, которые сейчас обрабатываются.
+
+    Нужен для плавной остановки: после того как сервер перестал принимать
+    новые апдейты, wait_idle() дожидается завершения уже начатых.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.inflight = 0
+        self.processed = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        self.inflight += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.inflight -= 1
+            self.processed += 1
+            if not self.inflight:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """True, если все апдейты обработаны за timeout секунд."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
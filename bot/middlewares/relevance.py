@@ -0,0 +1,35 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from bot.utils.relevance import RelevanceGate
+
+
+class RelevanceMiddleware(BaseMiddleware):
+    """
+    Отсекает сообщения групп, адресованные не боту, до любой AI-обработки.
+
+    Регистрируется внешним middleware на message раньше ThrottlingMiddleware:
+    болтовня в группе не расходует лимит пользователя и не отменяет его
+    запрос. Команды и сообщения без текста проходят как есть. Очищенный
+    от упоминания бота текст передается обработчикам как query.
+    """
+
+    def __init__(self, gate: RelevanceGate):
+        super().__init__()
+        self.gate = gate
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message) or not event.text or event.text.startswith("/"):
+            return await handler(event, data)
+        query = await self.gate.check(event, data["bot"])
+        if query is None:
+            return None
+        data["query"] = query
+        return await handler(event, data)
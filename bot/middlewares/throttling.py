@@ -0,0 +1,100 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, User
+
+from bot.utils.outbound import answer
+from bot.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_MESSAGE = "⏳ Слишком много сообщений подряд. Подождите немного и повторите."
+
+
+class _UserState:
+    """Все, что middleware помнит о пользователе: постоянный размер, без истории сообщений."""
+
+    __slots__ = ("bucket", "last_hash", "last_at", "warned_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.last_hash = 0
+        self.last_at = 0.0
+        self.warned_until = 0.0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты сообщений пользователя (внешний middleware на message).
+
+    - такое же сообщение, повторенное в течение duplicate_window секунд
+      (двойное нажатие, повторная отправка), отбрасывается;
+    - сообщения сверх корзины токенов пользователя отбрасываются, а
+      предупреждение отправляется не чаще раза в минуту.
+
+    Отмену устаревшего запроса новым делает JobExecutor (supersede по
+    боту, чату и пользователю): обработчики здесь завершаются сразу,
+    поставив задание в очередь, и отменять на уровне middleware нечего.
+
+    Состояние хранится для max_users последних активных пользователей,
+    давно неактивные вытесняются.
+    """
+
+    def __init__(self, rate: float = 0.5, burst: float = 5, duplicate_window: float = 10.0,
+                 max_users: int = 10000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.max_users = max_users
+        self.stats: Dict[str, int] = {"passed": 0, "throttled": 0, "duplicates": 0}
+        self._users: "OrderedDict[int, _UserState]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _state(self, user_id: int) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(TokenBucket(self.rate, self.burst))
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if not isinstance(event, Message) or user is None:
+            return await handler(event, data)
+
+        state = self._state(user.id)
+        now = time.monotonic()
+        text = event.text or event.caption or ""
+        text_hash = hash((event.chat.id, " ".join(text.lower().split()))) if text else 0
+
+        if text_hash and text_hash == state.last_hash and now - state.last_at < self.duplicate_window:
+            self.stats["duplicates"] += 1
+            logger.info(f"Повторное сообщение пользователя {user.id} пропущено")
+            return None
+        state.last_hash = text_hash
+        state.last_at = now
+
+        if not state.bucket.try_acquire():
+            self.stats["throttled"] += 1
+            logger.info(f"Пользователь {user.id} превысил лимит сообщений")
+            if now >= state.warned_until:
+                state.warned_until = now + 60
+                await answer(event, THROTTLED_MESSAGE)
+            return None
+
+        self.stats["passed"] += 1
+        return await handler(event, data)
@@ -0,0 +1,337 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from bot.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Длинный поллинг: сколько секунд Telegram держит запрос getUpdates
+POLL_TIMEOUT = 30
+# Как часто (секунды) записывать смещение на диск
+OFFSET_SAVE_INTERVAL = 1.0
+BACKOFF = BackoffConfig(min_delay=1.0, max_delay=30.0, factor=1.5, jitter=0.1)
+
+
+class OffsetStore:
+    """
+    Смещение обработанных апдейтов по каждому боту в JSON-файле.
+
+    Запись атомарная (через временный файл), поэтому после падения в файле
+    либо старое, либо новое смещение. Один файл может быть общим для
+    нескольких ботов процесса: записи идут по очереди.
+
+    Рядом, в файле "<path>.<bot_id>.pending", хранятся сами апдейты, которые
+    уже подтверждены Telegram, но еще не обработаны: после перезапуска
+    Telegram их не вернет, и они обрабатываются из этого файла.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._offsets = {str(k): int(v) for k, v in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                logger.error(f"Не удалось прочитать смещение апдейтов из {path}: {e}")
+
+    def load(self, bot_id: int) -> Optional[int]:
+        return self._offsets.get(str(bot_id))
+
+    def _write(self, data: Dict[str, int]) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    async def save(self, bot_id: int, offset: int) -> None:
+        if self._offsets.get(str(bot_id)) == offset:
+            return
+        self._offsets[str(bot_id)] = offset
+        async with self._lock:
+            await asyncio.to_thread(self._write, dict(self._offsets))
+
+    def _pending_path(self, bot_id: int) -> str:
+        return f"{self.path}.{bot_id}.pending"
+
+    def load_pending(self, bot_id: int) -> List[Dict[str, Any]]:
+        path = self._pending_path(bot_id)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, encoding="utf-8") as f:
+                return list(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать необработанные апдейты из {path}: {e}")
+            return []
+
+    def _write_pending(self, path: str, updates: List[Dict[str, Any]]) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(updates, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    async def save_pending(self, bot_id: int, updates: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._write_pending, self._pending_path(bot_id), updates)
+
+
+def update_date(update: Update) -> Optional[datetime]:
+    """
+    Время события для проверки возраста: отправка сообщения или поста,
+    правка для отредактированных. Остальные апдейты (в том числе колбэки
+    кнопок под старыми сообщениями) возраста не имеют и не пропускаются.
+    """
+    if update.message is not None or update.channel_post is not None:
+        date = (update.message or update.channel_post).date
+    elif update.edited_message is not None or update.edited_channel_post is not None:
+        date = (update.edited_message or update.edited_channel_post).edit_date
+    else:
+        date = None
+    if isinstance(date, int):  # edit_date приходит как unix time
+        date = datetime.fromtimestamp(date, tz=timezone.utc)
+    return date if isinstance(date, datetime) else None
+
+
+def update_chat_key(update: Update) -> Hashable:
+    """Ключ упорядочивания: чат события, иначе пользователь, иначе сам апдейт."""
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        message = getattr(event, "message", None)
+        chat = getattr(message, "chat", None) if message is not None else None
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return ("user", user.id) if user is not None else ("update", update.update_id)
+
+
+class ChatSerializer:
+    """Внутри воркера апдейты одного чата обрабатываются по порядку, разных чатов — параллельно."""
+
+    def __init__(self):
+        self._tails: Dict[Any, asyncio.Task] = {}
+
+    def submit(self, key: Any, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        previous = self._tails.get(key)
+
+        async def run() -> None:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            try:
+                await factory()
+            except Exception as e:
+                logger.error(f"Ошибка обработки апдейта чата {key}: {e}", exc_info=True)
+
+        task = asyncio.create_task(run())
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._tails.get(key) is done and self._tails.pop(key, None))
+        return task
+
+    async def wait(self) -> None:
+        if self._tails:
+            await asyncio.gather(*self._tails.values(), return_exceptions=True)
+
+
+class DurablePolling:
+    """
+    Поллинг, который не теряет апдейты при перезапуске.
+
+    Telegram подтверждается все полученное (getUpdates со следующего
+    апдейта), поэтому один долгий апдейт не задерживает получение
+    остальных. В OffsetStore отдельно сохраняется водяной знак — первый
+    необработанный апдейт — и сами апдейты, которые еще в обработке; после
+    перезапуска они обрабатываются заново, затем бот забирает накопившиеся
+    апдейты. Обработка параллельная: не больше concurrency одновременно,
+    внутри одного чата — строго по порядку. Апдейты старше max_age секунд
+    пропускаются: отвечать на них поздно.
+
+    Запуск и остановка — start()/stop(); run_polling() управляет поллингом
+    одного или нескольких ботов с общим диспетчером.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, store: OffsetStore, concurrency: int = 32,
+                 max_age: float = 900, drain_timeout: float = 20.0):
+        self.dp = dp
+        self.bot = bot
+        self.store = store
+        self.max_age = max_age
+        self.drain_timeout = drain_timeout
+        self.max_inflight = concurrency * 4
+        self.stats: Dict[str, int] = {"processed": 0, "skipped_old": 0, "failed": 0}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._serializer = ChatSerializer()
+        self._inflight: Dict[int, Update] = {}
+        self._next_id: Optional[int] = None
+        self._progress = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def watermark(self) -> Optional[int]:
+        """Первый апдейт, который еще не обработан (все до него — обработаны); сохраняется на диск."""
+        if self._inflight:
+            return min(self._inflight)
+        return self._next_id
+
+    async def _process(self, update: Update) -> None:
+        try:
+            async with self._semaphore:
+                await self.dp.feed_update(self.bot, update)
+            self.stats["processed"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Ошибка обработки апдейта {update.update_id}: {e}", exc_info=True)
+        finally:
+            self._inflight.pop(update.update_id, None)
+            self._progress.set()
+
+    def _dispatch(self, updates: List[Update]) -> None:
+        """Запускает обработку новых апдейтов."""
+        now = time.time()
+        for update in updates:
+            if self._next_id is not None and update.update_id < self._next_id:
+                continue  # уже получен (например, восстановлен из файла и пришел снова)
+            self._next_id = update.update_id + 1
+            date = update_date(update)
+            if date is not None and now - date.timestamp() > self.max_age:
+                self.stats["skipped_old"] += 1
+                continue
+            self._inflight[update.update_id] = update
+            self._serializer.submit(update_chat_key(update), lambda update=update: self._process(update))
+
+    async def _saver(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=OFFSET_SAVE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            await self._save()
+
+    async def _save(self) -> None:
+        if self.watermark is not None:
+            pending = [
+                update.model_dump(mode="json", exclude_none=True, by_alias=True)
+                for update in list(self._inflight.values())
+            ]
+            try:
+                # Сначала апдейты, потом смещение: после падения между записями апдейт обработается дважды, но не потеряется
+                await self.store.save_pending(self.bot.id, pending)
+                await self.store.save(self.bot.id, self.watermark)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить смещение апдейтов: {e}")
+
+    async def _fetch(self, backoff: Backoff, allowed_updates: Optional[List[str]]) -> None:
+        started = time.monotonic()
+        catching_up = True
+        while not self._stopping.is_set():
+            # Не берем в работу больше max_inflight апдейтов: ждем, пока часть обработается
+            while len(self._inflight) >= self.max_inflight:
+                self._progress.clear()
+                await self._progress.wait()
+            timeout = 0 if catching_up else POLL_TIMEOUT
+            try:
+                # Подтверждаем все полученное: долгие апдейты ждут в _inflight и в файле store, а не в Telegram
+                updates = await self.bot(
+                    GetUpdates(offset=self._next_id, timeout=timeout, allowed_updates=allowed_updates),
+                    request_timeout=timeout + 30,
+                )
+            except Exception as e:
+                logger.error(f"Ошибка получения апдейтов: {type(e).__name__}: {e}")
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            self._dispatch(updates)
+            if catching_up and not updates:
+                catching_up = False
+                logger.info(
+                    f"Накопившиеся апдейты обработаны за {time.monotonic() - started:.1f} с: "
+                    f"{self.stats['processed']}, пропущено устаревших {self.stats['skipped_old']}"
+                )
+
+    async def start(self, allowed_updates: Optional[List[str]] = None) -> None:
+        """
+        Продолжает поллинг с сохраненного смещения (вебхук снимается, апдейты не сбрасываются);
+        апдейты, не обработанные до остановки, обрабатываются первыми.
+        """
+        await self.bot.delete_webhook(drop_pending_updates=False)
+        self._next_id = self.store.load(self.bot.id)
+        pending = []
+        for raw in self.store.load_pending(self.bot.id):
+            try:
+                pending.append(Update.model_validate(raw, context={"bot": self.bot}))
+            except ValueError as e:
+                logger.error(f"Пропущен поврежденный сохраненный апдейт: {e}")
+        pending.sort(key=lambda update: update.update_id)
+        self._dispatch(pending)
+        logger.info(f"Старт поллинга бота {self.bot.id} со смещения {self._next_id}, из прошлого запуска: {len(pending)}")
+        self._tasks = [
+            asyncio.create_task(self._fetch(Backoff(BACKOFF), allowed_updates), name=f"polling-fetch-{self.bot.id}"),
+            asyncio.create_task(self._saver(), name=f"polling-offset-{self.bot.id}"),
+        ]
+
+    async def stop(self) -> None:
+        """Перестает забирать апдейты, дорабатывает начатые не дольше drain_timeout и сохраняет смещение."""
+        self._stopping.set()
+        if not self._tasks:
+            return
+        fetcher, saver = self._tasks
+        self._tasks = []
+        fetcher.cancel()
+        await asyncio.gather(fetcher, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self._serializer.wait(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не дождались обработки {len(self._inflight)} апдейтов; они придут снова после запуска")
+        await saver
+        await self._save()
+        logger.info(f"Поллинг бота {self.bot.id} остановлен: {self.stats}")
+
+
+async def run_polling(dp: Dispatcher, *bots: Bot, **kwargs: Any) -> None:
+    """
+    Поллинг ботов с общим диспетчером до SIGTERM/SIGINT.
+
+    У каждого бота свой DurablePolling (смещения хранятся в одном файле по
+    id бота), события startup/shutdown диспетчера вызываются один раз.
+    """
+    store = OffsetStore(app_settings.UPDATE_OFFSET_PATH)
+    pollers = [
+        DurablePolling(
+            dp, bot, store,
+            concurrency=app_settings.POLLING_CONCURRENCY,
+            max_age=app_settings.BACKLOG_MAX_AGE,
+        )
+        for bot in bots
+    ]
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    workflow_data = {"dispatcher": dp, "bots": list(bots), **dp.workflow_data, **kwargs}
+    workflow_data.pop("bot", None)
+    await dp.emit_startup(bot=bots[-1], **workflow_data)
+    allowed_updates = dp.resolve_used_update_types()
+    try:
+        for poller in pollers:
+            await poller.start(allowed_updates)
+        await stopping.wait()
+    finally:
+        await asyncio.gather(*(poller.stop() for poller in pollers))
+        await dp.emit_shutdown(bot=bots[-1], **workflow_data)
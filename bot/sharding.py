@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_errors
+import signal
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import GetUpdates
+
+from bot.config import app_settings
+from bot.polling import ChatSerializer, OffsetStore, update_date
+from bot.webhook import register_webhook, webhook_secret
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед перезапуском упавшего воркера (растет при повторных падениях)
+RESTART_BACKOFF = (1, 2, 5, 10, 30)
+# Размер очереди апдейтов одного воркера
+WORKER_QUEUE_SIZE = 1000
+# Сколько апдейтов супервизор держит в памяти для воркера, чья очередь полна;
+# сверх этого апдейты шарда отбрасываются
+WORKER_OVERFLOW_SIZE = 10000
+# Как долго (секунды) поток ждет места в очереди, прежде чем проверить остановку
+QUEUE_PUT_TIMEOUT = 1.0
+
+WorkerEntry = Callable[[int, Any], None]
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Чат апдейта (или пользователь, если чата нет) — ключ шардирования."""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post",
+                  "business_message", "my_chat_member", "chat_member", "chat_join_request"):
+        payload = update.get(field)
+        if payload and payload.get("chat"):
+            return payload["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        if message and message.get("chat"):
+            return message["chat"]["id"]
+        return callback.get("from", {}).get("id")
+    for payload in update.values():
+        if isinstance(payload, dict) and isinstance(payload.get("from"), dict):
+            return payload["from"]["id"]
+    return None
+
+
+def shard_for(update: Dict[str, Any], shards: int) -> int:
+    """Стабильный номер шарда: апдейты одного чата всегда попадают к одному воркеру."""
+    chat_id = update_chat_id(update)
+    key = chat_id if chat_id is not None else update.get("update_id", 0)
+    return zlib.crc32(str(key).encode()) % shards
+
+
+async def serve_shard(index: int, queue: Any, bot: Bot, dp: Dispatcher) -> None:
+    """
+    Цикл воркера: читает сырые апдейты из своей очереди и скармливает их диспетчеру.
+
+    Останавливается, получив None, после обработки уже принятых апдейтов.
+    """
+    serializer = ChatSerializer()
+    logger.info(f"Воркер {index} запущен")
+    while True:
+        update = await asyncio.to_thread(queue.get)
+        if update is None:
+            break
+        serializer.submit(update_chat_id(update), lambda update=update: dp.feed_raw_update(bot, update))
+    await serializer.wait()
+    logger.info(f"Воркер {index} остановлен")
+
+
+class Supervisor:
+    """
+    Запускает N процессов-воркеров и раздает им апдейты по хешу chat_id.
+
+    Сам супервизор не разбирает апдейты моделями aiogram — только маршрутизирует
+    JSON. Очереди принадлежат супервизору, поэтому упавший воркер
+    перезапускается и продолжает разбирать свою очередь; другие шарды
+    это не затрагивает.
+
+    route() не ждет места в очереди: апдейт попадает в буфер шарда, а
+    отдельная задача на каждый шард перекладывает буфер в очередь воркера.
+    Медленный или упавший воркер копит только свой буфер (до
+    WORKER_OVERFLOW_SIZE, дальше апдейты шарда отбрасываются) и не
+    задерживает остальные шарды. Буфер живет в памяти супервизора:
+    при его падении буферизованные апдейты теряются.
+    """
+
+    def __init__(self, workers: int, entry: WorkerEntry):
+        self.workers = workers
+        self.entry = entry
+        self._ctx = multiprocessing.get_context("spawn")
+        self.queues = [self._ctx.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._crashes = [0] * workers
+        self._stopping = False
+        self.routed = [0] * workers
+        self.dropped = [0] * workers
+        self._buffers: List[deque] = [deque() for _ in range(workers)]
+        self._wakeups = [asyncio.Event() for _ in range(workers)]
+        self._feeders: List[asyncio.Task] = []
+
+    def _spawn(self, index: int) -> None:
+        process = self._ctx.Process(target=self.entry, args=(index, self.queues[index]),
+                                    name=f"bot-worker-{index}", daemon=False)
+        process.start()
+        self.processes[index] = process
+        logger.info(f"Воркер {index} запущен (pid {process.pid})")
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self._spawn(index)
+        self._feeders = [
+            asyncio.create_task(self._feed(index), name=f"shard-feeder-{index}") for index in range(self.workers)
+        ]
+
+    def buffered(self) -> List[int]:
+        return [len(buffer) for buffer in self._buffers]
+
+    def route(self, update: Dict[str, Any]) -> None:
+        index = shard_for(update, self.workers)
+        buffer = self._buffers[index]
+        if len(buffer) >= WORKER_OVERFLOW_SIZE:
+            self.dropped[index] += 1
+            if self.dropped[index] % 100 == 1:
+                logger.warning(f"Воркер {index} не успевает: буфер полон, отброшено апдейтов {self.dropped[index]}")
+            return
+        buffer.append(update)
+        self._wakeups[index].set()
+        self.routed[index] += 1
+
+    def _put(self, index: int, item: Optional[Dict[str, Any]]) -> bool:
+        try:
+            self.queues[index].put(item, timeout=QUEUE_PUT_TIMEOUT)
+            return True
+        except queue_errors.Full:
+            return False
+
+    async def _feed(self, index: int) -> None:
+        """Перекладывает буфер шарда в очередь воркера; None в буфере — сигнал остановки."""
+        buffer, wakeup, queue = self._buffers[index], self._wakeups[index], self.queues[index]
+        while True:
+            if not buffer:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            item = buffer[0]
+            try:
+                queue.put_nowait(item)
+            except queue_errors.Full:
+                # Очередь полна — ждем места в потоке, не держа event loop и другие шарды
+                if not await asyncio.to_thread(self._put, index, item):
+                    continue
+            buffer.popleft()
+            if item is None:
+                return
+
+    async def monitor(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(self.processes):
+                if self._stopping or process is None or process.is_alive():
+                    continue
+                delay = RESTART_BACKOFF[min(self._crashes[index], len(RESTART_BACKOFF) - 1)]
+                self._crashes[index] += 1
+                logger.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск через {delay} с")
+                self.processes[index] = None
+                asyncio.get_running_loop().call_later(delay, self._respawn, index)
+
+    def _respawn(self, index: int) -> None:
+        if not self._stopping and self.processes[index] is None:
+            self._spawn(index)
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Отправляет воркерам сигнал остановки и ждет, пока они дообработают очереди."""
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        for index, buffer in enumerate(self._buffers):
+            buffer.append(None)
+            self._wakeups[index].set()
+        if self._feeders:
+            _, pending = await asyncio.wait(self._feeders, timeout=timeout)
+            for feeder in pending:
+                feeder.cancel()
+            if pending:
+                logger.warning(f"Не удалось передать воркерам буферизованные апдейты: {self.buffered()}")
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Воркер {index} не остановился за {timeout} с, принудительное завершение")
+                process.terminate()
+        logger.info(
+            f"Супервизор остановлен, маршрутизировано апдейтов по шардам: {self.routed}, отброшено: {self.dropped}"
+        )
+
+
+async def _poll(bot: Bot, supervisor: Supervisor, allowed_updates: Optional[List[str]]) -> None:
+    """
+    Поллинг супервизора; устаревшие апдейты (старше BACKLOG_MAX_AGE) не передаются.
+
+    Смещение подтверждается Telegram и сохраняется, как только апдейты
+    попали в буфер шарда в памяти супервизора (Supervisor.route), а не в
+    очередь воркера. Перезапуск супервизора продолжает с места остановки,
+    но при его падении еще не переданные воркерам апдейты из буферов
+    теряются: Telegram их уже не вернет. Держать смещение до передачи
+    нельзя — один остановившийся шард задержал бы получение апдейтов для всех.
+    """
+    store = OffsetStore(app_settings.UPDATE_OFFSET_PATH)
+    offset = store.load(bot.id)
+    while True:
+        try:
+            updates = await bot(GetUpdates(offset=offset, timeout=30, allowed_updates=allowed_updates))
+        except Exception as e:
+            logger.error(f"Ошибка получения апдейтов: {e}")
+            await asyncio.sleep(5)
+            continue
+        now = time.time()
+        for update in updates:
+            date = update_date(update)
+            if date is None or now - date.timestamp() <= app_settings.BACKLOG_MAX_AGE:
+                supervisor.route(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+            offset = update.update_id + 1
+        if updates:
+            await store.save(bot.id, offset)
+
+
+def _webhook_app(supervisor: Supervisor, secret: str) -> web.Application:
+    async def receive(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401, text="Unauthorized")
+        supervisor.route(await request.json())
+        return web.json_response({})
+
+    async def health(request: web.Request) -> web.Response:
+        alive = [process is not None and process.is_alive() for process in supervisor.processes]
+        return web.json_response(
+            {"workers": alive, "routed": supervisor.routed, "buffered": supervisor.buffered(),
+             "dropped": supervisor.dropped},
+            status=200 if any(alive) else 503,
+        )
+
+    app = web.Application()
+    app.router.add_post(app_settings.WEBHOOK_PATH, receive)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def run_supervisor(workers: int, entry: WorkerEntry, allowed_updates: Optional[List[str]] = None) -> None:
+    """
+    Запускает воркеры и принимает апдейты (поллингом или вебхуком, по DELIVERY_MODE)
+    до SIGTERM/SIGINT.
+
+    В режиме вебхука супервизор сам регистрирует его в Telegram (если
+    WEBHOOK_SET_ON_START) и снимает при остановке: апдейты копятся в
+    Telegram до следующего запуска.
+    """
+    # Без секрета не запускаем даже воркеры: вебхук без проверки принимал бы поддельные апдейты
+    secret = webhook_secret() if app_settings.DELIVERY_MODE == "webhook" else None
+    supervisor = Supervisor(workers, entry)
+    supervisor.start()
+    bot = Bot(token=app_settings.BOT_TOKEN.get_secret_value())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    runner = None
+    if secret is not None:
+        runner = web.AppRunner(_webhook_app(supervisor, secret), handle_signals=False)
+        await runner.setup()
+        await web.TCPSite(runner, app_settings.WEBHOOK_HOST, app_settings.WEBHOOK_PORT).start()
+        if app_settings.WEBHOOK_SET_ON_START:
+            await register_webhook(bot, secret, allowed_updates)
+        receiver = None
+        logger.info(f"Супервизор: {workers} воркеров, прием вебхуком на порту {app_settings.WEBHOOK_PORT}")
+    else:
+        await bot.delete_webhook(drop_pending_updates=False)
+        receiver = asyncio.create_task(_poll(bot, supervisor, allowed_updates))
+        logger.info(f"Супервизор: {workers} воркеров, прием поллингом")
+
+    monitor = asyncio.create_task(supervisor.monitor())
+    try:
+        await stop.wait()
+    finally:
+        if receiver:
+            receiver.cancel()
+        if runner:
+            if app_settings.WEBHOOK_SET_ON_START:
+                try:
+                    await bot.delete_webhook(drop_pending_updates=False)
+                except Exception as e:
+                    logger.error(f"Не удалось снять вебхук: {e}")
+            await runner.cleanup()
+        await supervisor.stop()
+        monitor.cancel()
+        await bot.session.close()
@@ -0,0 +1,79 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+from bot.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Имя основного бота (BOT_TOKEN); его файлы состояния не получают суффикса
+PRIMARY_BOT_NAME = "main"
+
+
+@dataclass
+class BotProfile:
+    """Бот одного подразделения: токен и собственные настройки поверх общих."""
+    name: str
+    token: str
+    allowed_user_ids: Set[int] = field(default_factory=set)  # пустое множество — без ограничений
+    notifications: bool = False
+
+    @property
+    def primary(self) -> bool:
+        return self.name == PRIMARY_BOT_NAME
+
+
+def load_bot_profiles() -> List[BotProfile]:
+    """
+    Основной бот (BOT_TOKEN, ALLOWED_USER_IDS) и дополнительные из BOTS_CONFIG_PATH.
+
+    Файл — JSON-список объектов {"name", "token", "allowed_user_ids",
+    "notifications"}. Без allowed_user_ids бот использует общий
+    ALLOWED_USER_IDS; уведомления по умолчанию рассылает только основной бот.
+
+    Raises:
+        ValueError: если файл некорректен или имена/токены повторяются
+    """
+    profiles = [BotProfile(
+        PRIMARY_BOT_NAME,
+        app_settings.BOT_TOKEN.get_secret_value(),
+        app_settings.ALLOWED_USER_IDS,
+        notifications=app_settings.NOTIFICATIONS_ENABLED,
+    )]
+    if not app_settings.BOTS_CONFIG_PATH:
+        return profiles
+
+    try:
+        with open(app_settings.BOTS_CONFIG_PATH, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries:
+            allowed = entry.get("allowed_user_ids")
+            profiles.append(BotProfile(
+                str(entry["name"]),
+                str(entry["token"]),
+                {int(uid) for uid in allowed} if allowed is not None else app_settings.ALLOWED_USER_IDS,
+                notifications=app_settings.NOTIFICATIONS_ENABLED and bool(entry.get("notifications", False)),
+            ))
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Некорректный файл ботов {app_settings.BOTS_CONFIG_PATH}: {e}") from e
+
+    names = [profile.name for profile in profiles]
+    tokens = [profile.token for profile in profiles]
+    if len(set(names)) != len(names) or len(set(tokens)) != len(tokens):
+        raise ValueError(f"Имена и токены ботов в {app_settings.BOTS_CONFIG_PATH} должны быть уникальны")
+    logger.info(f"Ботов в процессе: {len(profiles)} ({', '.join(names)})")
+    return profiles
+
+
+def get_profile(bot) -> Optional[BotProfile]:
+    """Возвращает профиль, привязанный к боту при запуске (bot.profile)."""
+    return getattr(bot, "profile", None)
+
+
+def profile_path(path: str, bot) -> str:
+    """Путь файла состояния бота: у дополнительных ботов — с суффиксом имени, чтобы не пересекаться."""
+    profile = get_profile(bot)
+    if profile is None or profile.primary:
+        return path
+    return f"{path}.{profile.name}"
@@ -0,0 +1,298 @@
+import logging
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from supabase import Client, PostgrestAPIResponse
+
+from bot.utils.ai_request_models import entity_values
+from bot.utils.database import apply_filters, count_supabase_rows, execute_supabase_query, run_query
+from bot.utils.fanout import multi_value_filter
+from bot.utils.row_store import RowStore, RowView
+
+logger = logging.getLogger(__name__)
+
+# Что можно посчитать и по каким полям группировать
+AGGREGATE_TARGETS = ("employees", "events", "tasks")
+GROUP_BY_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "employees": ("department", "job_title"),
+    "events": ("type", "location", "date"),
+    "tasks": ("status", "priority", "project"),
+}
+
+# Синонимы значений, которые NLU может вернуть на русском или в свободной форме
+STATUS_ALIASES: Dict[str, List[str]] = {
+    "open": ["pending", "in_progress"],
+    "открыт": ["pending", "in_progress"],
+    "в работе": ["in_progress"],
+    "in_progress": ["in_progress"],
+    "pending": ["pending"],
+    "ожида": ["pending"],
+    "completed": ["completed"],
+    "done": ["completed"],
+    "выполнен": ["completed"],
+    "закрыт": ["completed"],
+}
+PRIORITY_ALIASES: Dict[str, str] = {
+    "высок": "high",
+    "high": "high",
+    "средн": "medium",
+    "medium": "medium",
+    "низк": "low",
+    "low": "low",
+}
+GROUP_BY_ALIASES: Dict[str, str] = {
+    "position": "job_title",
+    "должност": "job_title",
+    "отдел": "department",
+    "статус": "status",
+    "приоритет": "priority",
+    "проект": "project",
+    "тип": "type",
+}
+
+# Сколько строк одной колонки допустимо выгрузить, если сервер не поддерживает агрегаты
+GROUP_FALLBACK_LIMIT = 10000
+
+# Постраничная выгрузка (Repository.iter_pages): (таблица, колонки, фильтры) -> страницы строк
+PageIterator = Callable[..., AsyncIterator[List[Dict[str, Any]]]]
+
+
+def _resolve_alias(value: str, aliases: Dict[str, Any]) -> Optional[Any]:
+    value = value.strip().lower()
+    for prefix, resolved in aliases.items():
+        if value.startswith(prefix):
+            return resolved
+    return None
+
+
+def resolve_target(entities: Dict[str, Any]) -> str:
+    """Определяет, какую таблицу считать, по сущностям запроса."""
+    target = str(entities.get("target") or "").lower()
+    for table in AGGREGATE_TARGETS:
+        if target.startswith(table[:-1]):
+            return table
+    if target.startswith(("сотрудн", "человек", "люд")):
+        return "employees"
+    if target.startswith(("мероприят", "событ", "встреч")):
+        return "events"
+    if target.startswith(("задач", "тикет")) or entities.get("status") or entities.get("priority"):
+        return "tasks"
+    if entities.get("event_type"):
+        return "events"
+    return "employees"
+
+
+def resolve_group_by(table: str, entities: Dict[str, Any]) -> Optional[str]:
+    """Возвращает колонку группировки или None, если группировка не запрошена/недопустима."""
+    group_by = entities.get("group_by")
+    if not group_by:
+        return None
+    column = _resolve_alias(group_by, GROUP_BY_ALIASES) or group_by.strip().lower()
+    if column not in GROUP_BY_COLUMNS.get(table, ()):
+        logger.warning(f"Группировка '{group_by}' недоступна для таблицы '{table}'")
+        return None
+    return column
+
+
+def build_aggregate_filters(table: str, entities: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Строит фильтры в формате execute_supabase_query для запроса-агрегата.
+
+    Args:
+        table: Таблица, по которой считаем
+        entities: Сущности, извлеченные NLU
+
+    Returns:
+        Список фильтров
+    """
+    specs: List[Tuple[str, str, str]] = []
+
+    if table == "employees":
+        specs = [("department", "ilike", "department"), ("job_title", "ilike", "position")]
+    elif table == "events":
+        specs = [("type", "eq", "event_type"), ("date", "eq", "date"), ("location", "ilike", "location")]
+    elif table == "tasks":
+        specs = [("project", "ilike", "project"), ("description", "ilike", "task_keyword")]
+
+    filters: List[Dict[str, Any]] = [
+        f for f in (
+            multi_value_filter(column, operator, entity_values(entities, entity))
+            for column, operator, entity in specs
+        ) if f
+    ]
+
+    if table == "employees" and entities.get("project"):
+        # Любой из проектов, как в Repository.find_employees
+        filters.append({"column": "projects", "operator": "ov", "value": entity_values(entities, "project")})
+
+    if table == "tasks":
+        statuses: List[str] = []
+        for status in entity_values(entities, "status"):
+            statuses.extend(s for s in _resolve_alias(status, STATUS_ALIASES) or [status] if s not in statuses)
+        if statuses:
+            filters.append({"column": "status", "operator": "in", "value": statuses})
+        priorities = [_resolve_alias(p, PRIORITY_ALIASES) or p for p in entity_values(entities, "priority")]
+        if priorities:
+            filters.append(multi_value_filter("priority", "eq", priorities))
+
+    return filters
+
+
+def _row_matches(row: RowView, filters: List[Dict[str, Any]]) -> bool:
+    """Проверяет строку локального хранилища на соответствие фильтрам."""
+    for f in filters:
+        value = row.get(f["column"])
+        op, expected = f["operator"], f["value"]
+        if op == "eq":
+            ok = value == expected
+        elif op == "neq":
+            ok = value != expected
+        elif op in ("ilike", "like"):
+            needle = str(expected).strip("%")
+            haystack = "" if value is None else str(value)
+            ok = needle.lower() in haystack.lower() if op == "ilike" else needle in haystack
+        elif op == "in":
+            ok = value in expected
+        elif op == "ilike_any":
+            haystack = "" if value is None else str(value).lower()
+            ok = any(str(needle).strip("%").lower() in haystack for needle in expected)
+        elif op == "cs":
+            ok = value is not None and all(item in value for item in expected)
+        elif op == "ov":
+            ok = value is not None and any(item in value for item in expected)
+        elif op in ("gt", "gte", "lt", "lte"):
+            if value is None:
+                return False
+            ok = {"gt": value > expected, "gte": value >= expected,
+                  "lt": value < expected, "lte": value <= expected}[op]
+        else:
+            logger.warning(f"Оператор '{op}' не поддерживается для локальной агрегации")
+            return False
+        if not ok:
+            return False
+    return True
+
+
+async def count_rows(
+        supabase_client: Client,
+        table_name: str,
+        filters: Optional[List[Dict[str, Any]]] = None,
+        store: Optional[RowStore] = None
+) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Считает строки: по локальному хранилищу, если оно есть, иначе на сервере (count=exact, head).
+
+    Args:
+        supabase_client: Клиент Supabase
+        table_name: Имя таблицы
+        filters: Фильтры в формате execute_supabase_query
+        store: Загруженное колоночное хранилище этой таблицы (необязательно)
+
+    Returns:
+        Кортеж (количество, ошибка)
+    """
+    filters = filters or []
+    if store is not None:
+        count = len(store.view().filter(lambda row: _row_matches(row, filters)))
+        logger.debug(f"Локальный подсчет строк в '{table_name}': {count}")
+        return count, None
+    return await count_supabase_rows(supabase_client, table_name, filters=filters)
+
+
+async def count_grouped(
+        supabase_client: Client,
+        table_name: str,
+        group_by: str,
+        filters: Optional[List[Dict[str, Any]]] = None,
+        store: Optional[RowStore] = None,
+        pages: Optional[PageIterator] = None
+) -> Tuple[Optional[Dict[str, int]], Optional[str]]:
+    """
+    Считает строки с группировкой по колонке.
+
+    Сначала использует локальное хранилище, затем агрегатную функцию PostgREST
+    (`select=col,count()`). Если агрегаты на сервере отключены, выгружает
+    только колонку группировки постранично (один ответ PostgREST обрезается
+    до max-rows) и считает локально, не больше GROUP_FALLBACK_LIMIT строк.
+
+    Args:
+        supabase_client: Клиент Supabase
+        table_name: Имя таблицы
+        group_by: Колонка группировки
+        filters: Фильтры в формате execute_supabase_query
+        store: Загруженное колоночное хранилище этой таблицы (необязательно)
+        pages: Постраничная выгрузка, обычно Repository.iter_pages (без нее — один запрос)
+
+    Returns:
+        Кортеж ({значение: количество}, ошибка)
+    """
+    filters = filters or []
+    if store is not None:
+        column = store.column(group_by)
+        view = store.view().filter(lambda row: _row_matches(row, filters))
+        return dict(Counter(column[row.index] for row in view)), None
+
+    if not supabase_client:
+        return None, "Клиент Supabase не инициализирован"
+
+    try:
+        query = supabase_client.table(table_name).select(f"{group_by}, count()")
+        query = apply_filters(query, filters, table_name)
+        response: PostgrestAPIResponse = await run_query(query)
+        return {row.get(group_by): row.get("count", 0) for row in response.data or []}, None
+    except Exception as e:
+        logger.warning(f"Агрегаты PostgREST недоступны для '{table_name}' ({e}), считаем по одной колонке")
+
+    if pages is None:
+        data, error = await execute_supabase_query(
+            supabase_client, table_name, select_columns=group_by, filters=filters, limit=GROUP_FALLBACK_LIMIT
+        )
+        if error:
+            return None, error
+        return dict(Counter(row.get(group_by) for row in data or [])), None
+
+    counts: Counter = Counter()
+    scanned = 0
+    try:
+        async for page in pages(table_name, group_by, filters):
+            counts.update(row.get(group_by) for row in page)
+            scanned += len(page)
+            if scanned >= GROUP_FALLBACK_LIMIT:
+                logger.warning(f"Группировка '{table_name}' по '{group_by}' остановлена на {scanned} строках")
+                break
+    except RuntimeError as e:
+        return None, str(e)
+    return dict(counts), None
+
+
+async def aggregate(
+        supabase_client: Client,
+        entities: Dict[str, Any],
+        stores: Optional[Dict[str, RowStore]] = None,
+        pages: Optional[PageIterator] = None
+) -> Dict[str, Any]:
+    """
+    Отвечает на вопрос "сколько" по сущностям NLU.
+
+    Args:
+        supabase_client: Клиент Supabase
+        entities: Сущности запроса (target, group_by, department, status, priority, ...)
+        stores: Локальные колоночные хранилища по именам таблиц (необязательно)
+        pages: Постраничная выгрузка для группировки без серверных агрегатов (необязательно)
+
+    Returns:
+        Словарь {'target', 'filters', 'count' | 'groups', 'error'}
+    """
+    table = resolve_target(entities)
+    filters = build_aggregate_filters(table, entities)
+    store = (stores or {}).get(table)
+    group_by = resolve_group_by(table, entities)
+
+    result: Dict[str, Any] = {"target": table, "filters": filters, "error": None}
+    if group_by:
+        groups, error = await count_grouped(supabase_client, table, group_by, filters, store=store, pages=pages)
+        result.update(group_by=group_by, groups=groups, error=error)
+    else:
+        count, error = await count_rows(supabase_client, table, filters, store=store)
+        result.update(count=count, error=error)
+    return result
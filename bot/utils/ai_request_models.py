@@ -1,19 +1,58 @@
 # models/ai_request_models.py
-from typing import Optional, Dict, Any
+import re
+from typing import Optional, Dict, Any, List, Union
 from pydantic import BaseModel, Field
 
+# Дата в формате дд.мм.гггг (для разбора нескольких дат в одной строке)
+_DATE_RE = re.compile(r"\b\d{2}\.\d{2}\.\d{4}\b")
+
+EntityValue = Optional[Union[str, List[str]]]
+
+
+def entity_values(entities: Union["AIRequestEntities", Dict[str, Any], None], name: str) -> List[str]:
+    """
+    Возвращает все значения сущности списком.
+
+    NLU может вернуть как одну строку, так и список значений
+    ("05.03.2024 и 06.03.2024" -> ["05.03.2024", "06.03.2024"]).
+    Пустые значения и дубликаты отбрасываются, порядок сохраняется.
+    """
+    if entities is None:
+        return []
+    raw = entities.get(name) if isinstance(entities, dict) else getattr(entities, name, None)
+    if raw is None:
+        return []
+    if isinstance(raw, str):
+        raw = (_DATE_RE.findall(raw) or [raw]) if name == "date" else [raw]
+
+    values: List[str] = []
+    for item in raw:
+        item = str(item).strip()
+        if item and item not in values:
+            values.append(item)
+    return values
+
+
 class AIRequestEntities(BaseModel):
-    employee_name: Optional[str] = None
-    department: Optional[str] = None
-    project: Optional[str] = None
-    date: Optional[str] = None
-    event_type: Optional[str] = None
-    task_keyword: Optional[str] = None
-    location: Optional[str] = None
+    employee_name: EntityValue = None
+    department: EntityValue = None
+    project: EntityValue = None
+    date: EntityValue = None
+    event_type: EntityValue = None
+    task_keyword: EntityValue = None
+    location: EntityValue = None
+    period: EntityValue = None
+    time: EntityValue = None
+    weekday: EntityValue = None
+    interest: EntityValue = None
 
     class Config:
         extra = 'allow'
 
+    def values(self, name: str) -> List[str]:
+        """Все значения сущности списком (см. entity_values)."""
+        return entity_values(self, name)
+
 class AIRequest(BaseModel):
     intent: str # Можно заменить на Enum Intent
-    entities: Optional[AIRequestEntities] = Field(default_factory=dict)
\ No newline at end of file
+    entities: Optional[AIRequestEntities] = Field(default_factory=dict)
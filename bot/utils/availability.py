@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Generic, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from bot.utils.periods import parse_date
+from bot.utils.repository import Repository
+from bot.utils.row_store import RowStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Длительность мероприятия, если известно только время начала
+DEFAULT_EVENT_MINUTES = 60
+# Все интервалы хранятся в минутах от этой точки
+_EPOCH = datetime(2000, 1, 1)
+_TIME_RE = re.compile(r"^\s*(\d{1,2})[:.](\d{2})")
+
+
+def to_minutes(moment: datetime) -> int:
+    return int((moment - _EPOCH).total_seconds() // 60)
+
+
+def parse_time(value: Any) -> Optional[Tuple[int, int]]:
+    """Разбирает время "14:30", "14.30" или "14:30:00"; None, если времени нет."""
+    match = _TIME_RE.match(str(value)) if value else None
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def day_window(start: date, end: Optional[date] = None) -> Tuple[int, int]:
+    """Полуоткрытый интервал [начало start, конец end) в минутах."""
+    end = end or start
+    return (to_minutes(datetime.combine(start, datetime.min.time())),
+            to_minutes(datetime.combine(end + timedelta(days=1), datetime.min.time())))
+
+
+class IntervalTree(Generic[T]):
+    """
+    Статическое дерево интервалов на отсортированном массиве.
+
+    Интервалы [start, end) отсортированы по началу, а неявное сбалансированное
+    дерево поверх массива (корень — середина диапазона) хранит максимум концов
+    в поддереве. Поиск пересечений — O(log n + k).
+    """
+
+    __slots__ = ("_starts", "_ends", "_items", "_max_end")
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, T]] = ()):
+        ordered = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self._starts = [start for start, _, _ in ordered]
+        self._ends = [end for _, end, _ in ordered]
+        self._items = [item for _, _, item in ordered]
+        self._max_end = list(self._ends)
+        self._build(0, len(ordered))
+
+    def _build(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        self._max_end[mid] = max(self._ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        return self._max_end[mid]
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def overlapping(self, start: int, end: int) -> List[T]:
+        """Все элементы, интервалы которых пересекаются с [start, end), по возрастанию начала."""
+        result: List[T] = []
+        self._collect(0, len(self._starts), start, end, result)
+        return result
+
+    def _collect(self, lo: int, hi: int, start: int, end: int, result: List[T]) -> None:
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        # В поддереве все интервалы закончились до start — пересечений нет
+        if self._max_end[mid] <= start:
+            return
+        self._collect(lo, mid, start, end, result)
+        # Правее середины начала только больше: если mid начинается не раньше end, дальше искать нечего
+        if self._starts[mid] >= end:
+            return
+        if self._ends[mid] > start:
+            result.append(self._items[mid])
+        self._collect(mid + 1, hi, start, end, result)
+
+    def any_overlap(self, start: int, end: int) -> bool:
+        return bool(self.overlapping(start, end))
+
+
+def _participants(event: Dict[str, Any]) -> List[int]:
+    ids = []
+    for value in [event.get("organizer_id"), *(event.get("participants") or [])]:
+        try:
+            employee_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if employee_id not in ids:
+            ids.append(employee_id)
+    return ids
+
+
+def event_interval(event: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """Интервал занятости мероприятия: от времени начала на DEFAULT_EVENT_MINUTES или весь день."""
+    day = parse_date(event.get("date"))
+    if day is None:
+        return None
+    time = parse_time(event.get("time"))
+    if time is None:
+        return day_window(day)
+    start = to_minutes(datetime.combine(day, datetime.min.time()).replace(hour=time[0], minute=time[1]))
+    return start, start + DEFAULT_EVENT_MINUTES
+
+
+class AvailabilityIndex:
+    """
+    Календарь занятости сотрудников.
+
+    Для каждого сотрудника — дерево интервалов его мероприятий (организатор
+    или участник) и дерево дедлайнов незавершенных задач. Обратный индекс
+    сотрудник -> мероприятия строится тем же проходом.
+    """
+
+    def __init__(self, events: Iterable[Dict[str, Any]] = (), tasks: Iterable[Dict[str, Any]] = ()):
+        busy: Dict[int, List[Tuple[int, int, Dict[str, Any]]]] = {}
+        for event in events:
+            interval = event_interval(event)
+            if interval is None:
+                continue
+            for employee_id in _participants(event):
+                busy.setdefault(employee_id, []).append((*interval, event))
+
+        deadlines: Dict[int, List[Tuple[int, int, Dict[str, Any]]]] = {}
+        for task in tasks:
+            if task.get("status") == "completed" or task.get("assignee_id") is None:
+                continue
+            due = parse_date(task.get("due_date"))
+            if due is None:
+                continue
+            deadlines.setdefault(int(task["assignee_id"]), []).append((*day_window(due), task))
+
+        self._events: Dict[int, IntervalTree[Dict[str, Any]]] = {k: IntervalTree(v) for k, v in busy.items()}
+        self._deadlines: Dict[int, IntervalTree[Dict[str, Any]]] = {k: IntervalTree(v) for k, v in deadlines.items()}
+        self.events_by_employee: Dict[int, List[Any]] = {
+            employee_id: [event.get("id") for _, _, event in intervals] for employee_id, intervals in busy.items()
+        }
+
+    def __len__(self) -> int:
+        return sum(len(tree) for tree in self._events.values())
+
+    def busy(self, employee_id: int, start: int, end: int) -> List[Dict[str, Any]]:
+        """Мероприятия сотрудника, пересекающиеся с [start, end)."""
+        tree = self._events.get(employee_id)
+        return tree.overlapping(start, end) if tree else []
+
+    def deadlines(self, employee_id: int, start: int, end: int) -> List[Dict[str, Any]]:
+        """Незавершенные задачи сотрудника со сроком в [start, end)."""
+        tree = self._deadlines.get(employee_id)
+        return tree.overlapping(start, end) if tree else []
+
+    def is_free(self, employee_id: int, start: int, end: int) -> bool:
+        tree = self._events.get(employee_id)
+        return not tree or not tree.any_overlap(start, end)
+
+    def free_among(self, employee_ids: Sequence[int], start: int, end: int) -> List[int]:
+        """Кто из сотрудников свободен во всем интервале [start, end)."""
+        return [employee_id for employee_id in employee_ids if self.is_free(employee_id, start, end)]
+
+
+class AvailabilityService:
+    """Индекс занятости поверх репозитория; перестраивается при перезагрузке events или tasks."""
+
+    def __init__(self, repository: Repository):
+        self.repository = repository
+        self._index: Optional[AvailabilityIndex] = None
+        self._sources: Tuple[Optional[RowStore], Optional[RowStore]] = (None, None)
+        repository.subscribe("events", lambda _: self.invalidate())
+        repository.subscribe("tasks", lambda _: self.invalidate())
+
+    @classmethod
+    def for_repository(cls, repository: Repository) -> "AvailabilityService":
+        return repository.service("availability", cls)
+
+    def invalidate(self) -> None:
+        self._index = None
+        self._sources = (None, None)
+
+    async def index(self) -> Optional[AvailabilityIndex]:
+        events, tasks = await asyncio.gather(
+            self.repository.load_store("events"), self.repository.load_store("tasks")
+        )
+        if events is None:
+            return self._index
+        if self._index is None or events is not self._sources[0] or tasks is not self._sources[1]:
+            self._index = AvailabilityIndex(events, tasks or ())
+            self._sources = (events, tasks)
+            logger.info(f"Индекс занятости перестроен: {len(self._index)} интервалов, "
+                        f"{len(self._index.events_by_employee)} сотрудников")
+        return self._index
@@ -0,0 +1,158 @@
+import calendar
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bot.utils.periods import month_range, parse_date
+from bot.utils.repository import Repository
+from bot.utils.row_store import RowStore
+
+logger = logging.getLogger(__name__)
+
+# Ключи дней считаются по високосному году, чтобы у 29 февраля было свое место
+_KEY_YEAR = 2000
+_FEB_28_KEY = date(_KEY_YEAR, 2, 28).timetuple().tm_yday
+_FEB_29_KEY = _FEB_28_KEY + 1
+
+Birthday = Tuple[date, Dict[str, Any]]
+
+
+def day_key(day: date) -> int:
+    """Номер дня (1..366) в календаре високосного года."""
+    return date(_KEY_YEAR, day.month, day.day).timetuple().tm_yday
+
+
+def _celebration_date(key: int, year: int) -> date:
+    """Дата празднования в конкретном году; 29 февраля в невисокосный год — 28 февраля."""
+    day = date(_KEY_YEAR, 1, 1) + timedelta(days=key - 1)
+    if day.month == 2 and day.day == 29 and not calendar.isleap(year):
+        return date(year, 2, 28)
+    return date(year, day.month, day.day)
+
+
+class BirthdayIndex:
+    """
+    Отсортированный по дню года индекс дней рождения.
+
+    Запросы "сегодня", "на этой неделе", "в марте" — это один или два
+    (при переходе через Новый год) бинарных поиска по массиву ключей.
+    """
+
+    def __init__(self, employees: Iterable[Dict[str, Any]] = ()):
+        entries = []
+        for employee in employees:
+            birthday = parse_date(employee.get("birthday"))
+            if birthday:
+                entries.append((day_key(birthday), employee))
+        entries.sort(key=lambda entry: entry[0])
+        self._keys: List[int] = [key for key, _ in entries]
+        self._employees: List[Dict[str, Any]] = [employee for _, employee in entries]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _slice(self, start_key: int, end_key: int, year: int) -> List[Birthday]:
+        lo = bisect_left(self._keys, start_key)
+        hi = bisect_right(self._keys, end_key)
+        return [(_celebration_date(self._keys[i], year), self._employees[i]) for i in range(lo, hi)]
+
+    def _year_range(self, start: date, end: date) -> List[Birthday]:
+        """Интервал внутри одного календарного года."""
+        start_key, end_key = day_key(start), day_key(end)
+        # В невисокосный год родившиеся 29 февраля празднуют 28-го
+        if not calendar.isleap(start.year) and end_key == _FEB_28_KEY:
+            end_key = _FEB_29_KEY
+        return self._slice(start_key, end_key, start.year)
+
+    def between(self, start: date, end: date) -> List[Birthday]:
+        """
+        Дни рождения в интервале дат (включительно), по возрастанию даты.
+
+        Интервал может пересекать границу года; длиннее года не ищем.
+        """
+        if end < start:
+            return []
+        end = min(end, start + timedelta(days=365))
+        result: List[Birthday] = []
+        cursor = start
+        while cursor <= end:
+            year_end = min(end, date(cursor.year, 12, 31))
+            result.extend(self._year_range(cursor, year_end))
+            cursor = year_end + timedelta(days=1)
+        return result
+
+    def on(self, day: date) -> List[Birthday]:
+        return self.between(day, day)
+
+    def in_month(self, month: int, year: Optional[int] = None) -> List[Birthday]:
+        return self.between(*month_range(year or date.today().year, month))
+
+    def upcoming(self, days: int = 7, today: Optional[date] = None) -> List[Birthday]:
+        today = today or date.today()
+        return self.between(today, today + timedelta(days=days - 1))
+
+
+def format_birthdays(birthdays: List[Birthday], title: str) -> str:
+    if not birthdays:
+        return f"{title}: дней рождения нет."
+    lines = [f"🎂 {title}:"]
+    for day, employee in birthdays:
+        department = f" ({employee['department']})" if employee.get("department") else ""
+        lines.append(f"- {day:%d.%m}: {employee.get('name', 'N/A')}{department}")
+    return "\n".join(lines)
+
+
+class BirthdayService:
+    """
+    Индекс дней рождения поверх репозитория.
+
+    Перестраивается, когда репозиторий перезагружает таблицу employees
+    (по TTL или после изменений), и хранит готовый дайджест на текущий день.
+    """
+
+    def __init__(self, repository: Repository):
+        self.repository = repository
+        self._index: Optional[BirthdayIndex] = None
+        self._source: Optional[RowStore] = None
+        self._digests: Dict[date, str] = {}
+        repository.subscribe("employees", lambda _: self.invalidate())
+
+    @classmethod
+    def for_repository(cls, repository: Repository) -> "BirthdayService":
+        return repository.service("birthdays", cls)
+
+    def invalidate(self) -> None:
+        self._index = None
+        self._source = None
+        self._digests.clear()
+
+    async def index(self) -> Optional[BirthdayIndex]:
+        store = await self.repository.load_store("employees")
+        if store is None:
+            return self._index
+        if store is not self._source:
+            self._index = BirthdayIndex(store)
+            self._source = store
+            self._digests.clear()
+            logger.info(f"Индекс дней рождения перестроен: {len(self._index)} записей")
+        return self._index
+
+    async def between(self, start: date, end: date) -> List[Birthday]:
+        index = await self.index()
+        return index.between(start, end) if index else []
+
+    async def daily_digest(self, day: Optional[date] = None) -> str:
+        """Дайджест на день: сегодняшние именинники и ближайшая неделя. Кешируется до перестройки индекса."""
+        day = day or date.today()
+        index = await self.index()
+        digest = self._digests.get(day)
+        if digest is None:
+            if index is None:
+                return "Не удалось загрузить список сотрудников."
+            today_text = format_birthdays(index.on(day), f"Сегодня, {day:%d.%m}")
+            week = index.upcoming(7, day + timedelta(days=1))
+            digest = today_text + "\n\n" + format_birthdays(week, "Ближайшие 7 дней")
+            # Храним только актуальный день
+            self._digests = {day: digest}
+        return digest
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar, Union
+
+from bot.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Небольшой LRU-кеш с временем жизни записей.
+
+    Память ограничена max_size записями: при переполнении вытесняется
+    самая давно использованная. Просроченные записи удаляются при чтении.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def aget(self, key: Hashable) -> Optional[V]:
+        """То же, что get; общий интерфейс с SqliteCache для асинхронного кода."""
+        return self.get(key)
+
+    async def aset(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return None if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SqliteCache(Generic[V]):
+    """
+    Кеш с тем же интерфейсом, что TTLCache, в общем файле SQLite.
+
+    Используется, когда бот работает несколькими процессами (см. bot.sharding):
+    значение, сохраненное одним воркером, видно остальным. Значения
+    сериализуются pickle, ключи — repr. Просроченные и лишние записи
+    удаляются раз в EVICT_EVERY записей.
+
+    Из асинхронного кода используйте aget/aset: запрос уходит в отдельный
+    поток, и ожидание блокировки файла другим воркером не останавливает
+    event loop.
+    """
+
+    EVICT_EVERY = 256
+
+    def __init__(self, path: str, namespace: str, max_size: int = 1024, ttl: float = 60.0):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # Соединение нельзя наследовать через fork — открываем свое в каждом процессе
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "ns TEXT, key TEXT, expires_at REAL, value BLOB, PRIMARY KEY (ns, key))"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT count(*) FROM cache WHERE ns = ? AND expires_at >= ?", (self.namespace, time.time())
+            ).fetchone()
+        return row[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable) -> Optional[V]:
+        try:
+            with self._lock:
+                row = self._db().execute(
+                "SELECT value FROM cache WHERE ns = ? AND key = ? AND expires_at >= ?",
+                    (self.namespace, repr(key), time.time()),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Общий кеш '{self.namespace}' недоступен: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (ns, key, expires_at, value) VALUES (?, ?, ?, ?)",
+                    (self.namespace, repr(key), expires_at, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)),
+                )
+                self._writes += 1
+                if self._writes % self.EVICT_EVERY == 0:
+                    self._evict(db)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать в общий кеш '{self.namespace}': {e}")
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        db.execute("DELETE FROM cache WHERE ns = ? AND expires_at < ?", (self.namespace, time.time()))
+        db.execute(
+            "DELETE FROM cache WHERE ns = ? AND key IN ("
+            "SELECT key FROM cache WHERE ns = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_size),
+        )
+
+    async def aget(self, key: Hashable) -> Optional[V]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        value = self.get(key)
+        with self._lock:
+            self._db().execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.namespace, repr(key)))
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM cache WHERE ns = ?", (self.namespace,))
+
+
+class SharedVersions:
+    """
+    Счетчики версий по именам в общем файле SQLite (SHARED_CACHE_PATH).
+
+    Процесс, изменивший данные, увеличивает версию (bump); остальные
+    периодически читают все версии (snapshot) и сбрасывают свои копии
+    тех данных, чья версия выросла. Методы синхронные — из асинхронного
+    кода их вызывают через asyncio.to_thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def bump(self, name: str) -> int:
+        """Увеличивает версию и возвращает новое значение."""
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO versions (name, version) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+                (name,),
+            )
+            return db.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()[0]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._db().execute("SELECT name, version FROM versions").fetchall())
+
+
+def make_cache(namespace: str, max_size: int = 1024, ttl: float = 60.0) -> Union[TTLCache, SqliteCache]:
+    """
+    Кеш для данных, полезных всем процессам бота.
+
+    Если задан SHARED_CACHE_PATH (режим нескольких воркеров) — общий SqliteCache,
+    иначе обычный TTLCache в памяти процесса.
+
+    Сейчас так устроен только кеш шаблонов SQL. Остальные производные данные
+    (хранилища таблиц репозитория и сервисы repository.service) остаются в
+    памяти каждого воркера, а их сброс после записи доходит до других
+    воркеров через SharedVersions (см. bot.utils.invalidation).
+    """
+    if app_settings.SHARED_CACHE_PATH:
+        return SqliteCache(app_settings.SHARED_CACHE_PATH, namespace, max_size=max_size, ttl=ttl)
+    return TTLCache(max_size=max_size, ttl=ttl)
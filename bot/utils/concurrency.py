@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LimiterRejected(Exception):
+    """Запрос не получил слот: очередь переполнена или истек срок ожидания."""
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный ограничитель параллелизма (AIMD).
+
+    Лимит одновременных операций растет на ~1 за "круг" (limit успешных
+    вызовов), пока задержка не превышает целевую, и умножается на backoff
+    при ошибках или всплесках задержки. Лишние запросы ждут в очереди FIFO
+    со сроком ожидания, после которого получают LimiterRejected.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            initial: int = 8,
+            min_limit: int = 1,
+            max_limit: int = 32,
+            latency_target: float = 0.8,
+            backoff: float = 0.7,
+            queue_timeout: float = 5.0,
+            max_queue: int = 200,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_backoff = 0.0
+        self._rejected = 0
+        self._completed = 0
+        self._errors = 0
+
+    @property
+    def limit(self) -> int:
+        """Текущий лимит одновременных операций."""
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущее состояние ограничителя для логов и мониторинга."""
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "inflight": self._inflight,
+            "queue_depth": self.queue_depth,
+            "completed": self._completed,
+            "errors": self._errors,
+            "rejected": self._rejected,
+        }
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        """
+        Занимает слот, при необходимости ожидая в очереди.
+
+        Args:
+            timeout: Максимальное время ожидания в секундах (по умолчанию queue_timeout)
+
+        Raises:
+            LimiterRejected: если очередь переполнена или слот не освободился вовремя
+        """
+        if self._inflight < self.limit and not self._waiters:
+            self._inflight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._rejected += 1
+            raise LimiterRejected(f"{self.name}: очередь переполнена ({self.max_queue})")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise LimiterRejected(f"{self.name}: не дождались свободного слота") from None
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой — вернем его
+            if waiter.done() and not waiter.cancelled():
+                self._inflight -= 1
+                self._wake()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, latency: float, error: bool = False) -> None:
+        """
+        Освобождает слот и корректирует лимит.
+
+        Args:
+            latency: Длительность операции в секундах
+            error: Завершилась ли операция ошибкой
+        """
+        self._inflight -= 1
+        self._completed += 1
+        now = time.monotonic()
+
+        if error or latency > self.latency_target:
+            if error:
+                self._errors += 1
+            # Не чаще одного снижения за время целевой задержки, чтобы пачка ошибок не обнулила лимит
+            if now - self._last_backoff >= self.latency_target:
+                previous = self.limit
+                self._limit = max(float(self.min_limit), self._limit * self.backoff)
+                self._last_backoff = now
+                if self.limit != previous:
+                    logger.warning(
+                        f"{self.name}: лимит снижен {previous} -> {self.limit} "
+                        f"({'ошибка' if error else f'задержка {latency * 1000:.0f} мс'})")
+        elif self._limit < self.max_limit:
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._inflight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._inflight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Контекстный менеджер: занимает слот и освобождает его с замером задержки."""
+        await self.acquire(timeout)
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.release(time.perf_counter() - started, error)
@@ -1,11 +1,160 @@
 import asyncio
+import json
 import logging
+import time
 from typing import List, Dict, Any, Optional, Tuple
 
 from supabase import Client, create_client, PostgrestAPIResponse
 
+from bot.config import app_settings
+from bot.utils.concurrency import AdaptiveLimiter, LimiterRejected
+from bot.utils.deadline import current_deadline
+
 logger = logging.getLogger(__name__)
 
+# Общий ограничитель параллельных запросов к Supabase/PostgREST
+db_limiter = AdaptiveLimiter(
+    "supabase",
+    initial=app_settings.DB_CONCURRENCY_INITIAL,
+    min_limit=app_settings.DB_CONCURRENCY_MIN,
+    max_limit=app_settings.DB_CONCURRENCY_MAX,
+    latency_target=app_settings.DB_LATENCY_TARGET_MS / 1000,
+    queue_timeout=app_settings.DB_QUEUE_TIMEOUT,
+    max_queue=app_settings.DB_QUEUE_MAX,
+)
+
+
+async def run_query(query, timeout: Optional[float] = None) -> PostgrestAPIResponse:
+    """
+    Выполняет построенный запрос в отдельном потоке под адаптивным ограничителем.
+
+    По таймауту (или отмене) перестает ждать только вызывающий код: поток
+    с запросом остановить нельзя, поэтому слот ограничителя освобождается,
+    лишь когда поток действительно завершится. Иначе при медленной базе
+    ограничитель пропускал бы новые запросы, пока старые еще занимают
+    потоки общего пула.
+
+    Args:
+        query: Построитель запроса Supabase (с методом execute)
+        timeout: Таймаут выполнения в секундах (по умолчанию DB_QUERY_TIMEOUT); внутри
+            срока запроса (Deadline.scope) не больше оставшегося времени
+
+    Raises:
+        LimiterRejected: если слот не освободился за DB_QUEUE_TIMEOUT
+        asyncio.TimeoutError: если запрос не уложился в таймаут
+    """
+    if timeout is None:
+        timeout = app_settings.DB_QUERY_TIMEOUT
+    deadline = current_deadline()
+    if deadline is not None:
+        timeout = min(timeout, deadline.remaining())
+    await db_limiter.acquire()
+    started = time.perf_counter()
+    try:
+        future = asyncio.ensure_future(asyncio.to_thread(query.execute))
+    except BaseException:
+        db_limiter.release(time.perf_counter() - started, error=True)
+        raise
+
+    def release(done: asyncio.Future) -> None:
+        error = done.cancelled() or done.exception() is not None
+        db_limiter.release(time.perf_counter() - started, error)
+
+    future.add_done_callback(release)
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+
+def _or_quote(value: Any) -> str:
+    """Экранирует значение для использования внутри фильтра PostgREST or=(...)."""
+    text = str(value)
+    if any(c in text for c in ',()."\\'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+def apply_filters(query, filters: Optional[List[Dict[str, Any]]], table_name: str):
+    """
+    Применяет список фильтров к построителю запроса PostgREST.
+
+    Args:
+        query: Построитель запроса Supabase
+        filters: Список словарей с фильтрами {'column': ..., 'operator': ..., 'value': ...}
+        table_name: Имя таблицы (для логирования)
+
+    Returns:
+        Построитель запроса с примененными фильтрами
+    """
+    if not filters:
+        return query
+
+    for f in filters:
+        col = f.get('column')
+        op = f.get('operator')
+        val = f.get('value')
+
+        if not all([col, op]):
+            logger.warning(f"Неполный фильтр пропущен: {f}")
+            continue
+
+        # Проверка и применение оператора фильтрации
+        if op == 'eq':
+            query = query.eq(col, val)
+        elif op == 'neq':
+            query = query.neq(col, val)
+        elif op == 'gt':
+            query = query.gt(col, val)
+        elif op == 'lt':
+            query = query.lt(col, val)
+        elif op == 'gte':
+            query = query.gte(col, val)
+        elif op == 'lte':
+            query = query.lte(col, val)
+        elif op == 'like':
+            query = query.like(col, f'%{val}%')
+        elif op == 'ilike':
+            query = query.ilike(col, f'%{val}%')
+        elif op == 'ilike_any':
+            # Несколько значений одной колонки объединяются в один фильтр or=(...)
+            values = val if isinstance(val, list) else [val]
+            query = query.or_(",".join(f"{col}.ilike.{_or_quote(f'*{v}*')}" for v in values))
+        elif op == 'is':
+            query = query.is_(col, val)
+        elif op == 'cs':
+            query = query.contains(col, val if isinstance(val, list) else [val])
+        elif op == 'cd':
+            query = query.contained_by(col, val if isinstance(val, list) else [val])
+        elif op == 'ov':
+            # Массив пересекается со списком: есть хотя бы одно из значений
+            query = query.ov(col, val if isinstance(val, list) else [val])
+        elif op == 'in':
+            # Обработка списков для оператора 'in'
+            if isinstance(val, str):
+                val_list = [item.strip() for item in val.split(',')]
+                # Пытаемся преобразовать строковые числа в int
+                try:
+                    val_list = [int(item) if item.isdigit() else item for item in val_list]
+                except ValueError:
+                    pass
+                query = query.in_(col, val_list)
+            elif isinstance(val, list):
+                query = query.in_(col, val)
+            else:
+                logger.warning(
+                    f"Для оператора 'in' значение должно быть списком или строкой через запятую: {val}")
+                continue
+        else:
+            logger.warning(f"Неизвестный оператор фильтрации '{op}' для таблицы '{table_name}'.")
+
+    return query
+
+
+def _payload_size(data: Any) -> int:
+    """Оценивает размер полезной нагрузки ответа в байтах."""
+    try:
+        return len(json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
 
 async def execute_supabase_query(
         supabase_client: Client,
@@ -13,7 +162,8 @@ async def execute_supabase_query(
         select_columns: str = "*",
         filters: Optional[List[Dict[str, Any]]] = None,
         order_by: Optional[Tuple[str, str]] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        timeout: Optional[float] = None
 ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
     """
     Выполняет запрос к базе данных Supabase с заданными параметрами.
@@ -24,7 +174,8 @@ async def execute_supabase_query(
         select_columns: Строка с перечислением колонок для выборки
         filters: Список словарей с фильтрами {'column': 'имя_колонки', 'operator': 'eq|neq|gt|...', 'value': значение}
         order_by: Кортеж (имя_колонки, 'asc'|'desc') для сортировки
-        limit: Ограничение количества возвращаемых записей
+        limit: Ограничение количества возвращаемых записей (по умолчанию MAX_QUERY_RESULTS)
+        timeout: Таймаут запроса в секундах (по умолчанию DB_QUERY_TIMEOUT)
 
     Returns:
         Кортеж (данные, ошибка) - если ошибки нет, то второй элемент None
@@ -34,77 +185,41 @@ async def execute_supabase_query(
         logger.error("Клиент Supabase не был предоставлен.")
         return None, "Клиент Supabase не инициализирован"
 
+    if limit is None:
+        limit = app_settings.MAX_QUERY_RESULTS
+    if timeout is None:
+        timeout = app_settings.DB_QUERY_TIMEOUT
+
     try:
         # Инициализация запроса
         query = supabase_client.table(table_name).select(select_columns)
 
         # Применение фильтров
-        if filters:
-            for f in filters:
-                col = f.get('column')
-                op = f.get('operator')
-                val = f.get('value')
-
-                if not all([col, op]):
-                    logger.warning(f"Неполный фильтр пропущен: {f}")
-                    continue
-
-                # Проверка и применение оператора фильтрации
-                if op == 'eq':
-                    query = query.eq(col, val)
-                elif op == 'neq':
-                    query = query.neq(col, val)
-                elif op == 'gt':
-                    query = query.gt(col, val)
-                elif op == 'lt':
-                    query = query.lt(col, val)
-                elif op == 'gte':
-                    query = query.gte(col, val)
-                elif op == 'lte':
-                    query = query.lte(col, val)
-                elif op == 'like':
-                    query = query.like(col, f'%{val}%')
-                elif op == 'ilike':
-                    query = query.ilike(col, f'%{val}%')
-                elif op == 'in':
-                    # Обработка списков для оператора 'in'
-                    if isinstance(val, str):
-                        val_list = [item.strip() for item in val.split(',')]
-                        # Пытаемся преобразовать строковые числа в int
-                        try:
-                            val_list = [int(item) if item.isdigit() else item for item in val_list]
-                        except ValueError:
-                            pass
-                        query = query.in_(col, val_list)
-                    elif isinstance(val, list):
-                        query = query.in_(col, val)
-                    else:
-                        logger.warning(
-                            f"Для оператора 'in' значение должно быть списком или строкой через запятую: {val}")
-                        continue
-                else:
-                    logger.warning(f"Неизвестный оператор фильтрации '{op}' для таблицы '{table_name}'.")
+        query = apply_filters(query, filters, table_name)
 
         # Применение сортировки
         if order_by:
             col_name, direction = order_by  # Исправлена ошибка: было dictionary вместо direction
             is_ascending = direction.lower() == 'asc'
-            query = query.order(col_name, ascending=is_ascending, nulls_first=False)
+            query = query.order(col_name, desc=not is_ascending, nullsfirst=False)
 
         # Применение лимита
-        if limit is not None:
-            query = query.limit(limit)
+        query = query.limit(limit)
 
         logger.debug(
             f"Выполнение запроса к Supabase: Таблица='{table_name}', Колонки='{select_columns}', "
             f"Фильтры={filters}, Сортировка={order_by}, Лимит={limit}")
 
-        # Выполнение запроса асинхронно
-        response: PostgrestAPIResponse = await asyncio.to_thread(query.execute)
+        # Выполнение запроса асинхронно с таймаутом
+        started = time.perf_counter()
+        response: PostgrestAPIResponse = await run_query(query, timeout)
+        elapsed_ms = (time.perf_counter() - started) * 1000
 
         # Обработка результатов запроса
         if response.data is not None:
-            logger.debug(f"Получен ответ от Supabase, количество записей: {len(response.data)}")
+            logger.info(
+                f"Запрос к '{table_name}' ({select_columns}): {len(response.data)} строк, "
+                f"{_payload_size(response.data)} байт, {elapsed_ms:.0f} мс")
             return response.data, None
         else:
             if response.error:
@@ -119,6 +234,59 @@ async def execute_supabase_query(
                 f"Ответ: {response}")
             return [], None  # Возвращаем пустой список, если нет данных, но и нет ошибки
 
+    except LimiterRejected as e:
+        logger.error(f"Запрос к Supabase (таблица {table_name}) отклонен ограничителем: {e} {db_limiter.snapshot()}")
+        return None, "База данных перегружена, попробуйте позже"
+    except asyncio.TimeoutError:
+        logger.error(f"Таймаут запроса к Supabase (таблица {table_name}) после {timeout} с")
+        return None, f"Превышено время ожидания ответа базы данных ({timeout} с)"
     except Exception as e:
         logger.error(f"Общая ошибка при запросе к Supabase (таблица {table_name}): {e}", exc_info=True)
-        return None, str(e)
\ No newline at end of file
+        return None, str(e)
+
+
+async def count_supabase_rows(
+        supabase_client: Client,
+        table_name: str,
+        filters: Optional[List[Dict[str, Any]]] = None,
+        timeout: Optional[float] = None
+) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Считает строки на стороне сервера (count=exact, head), не загружая сами данные.
+
+    Args:
+        supabase_client: Клиент Supabase
+        table_name: Имя таблицы
+        filters: Список фильтров в формате execute_supabase_query
+        timeout: Таймаут запроса в секундах (по умолчанию DB_QUERY_TIMEOUT)
+
+    Returns:
+        Кортеж (количество, ошибка) - если ошибки нет, то второй элемент None
+    """
+    if not supabase_client:
+        logger.error("Клиент Supabase не был предоставлен.")
+        return None, "Клиент Supabase не инициализирован"
+
+    if timeout is None:
+        timeout = app_settings.DB_QUERY_TIMEOUT
+
+    try:
+        query = supabase_client.table(table_name).select("*", count="exact", head=True)
+        query = apply_filters(query, filters, table_name)
+
+        started = time.perf_counter()
+        response: PostgrestAPIResponse = await run_query(query, timeout)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        logger.info(f"Подсчет строк в '{table_name}': {response.count}, {elapsed_ms:.0f} мс")
+        return response.count or 0, None
+
+    except LimiterRejected as e:
+        logger.error(f"Подсчет строк в Supabase (таблица {table_name}) отклонен ограничителем: {e} {db_limiter.snapshot()}")
+        return None, "База данных перегружена, попробуйте позже"
+    except asyncio.TimeoutError:
+        logger.error(f"Таймаут подсчета строк в Supabase (таблица {table_name}) после {timeout} с")
+        return None, f"Превышено время ожидания ответа базы данных ({timeout} с)"
+    except Exception as e:
+        logger.error(f"Ошибка при подсчете строк в Supabase (таблица {table_name}): {e}", exc_info=True)
+        return None, str(e)
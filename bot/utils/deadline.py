@@ -0,0 +1,75 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Срок текущего запроса: по нему нижние уровни (запросы к базе) ограничивают свои таймауты
+_current: ContextVar[Optional["Deadline"]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Этап не уложился в отведенную ему часть бюджета."""
+
+
+class Deadline:
+    """
+    Бюджет времени на ответ пользователю.
+
+    Создается при получении апдейта (DeadlineMiddleware) и передается по
+    конвейеру NLU → база → генерация. Каждый этап берет долю оставшегося
+    времени и выполняется через run(): по истечении доли этап отменяется
+    с DeadlineExceeded, а вызывающий код отдает лучший частичный ответ.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def wall_time(self) -> float:
+        """Момент истечения по time.time() — для заданий, которые сохраняются между перезапусками."""
+        return time.time() + self.remaining()
+
+    def share(self, fraction: float = 1.0, reserve: float = 0.0, cap: Optional[float] = None) -> float:
+        """
+        Сколько секунд может занять этап: fraction от остатка за вычетом
+        reserve (время, нужное последующим этапам), но не больше cap.
+        """
+        available = max(0.0, self.remaining() - reserve) * fraction
+        return min(available, cap) if cap is not None else available
+
+    async def run(self, awaitable: Awaitable[T], fraction: float = 1.0, reserve: float = 0.0,
+                  cap: Optional[float] = None, stage: str = "stage") -> T:
+        """Выполняет этап в пределах его доли бюджета; по истечении отменяет его и бросает DeadlineExceeded."""
+        timeout = self.share(fraction, reserve, cap)
+        if timeout <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(f"{stage}: бюджет исчерпан")
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{stage}: не уложился в {timeout:.1f} с") from None
+
+    @contextmanager
+    def scope(self) -> Iterator["Deadline"]:
+        """Делает срок текущим (current_deadline) для кода внутри блока."""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Срок запроса, внутри которого выполняется код, если он задан."""
+    return _current.get()
@@ -0,0 +1,188 @@
+import logging
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bot.utils.availability import parse_time
+from bot.utils.periods import parse_date
+from bot.utils.repository import Repository
+
+logger = logging.getLogger(__name__)
+
+# Полная пересинхронизация календаря (ловит правки и удаления, сделанные мимо бота)
+CALENDAR_FULL_REFRESH = 600
+# Время начала для мероприятий без времени: такие события идут первыми в своем дне
+_ALL_DAY = -1
+
+# (порядковый номер даты, минуты от полуночи, id)
+CalendarKey = Tuple[int, int, int]
+
+
+def _event_key(event: Dict[str, Any]) -> Optional[CalendarKey]:
+    day = parse_date(event.get("date"))
+    if day is None or event.get("id") is None:
+        return None
+    start = parse_time(event.get("time"))
+    return day.toordinal(), (start[0] * 60 + start[1]) if start else _ALL_DAY, int(event["id"])
+
+
+def _tag(value: Any) -> str:
+    return str(value).strip().lower() if value else ""
+
+
+class EventCalendar:
+    """
+    Мероприятия, отсортированные по (дата, время, id), с вторичными
+    индексами по типу и месту.
+
+    Интервалы дат, "ближайшие N" и повторяющиеся окна ("по пятницам
+    с 18 до 20") — бинарный поиск по ключам нужного индекса. Вставка
+    и удаление одного мероприятия — insort/bisect без пересборки.
+    """
+
+    def __init__(self, events: Iterable[Dict[str, Any]] = ()):
+        self._keys: List[CalendarKey] = []
+        self._events: Dict[int, Tuple[CalendarKey, Dict[str, Any]]] = {}
+        self._by_type: Dict[str, List[CalendarKey]] = {}
+        self._by_location: Dict[str, List[CalendarKey]] = {}
+        entries = [(key, event) for event in events if (key := _event_key(event))]
+        entries.sort(key=lambda entry: entry[0])
+        for key, event in entries:
+            self._events[key[2]] = (key, event)
+            self._keys.append(key)
+            self._by_type.setdefault(_tag(event.get("type")), []).append(key)
+            self._by_location.setdefault(_tag(event.get("location")), []).append(key)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # ---- Обновление ----
+
+    @staticmethod
+    def _discard(keys: List[CalendarKey], key: CalendarKey) -> None:
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+
+    def remove(self, event_id: int) -> None:
+        entry = self._events.pop(int(event_id), None)
+        if entry is None:
+            return
+        key, event = entry
+        self._discard(self._keys, key)
+        self._discard(self._by_type.get(_tag(event.get("type")), []), key)
+        self._discard(self._by_location.get(_tag(event.get("location")), []), key)
+
+    def upsert(self, event: Dict[str, Any]) -> None:
+        key = _event_key(event)
+        if key is None:
+            return
+        self.remove(key[2])
+        self._events[key[2]] = (key, event)
+        insort(self._keys, key)
+        insort(self._by_type.setdefault(_tag(event.get("type")), []), key)
+        insort(self._by_location.setdefault(_tag(event.get("location")), []), key)
+
+    # ---- Поиск ----
+
+    def _index(self, event_type: Optional[str], location: Optional[str]) -> Tuple[List[CalendarKey], Optional[str]]:
+        """Самый узкий индекс для фильтров и фильтр, который придется проверить по строкам."""
+        if event_type:
+            return self._by_type.get(_tag(event_type), []), _tag(location) or None
+        if location:
+            return self._by_location.get(_tag(location), []), None
+        return self._keys, None
+
+    def _collect(self, keys: List[CalendarKey], lo: int, hi: int, location: Optional[str],
+                 limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        result = []
+        for key in keys[lo:hi]:
+            event = self._events[key[2]][1]
+            if location and _tag(event.get("location")) != location:
+                continue
+            result.append(event)
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    def between(self, start: date, end: date, event_type: Optional[str] = None,
+                location: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Мероприятия с датой в [start, end] по возрастанию даты и времени."""
+        keys, location = self._index(event_type, location)
+        lo = bisect_left(keys, (start.toordinal(), _ALL_DAY - 1, 0))
+        hi = bisect_left(keys, (end.toordinal() + 1, _ALL_DAY - 1, 0))
+        return self._collect(keys, lo, hi, location)
+
+    def upcoming(self, n: int, start: Optional[date] = None, event_type: Optional[str] = None,
+                 location: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Ближайшие n мероприятий начиная с даты start (по умолчанию — сегодня)."""
+        keys, location = self._index(event_type, location)
+        lo = bisect_left(keys, ((start or date.today()).toordinal(), _ALL_DAY - 1, 0))
+        return self._collect(keys, lo, len(keys), location, limit=n)
+
+    def recurring(self, weekday: int, start_minutes: int, end_minutes: int, start: date, end: date,
+                  event_type: Optional[str] = None, location: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Мероприятия в повторяющемся окне: день недели weekday (0 — понедельник)
+        с start_minutes до end_minutes, для всех недель интервала [start, end].
+        """
+        keys, location = self._index(event_type, location)
+        day = start + timedelta(days=(weekday - start.weekday()) % 7)
+        result = []
+        while day <= end:
+            ordinal = day.toordinal()
+            lo = bisect_left(keys, (ordinal, start_minutes, 0))
+            hi = bisect_right(keys, (ordinal, end_minutes, float("inf")))
+            result.extend(self._collect(keys, lo, hi, location))
+            day += timedelta(days=7)
+        return result
+
+
+class EventCalendarService:
+    """
+    Календарь поверх репозитория.
+
+    Вставленные и измененные через репозиторий мероприятия применяются к
+    календарю по одному (upsert). Если измененные строки неизвестны
+    (запись в другом воркере), календарь пересобирается при следующем
+    обращении; кроме того, он пересобирается раз в CALENDAR_FULL_REFRESH
+    секунд.
+    """
+
+    def __init__(self, repository: Repository):
+        self.repository = repository
+        self.calendar: Optional[EventCalendar] = None
+        self._loaded_at = 0.0
+        self._stale = False
+        repository.subscribe_rows("events", self._apply)
+
+    @classmethod
+    def for_repository(cls, repository: Repository) -> "EventCalendarService":
+        return repository.service("event_calendar", cls)
+
+    def _apply(self, rows: Optional[List[Dict[str, Any]]]) -> None:
+        if rows is None or self.calendar is None or self._stale:
+            self._stale = self.calendar is not None
+            return
+        for event in rows:
+            self.calendar.upsert(event)
+        logger.info(f"Календарь мероприятий обновлен: {len(rows)} событий")
+
+    async def _fetch(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        async for page in self.repository.iter_pages("events"):
+            rows.extend(page)
+        return rows
+
+    async def get(self) -> Optional[EventCalendar]:
+        try:
+            if self.calendar is None or self._stale or time.monotonic() - self._loaded_at > CALENDAR_FULL_REFRESH:
+                self._stale = False
+                self.calendar = EventCalendar(await self._fetch())
+                self._loaded_at = time.monotonic()
+                logger.info(f"Календарь мероприятий загружен: {len(self.calendar)} событий")
+        except RuntimeError as e:
+            self._stale = self.calendar is not None
+            logger.error(f"Не удалось обновить календарь мероприятий: {e}")
+        return self.calendar
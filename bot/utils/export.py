@@ -0,0 +1,129 @@
+import asyncio
+import csv
+import io
+import logging
+import tempfile
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, IO, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from bot.utils.repository import Repository
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX-экспорт необязателен
+    Workbook = None
+
+logger = logging.getLogger(__name__)
+
+# Колонки выгрузки по таблицам
+EXPORT_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "employees": ("id", "name", "job_title", "department", "phone_number", "hire_date", "education",
+                  "birthday", "projects", "skills"),
+    "events": ("id", "title", "description", "date", "time", "location", "type", "organizer_id", "participants"),
+    "tasks": ("id", "title", "description", "assignee_id", "due_date", "status", "priority", "project"),
+}
+EXPORT_FORMATS = ("csv", "xlsx")
+
+# Строк на одну страницу выгрузки из Supabase
+EXPORT_PAGE_SIZE = 500
+# До какого размера файл держится в памяти, дальше — во временном файле на диске
+EXPORT_SPOOL_MAX_BYTES = 1024 * 1024
+
+ProgressCallback = Callable[[int], Awaitable[None]]
+
+
+def xlsx_available() -> bool:
+    return Workbook is not None
+
+
+def _cell(value: Any) -> Any:
+    """Приводит значение из Supabase к виду, пригодному для ячейки."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "; ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return str(value)
+    return value
+
+
+def _to_cells(rows: Iterable[Dict[str, Any]], columns: Tuple[str, ...]) -> Iterable[List[Any]]:
+    for row in rows:
+        yield [_cell(row.get(column)) for column in columns]
+
+
+async def export_table(
+        repository: Repository,
+        table: str,
+        fmt: str = "csv",
+        progress: Optional[ProgressCallback] = None,
+) -> Tuple[IO[bytes], int]:
+    """
+    Выгружает таблицу постранично в SpooledTemporaryFile.
+
+    В памяти одновременно находится только одна страница строк; сам файл
+    уходит на диск, как только превысит EXPORT_SPOOL_MAX_BYTES.
+
+    Args:
+        repository: Репозиторий данных
+        table: Имя таблицы (employees, events, tasks)
+        fmt: Формат файла (csv или xlsx)
+        progress: Асинхронный callback(количество_выгруженных_строк) после каждой страницы
+
+    Returns:
+        Кортеж (файл, перемотанный в начало; количество строк)
+    """
+    columns = EXPORT_COLUMNS[table]
+    select = ", ".join(columns)
+    spooled = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    total = 0
+
+    try:
+        if fmt == "xlsx":
+            if Workbook is None:
+                raise RuntimeError("XLSX-экспорт недоступен: не установлен openpyxl")
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet(table)
+            sheet.append(list(columns))
+            async for page in repository.iter_pages(table, select, page_size=EXPORT_PAGE_SIZE):
+                for cells in _to_cells(page, columns):
+                    sheet.append(cells)
+                total += len(page)
+                if progress:
+                    await progress(total)
+            # Сборка и сжатие XLSX занимают секунды на больших таблицах — не держим event loop
+            await asyncio.to_thread(workbook.save, spooled)
+        else:
+            # utf-8-sig — чтобы Excel корректно открывал кириллицу
+            text = io.TextIOWrapper(spooled, encoding="utf-8-sig", newline="")
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            async for page in repository.iter_pages(table, select, page_size=EXPORT_PAGE_SIZE):
+                writer.writerows(_to_cells(page, columns))
+                total += len(page)
+                if progress:
+                    await progress(total)
+            text.flush()
+            text.detach()  # не закрываем spooled вместе с оберткой
+    except Exception:
+        spooled.close()
+        raise
+
+    spooled.seek(0)
+    logger.info(f"Экспорт '{table}' в {fmt}: {total} строк")
+    return spooled, total
+
+
+class SpooledInputFile(InputFile):
+    """Файл для отправки в Telegram, читаемый из открытого файлового объекта кусками."""
+
+    def __init__(self, file: IO[bytes], filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сколько независимых подзапросов одного пользовательского запроса выполняется одновременно
+DEFAULT_FANOUT_LIMIT = 4
+
+# Операторы, для которых несколько значений сливаются в один фильтр PostgREST
+_MERGEABLE_OPERATORS = {
+    "eq": "in",
+    "ilike": "ilike_any",
+}
+
+
+def multi_value_filter(column: str, operator: str, values: Sequence[Any]) -> Optional[Dict[str, Any]]:
+    """
+    Строит один фильтр для нескольких значений сущности.
+
+    Одно значение дает обычный фильтр; несколько значений для eq/ilike
+    сливаются в `in` / `or=(...)`, чтобы обойтись одним запросом.
+
+    Args:
+        column: Колонка
+        operator: Оператор для одного значения (eq, ilike, ...)
+        values: Значения сущности
+
+    Returns:
+        Фильтр в формате execute_supabase_query или None, если значений нет
+    """
+    values = [v.strip("%") if isinstance(v, str) else v for v in values]
+    if not values:
+        return None
+    if len(values) == 1:
+        return {"column": column, "operator": operator, "value": values[0]}
+    merged = _MERGEABLE_OPERATORS.get(operator)
+    if merged is None:
+        raise ValueError(f"Оператор '{operator}' не поддерживает слияние нескольких значений")
+    return {"column": column, "operator": merged, "value": list(values)}
+
+
+async def gather_bounded(
+        factories: Iterable[Callable[[], Awaitable[T]]],
+        limit: int = DEFAULT_FANOUT_LIMIT
+) -> List[T]:
+    """
+    Выполняет независимые корутины параллельно, но не более `limit` одновременно.
+
+    Args:
+        factories: Фабрики корутин (вызываются только при наличии свободного слота)
+        limit: Максимальное число одновременно выполняемых корутин
+
+    Returns:
+        Результаты в порядке фабрик
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await factory()
+
+    return list(await asyncio.gather(*(run(factory) for factory in factories)))
+
+
+def merge_rows(results: Iterable[Optional[List[Dict[str, Any]]]], key: str = "id") -> List[Dict[str, Any]]:
+    """
+    Объединяет результаты подзапросов, убирая дубликаты по ключу.
+
+    Строки без ключа сравниваются целиком. Порядок первого появления сохраняется.
+    """
+    merged: List[Dict[str, Any]] = []
+    seen = set()
+    for rows in results:
+        for row in rows or []:
+            marker = row.get(key)
+            if marker is None:
+                marker = tuple(sorted((k, repr(v)) for k, v in row.items()))
+            if marker in seen:
+                continue
+            seen.add(marker)
+            merged.append(row)
+    return merged
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from bot.utils.cache import SharedVersions
+from bot.utils.repository import Repository
+
+logger = logging.getLogger(__name__)
+
+# Как часто (секунды) воркер проверяет изменения, сделанные другими воркерами
+INVALIDATION_POLL_INTERVAL = 1.0
+
+
+class InvalidationRelay:
+    """
+    Передает сброс кешей таблиц между процессами-воркерами.
+
+    Запись через репозиторий одного воркера увеличивает версию таблицы в
+    общем файле SQLite; остальные воркеры раз в INVALIDATION_POLL_INTERVAL
+    секунд сравнивают версии и вызывают у себя Repository.invalidate.
+    Хранилища, календарь и материализованные ответы других шардов
+    отстают от записи не больше чем на этот интервал.
+    """
+
+    def __init__(self, repository: Repository, path: str, interval: float = INVALIDATION_POLL_INTERVAL):
+        self.repository = repository
+        self.versions = SharedVersions(path)
+        self.interval = interval
+        self._seen: Dict[str, int] = {}
+        self._pending: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        repository.publish(self._publish)
+
+    def _publish(self, table: str) -> None:
+        task = asyncio.ensure_future(self._bump(table))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _bump(self, table: str) -> None:
+        try:
+            version = await asyncio.to_thread(self.versions.bump, table)
+        except Exception as e:
+            logger.error(f"Не удалось опубликовать изменение таблицы '{table}': {e}")
+            return
+        # Свое изменение уже применено локально — не сбрасываем кеш повторно
+        self._seen[table] = max(self._seen.get(table, 0), version)
+
+    async def poll(self) -> None:
+        for table, version in (await asyncio.to_thread(self.versions.snapshot)).items():
+            if version > self._seen.get(table, 0):
+                self._seen[table] = version
+                logger.debug(f"Таблица '{table}' изменена другим воркером (версия {version})")
+                self.repository.invalidate(table, remote=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Ошибка проверки изменений других воркеров: {e}")
+
+    async def start(self) -> None:
+        # Изменения до запуска воркера не важны: его хранилища еще пусты
+        self._seen = await asyncio.to_thread(self.versions.snapshot)
+        self._task = asyncio.create_task(self._run(), name="invalidation-relay")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
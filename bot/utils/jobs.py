@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.types import ReplyParameters
+from aiogram.utils.chat_action import ChatActionSender
+
+from bot.config import app_settings
+from bot.utils.deadline import Deadline
+from bot.utils.outbound import get_outbound
+
+logger = logging.getLogger(__name__)
+
+# Задания старше этого (секунды) после перезапуска не восстанавливаются — ответ уже не ждут
+RESTORE_MAX_AGE = 600
+# Запас сверх срока задания: runner сам укладывается в Deadline и отдает частичный ответ,
+# жесткий таймаут нужен только для runner'ов, которые срок не соблюдают
+DEADLINE_GRACE = 2.0
+
+TIMEOUT_MESSAGE = "⌛ Не успел подготовить ответ вовремя. Попробуйте переформулировать запрос или повторить позже."
+FAILED_MESSAGE = "Извините, произошла ошибка при формировании ответа. Попробуйте позже или обратитесь к администратору."
+BUSY_MESSAGE = "⏳ Сейчас много запросов, попробуйте через минуту."
+
+
+@dataclass
+class Job:
+    """Запрос пользователя, который обрабатывается в фоне; сериализуется для сохранения при остановке."""
+    chat_id: int
+    user_id: int
+    text: str
+    message_id: Optional[int] = None
+    submitted_at: float = field(default_factory=time.time)
+    deadline_at: Optional[float] = None  # срок ответа (time.time()), заведенный при получении апдейта
+    bot_id: Optional[int] = None  # бот, получивший запрос (None — основной)
+
+    @property
+    def owner(self) -> Tuple[Optional[int], int, int]:
+        return self.bot_id, self.chat_id, self.user_id
+
+
+JobRunner = Callable[[Job, Deadline], Awaitable[Optional[str]]]
+
+
+class JobExecutor:
+    """
+    Ограниченный пул фоновых заданий для долгих AI-запросов.
+
+    Обработчик ставит задание и сразу освобождает диспетчер; пока задание
+    ждет и выполняется, в чате показывается «печатает...». У каждого
+    задания есть срок (deadline секунд с момента постановки или более ранний
+    deadline_at задания), runner получает его как Deadline; ответ уходит
+    через исходящую очередь. Новое задание пользователя в том же чате
+    отменяет его предыдущее (supersede). При остановке executor
+    дорабатывает задания drain_timeout секунд, а невыполненные сохраняет в
+    файл и выполняет после запуска.
+
+    Один executor может обслуживать несколько ботов процесса (attach): пул
+    воркеров и лимит одновременных обращений к модели у них общий.
+    """
+
+    def __init__(self, bot: Bot, runner: JobRunner, workers: int = 8, max_queue: int = 100,
+                 deadline: float = 60.0, persist_path: Optional[str] = None, supersede: bool = True,
+                 drain_timeout: float = 20.0):
+        self.bot = bot
+        self.bots: Dict[int, Bot] = {bot.id: bot}
+        self.runner = runner
+        self.workers = workers
+        self.deadline = deadline
+        self.drain_timeout = drain_timeout
+        self.persist_path = persist_path
+        self.supersede = supersede
+        self.stats: Dict[str, int] = {
+            "submitted": 0, "completed": 0, "failed": 0, "timed_out": 0,
+            "superseded": 0, "rejected": 0, "restored": 0,
+        }
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max_queue)
+        self._latest: Dict[Tuple[int, int], Job] = {}
+        self._running: Dict[Tuple[int, int], Tuple[Job, asyncio.Task]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._interrupted: List[Job] = []
+        self._accepting = False
+
+    def attach(self, bot: Bot) -> None:
+        """Подключает еще одного бота: его задания выполняются тем же пулом."""
+        self.bots[bot.id] = bot
+
+    def _bot_for(self, job: Job) -> Optional[Bot]:
+        return self.bot if job.bot_id is None else self.bots.get(job.bot_id)
+
+    def submit(self, job: Job) -> bool:
+        """Ставит задание в очередь; False, если очередь переполнена или executor останавливается."""
+        if not self._accepting:
+            return False
+        if self._bot_for(job) is None:
+            logger.warning(f"Задание бота {job.bot_id} пропущено: бот не подключен к executor")
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            logger.warning(f"Очередь заданий переполнена, запрос из чата {job.chat_id} отклонен")
+            return False
+        self.stats["submitted"] += 1
+        if self.supersede:
+            self._latest[job.owner] = job
+            running = self._running.get(job.owner)
+            if running is not None and not running[1].done():
+                self.stats["superseded"] += 1
+                running[1].cancel()
+        # Мгновенная реакция: «печатает...» до того, как задание дойдет до воркера
+        asyncio.create_task(self._ack(job))
+        return True
+
+    async def _ack(self, job: Job) -> None:
+        try:
+            await self._bot_for(job).send_chat_action(job.chat_id, "typing")
+        except Exception as e:
+            logger.debug(f"Не удалось отправить chat action в чат {job.chat_id}: {e}")
+
+    def _deliver(self, job: Job, text: str) -> None:
+        kwargs = {}
+        if job.message_id and job.chat_id < 0:
+            # В группе отвечаем реплаем, чтобы было видно, на какой вопрос ответ
+            kwargs["reply_parameters"] = ReplyParameters(message_id=job.message_id, allow_sending_without_reply=True)
+        bot = self._bot_for(job)
+        sender = get_outbound(bot)
+        if sender is not None:
+            sender.send(job.chat_id, text, **kwargs)
+        else:
+            asyncio.create_task(bot.send_message(job.chat_id, text, **kwargs))
+
+    def _is_stale(self, job: Job) -> bool:
+        return self.supersede and self._latest.get(job.owner) is not job
+
+    async def _execute(self, job: Job) -> None:
+        expires_at = job.submitted_at + self.deadline
+        if job.deadline_at is not None:
+            expires_at = min(expires_at, job.deadline_at)
+        remaining = expires_at - time.time()
+        if self._is_stale(job):
+            self.stats["superseded"] += 1
+            return
+        if remaining <= 0:
+            self.stats["timed_out"] += 1
+            self._deliver(job, TIMEOUT_MESSAGE)
+            return
+        async with ChatActionSender.typing(bot=self._bot_for(job), chat_id=job.chat_id):
+            runner = self.runner(job, Deadline(remaining))
+            task = asyncio.create_task(asyncio.wait_for(runner, timeout=remaining + DEADLINE_GRACE))
+            self._running[job.owner] = (job, task)
+            try:
+                result = await task
+            except asyncio.TimeoutError:
+                self.stats["timed_out"] += 1
+                logger.warning(f"Задание из чата {job.chat_id} не уложилось в {self.deadline} с")
+                self._deliver(job, TIMEOUT_MESSAGE)
+                return
+            except asyncio.CancelledError:
+                if task.cancelled() and self._is_stale(job):
+                    return
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Ошибка задания из чата {job.chat_id}: {e}", exc_info=True)
+                self._deliver(job, FAILED_MESSAGE)
+                return
+            finally:
+                if self._running.get(job.owner, (None,))[0] is job:
+                    del self._running[job.owner]
+        self.stats["completed"] += 1
+        if self._is_stale(job):
+            return
+        if result:
+            self._deliver(job, result)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                # Остановка: невыполненное задание будет сохранено
+                self._interrupted.append(job)
+                raise
+            finally:
+                if self._latest.get(job.owner) is job:
+                    del self._latest[job.owner]
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._worker(), name=f"job-{i}") for i in range(self.workers)]
+        for job in self._restore():
+            self.submit(job)
+            self.stats["restored"] += 1
+
+    async def stop(self, drain_timeout: Optional[float] = None) -> None:
+        """Перестает принимать задания, ждет текущие не дольше drain_timeout, остальные сохраняет."""
+        drain_timeout = self.drain_timeout if drain_timeout is None else drain_timeout
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Задания не завершены за {drain_timeout} с, сохраняю невыполненные")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        pending, self._interrupted = self._interrupted, []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._persist(pending)
+        logger.info(f"Фоновые задания остановлены: {self.stats}")
+
+    def _persist(self, jobs: List[Job]) -> None:
+        if not self.persist_path:
+            if jobs:
+                logger.warning(f"Потеряно невыполненных заданий: {len(jobs)} (сохранение не настроено)")
+            return
+        with open(self.persist_path, "w", encoding="utf-8") as f:
+            json.dump([asdict(job) for job in jobs], f, ensure_ascii=False)
+        if jobs:
+            logger.info(f"Сохранено невыполненных заданий: {len(jobs)}")
+
+    def _restore(self) -> List[Job]:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return []
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                saved = [Job(**item) for item in json.load(f)]
+            os.remove(self.persist_path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Не удалось прочитать сохраненные задания: {e}")
+            return []
+        now = time.time()
+        jobs = []
+        for job in saved:
+            if now - job.submitted_at > RESTORE_MAX_AGE:
+                continue
+            # Срок отсчитывается заново: время простоя бота не должно съедать его
+            job.submitted_at = now
+            job.deadline_at = None
+            jobs.append(job)
+        if jobs:
+            logger.info(f"Восстановлено заданий после перезапуска: {len(jobs)} из {len(saved)}")
+        return jobs
+
+
+def setup_jobs(bots: Sequence[Bot], runner: JobRunner, worker: Optional[int] = None) -> JobExecutor:
+    """
+    Создает и запускает общий executor фоновых заданий ботов процесса и
+    привязывает его к каждому из них (bot.jobs).
+
+    В режиме нескольких процессов у каждого воркера свой файл невыполненных
+    заданий: чаты закреплены за воркерами, поэтому задания вернутся туда же.
+    """
+    persist_path = app_settings.JOBS_PENDING_PATH
+    if persist_path and worker is not None:
+        persist_path = f"{persist_path}.{worker}"
+    executor = JobExecutor(
+        bots[0], runner,
+        workers=app_settings.JOB_WORKERS,
+        max_queue=app_settings.JOB_QUEUE_MAX,
+        deadline=app_settings.JOB_DEADLINE,
+        persist_path=persist_path,
+        # Новый вопрос пользователя в том же чате отменяет его незавершенный предыдущий
+        supersede=app_settings.THROTTLE_CANCEL_STALE,
+        drain_timeout=app_settings.JOB_DRAIN_TIMEOUT,
+    )
+    for bot in bots[1:]:
+        executor.attach(bot)
+    # Подключаем всех ботов до start(): восстановленные задания должны найти своего бота
+    executor.start()
+    for bot in bots:
+        bot.jobs = executor
+    return executor
+
+
+def get_jobs(bot) -> Optional[JobExecutor]:
+    """Возвращает executor фоновых заданий, привязанный к боту при запуске (bot.jobs)."""
+    return getattr(bot, "jobs", None)
@@ -0,0 +1,177 @@
+import heapq
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bot.utils.repository import Repository
+from bot.utils.row_store import RowStore
+
+logger = logging.getLogger(__name__)
+
+# Поля профиля, из которых строится маска интересов сотрудника
+PROFILE_FIELDS = ("skills", "projects", "interests")
+
+Profile = Tuple[str, ...]
+
+
+def _normalize(term: Any) -> str:
+    return " ".join(str(term).lower().replace("ё", "е").split())
+
+
+def profile_terms(employee: Dict[str, Any]) -> Profile:
+    """Термины профиля вида "skills:python", "projects:crm" без повторов, в стабильном порядке."""
+    terms = []
+    for field in PROFILE_FIELDS:
+        values = employee.get(field) or []
+        if isinstance(values, str):
+            values = values.split(",")
+        for value in values:
+            term = _normalize(value)
+            if term and f"{field}:{term}" not in terms:
+                terms.append(f"{field}:{term}")
+    return tuple(sorted(terms))
+
+
+class LunchMatcher:
+    """
+    Подбор коллег по общим навыкам, проектам и интересам.
+
+    Профиль сотрудника — битовая маска (int) над словарем терминов, поэтому
+    пересечение с запросом — одно `&` и подсчет единиц (Жаккар:
+    |A ∩ B| / |A ∪ B|), а память растет с числом терминов в профилях, а не
+    с произведением сотрудников на термины. Изменение одного профиля
+    перезаписывает одну маску; top-k выбирается через heapq.
+    """
+
+    def __init__(self):
+        self._masks: Dict[Any, int] = {}
+        self._sizes: Dict[Any, int] = {}
+        self._terms: Dict[str, int] = {}
+        self._term_names: List[str] = []
+        self.profiles: Dict[Any, Profile] = {}
+        self.employees: Dict[Any, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    # ---- Обновление ----
+
+    def _term_bit(self, term: str) -> int:
+        bit = self._terms.get(term)
+        if bit is None:
+            bit = self._terms[term] = len(self._term_names)
+            self._term_names.append(term)
+        return bit
+
+    def _mask(self, terms: Iterable[str]) -> int:
+        mask = 0
+        for term in terms:
+            mask |= 1 << self._term_bit(term)
+        return mask
+
+    def upsert(self, employee: Dict[str, Any]) -> bool:
+        """Добавляет или обновляет профиль. Returns: True, если профиль изменился."""
+        employee_id = employee.get("id")
+        if employee_id is None:
+            return False
+        terms = profile_terms(employee)
+        self.employees[employee_id] = employee
+        if self.profiles.get(employee_id) == terms:
+            return False
+        self._masks[employee_id] = self._mask(terms)
+        self._sizes[employee_id] = len(terms)
+        self.profiles[employee_id] = terms
+        return True
+
+    def remove(self, employee_id: Any) -> None:
+        self._masks.pop(employee_id, None)
+        self._sizes.pop(employee_id, None)
+        self.profiles.pop(employee_id, None)
+        self.employees.pop(employee_id, None)
+
+    def sync(self, employees: Iterable[Dict[str, Any]]) -> int:
+        """Приводит матчер к переданному списку сотрудников. Returns: сколько профилей изменилось."""
+        seen = set()
+        changed = 0
+        for employee in employees:
+            seen.add(employee.get("id"))
+            changed += self.upsert(employee)
+        for employee_id in [employee_id for employee_id in self._masks if employee_id not in seen]:
+            self.remove(employee_id)
+            changed += 1
+        return changed
+
+    # ---- Поиск ----
+
+    def _query_mask(self, terms: Sequence[str]) -> int:
+        mask = 0
+        for term in terms:
+            bit = self._terms.get(term)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def _top_k(self, query: int, size: float, k: int, exclude: Any = None) -> List[Tuple[Any, float]]:
+        if not query or size == 0:
+            return []
+        scored = []
+        for employee_id, mask in self._masks.items():
+            common = mask & query
+            if not common or employee_id == exclude:
+                continue
+            # Несколько терминов могут отвечать одному интересу — пересечение не больше размера запроса
+            intersection = min(common.bit_count(), size)
+            union = self._sizes[employee_id] + size - intersection
+            scored.append((employee_id, intersection / union))
+        return heapq.nlargest(k, scored, key=lambda item: item[1])
+
+    def similar_to(self, employee_id: Any, k: int = 5) -> List[Tuple[Any, float]]:
+        """Top-k коллег с наиболее похожим профилем (без самого сотрудника)."""
+        mask = self._masks.get(employee_id)
+        if mask is None:
+            return []
+        return self._top_k(mask, float(self._sizes[employee_id]), k, exclude=employee_id)
+
+    def by_interests(self, interests: Sequence[str], k: int = 5) -> List[Tuple[Any, float]]:
+        """
+        Top-k сотрудников по свободным интересам ("python", "настольные игры").
+
+        Каждый интерес сопоставляется с терминами любого поля профиля, в т.ч.
+        по вхождению подстроки ("игры" найдет "interests:настольные игры").
+        """
+        wanted = [_normalize(interest) for interest in interests if _normalize(interest)]
+        terms = [
+            term for term in self._term_names
+            if any(interest in term.split(":", 1)[1] for interest in wanted)
+        ]
+        if not terms:
+            return []
+        # Размер запроса — число интересов, а не найденных терминов: синонимы не штрафуются
+        return self._top_k(self._query_mask(terms), float(len(wanted)), k)
+
+    def shared_terms(self, employee_id: Any, terms: Sequence[str]) -> List[str]:
+        """Общие с запросом термины сотрудника без префикса поля (для ответа пользователю)."""
+        profile = set(self.profiles.get(employee_id, ()))
+        return [term.split(":", 1)[1] for term in terms if term in profile]
+
+
+class LunchMatcherService:
+    """Матчер поверх репозитория; при перезагрузке employees применяет только изменившиеся профили."""
+
+    def __init__(self, repository: Repository):
+        self.repository = repository
+        self.matcher = LunchMatcher()
+        self._source: Optional[RowStore] = None
+
+    @classmethod
+    def for_repository(cls, repository: Repository) -> "LunchMatcherService":
+        return repository.service("lunch_matcher", cls)
+
+    async def get(self) -> Optional[LunchMatcher]:
+        store = await self.repository.load_store("employees")
+        if store is None:
+            return self.matcher if len(self.matcher) else None
+        if store is not self._source:
+            changed = self.matcher.sync(row.to_dict() for row in store)
+            self._source = store
+            logger.info(f"Матчер обеда обновлен: {changed} профилей изменилось, всего {len(self.matcher)}")
+        return self.matcher
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Pattern, Tuple
+
+from bot.config import app_settings
+from bot.utils.birthday_index import BirthdayService
+from bot.utils.event_calendar import EventCalendarService
+from bot.utils.periods import parse_date, resolve_period
+from bot.utils.repository import Repository
+from bot.utils.sql_templates import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Вступительные слова, с которых обычно начинаются типовые вопросы
+_LEAD = r"(?:(?:какие|какой|покажи|показать|список|скажи|у кого|кто|что|есть ли|есть|ли|сегодня|пожалуйста)\s+)*"
+
+# Результат вычисления ответа: данные и готовый текст
+Computed = Tuple[Any, str]
+ComputeFn = Callable[[Repository, Optional[int]], Awaitable[Computed]]
+
+
+@dataclass(frozen=True)
+class AnswerSpec:
+    """Типовой вопрос с заранее вычисляемым ответом."""
+    name: str
+    pattern: Pattern[str]
+    tables: Tuple[str, ...]
+    compute: ComputeFn
+    # Ответ свой у каждого пользователя: считается при первом обращении, а не по расписанию
+    per_user: bool = False
+
+
+@dataclass
+class AnswerStats:
+    hits: int = 0
+    refreshes: int = 0
+    refresh_ms: float = 0.0
+
+    @property
+    def avg_refresh_ms(self) -> float:
+        return self.refresh_ms / self.refreshes if self.refreshes else 0.0
+
+    @property
+    def worth_keeping(self) -> bool:
+        # Выгодно, если на одно пересчитывание приходится хотя бы одно обращение
+        return self.hits >= self.refreshes
+
+
+@dataclass
+class AnswerEntry:
+    data: Any
+    text: str
+    computed_at: float = field(default_factory=time.monotonic)
+    day: date = field(default_factory=date.today)
+
+
+# ---- Вычисление ответов ----
+
+def _format_event(event: Dict[str, Any]) -> str:
+    day = parse_date(event.get("date"))
+    when = f"{day:%d.%m}" if day else str(event.get("date", ""))
+    if event.get("time"):
+        when += f" {str(event['time'])[:5]}"
+    location = f" ({event['location']})" if event.get("location") else ""
+    return f"- {when} — {event.get('title', 'Без названия')}{location}"
+
+
+async def _events_this_week(repository: Repository, _user_id: Optional[int]) -> Computed:
+    calendar = await EventCalendarService.for_repository(repository).get()
+    if calendar is None:
+        raise RuntimeError("календарь мероприятий недоступен")
+    start, end = resolve_period("this_week")
+    events = calendar.between(start, end)
+    if not events:
+        return events, "На этой неделе мероприятий не запланировано."
+    return events, "📅 Мероприятия на этой неделе:\n" + "\n".join(_format_event(event) for event in events)
+
+
+async def _birthdays_today(repository: Repository, _user_id: Optional[int]) -> Computed:
+    service = BirthdayService.for_repository(repository)
+    today = date.today()
+    return await service.between(today, today), await service.daily_digest(today)
+
+
+async def _my_tasks_today(repository: Repository, user_id: Optional[int]) -> Computed:
+    employees, tasks = await asyncio.gather(repository.load_store("employees"), repository.load_store("tasks"))
+    if employees is None or tasks is None:
+        raise RuntimeError("не удалось загрузить сотрудников или задачи")
+    # Задачи, созданные ботом, назначаются на Telegram ID, остальные — на id сотрудника
+    assignees = {user_id} | {row["id"] for row in employees.view().where("telegram_id", user_id)}
+    today = date.today()
+    mine = [
+        row.to_dict()
+        for assignee in assignees
+        for row in tasks.view().where("assignee_id", assignee)
+        if row.get("status") != "completed" and parse_date(row.get("due_date")) == today
+    ]
+    if not mine:
+        return mine, "На сегодня у вас нет открытых задач."
+    lines = [f"- {task.get('title', 'Без названия')} [{task.get('priority', 'N/A')}, {task.get('status', 'N/A')}]"
+             for task in mine]
+    return mine, "📝 Ваши задачи на сегодня:\n" + "\n".join(lines)
+
+
+ANSWER_SPECS: Tuple[AnswerSpec, ...] = (
+    AnswerSpec(
+        "events_this_week",
+        re.compile(_LEAD + r"мероприяти[яей]\s+(?:запланированы\s+|будут\s+)?на\s+(?:этой|текущей)\s+неделе"),
+        ("events",),
+        _events_this_week,
+    ),
+    AnswerSpec(
+        "birthdays_today",
+        re.compile(_LEAD + r"(?:дни|день)\s+рождени[яе](?:\s+сегодня)?"),
+        ("employees",),
+        _birthdays_today,
+    ),
+    AnswerSpec(
+        "my_tasks_today",
+        re.compile(_LEAD + r"(?:мои\s+)?задачи\s+на\s+сегодня"),
+        ("tasks", "employees"),
+        _my_tasks_today,
+        per_user=True,
+    ),
+)
+
+
+class MaterializedAnswers:
+    """
+    Заранее вычисленные ответы на самые частые вопросы.
+
+    Вопрос сопоставляется с шаблоном до NLU, поэтому совпавший запрос
+    обходится без обращений к модели и к базе. Общие ответы пересчитываются
+    по расписанию и в полночь, ответы конкретного пользователя — при первом
+    обращении. Изменение зависимой таблицы сбрасывает ответы, построенные на ней.
+    """
+
+    def __init__(self, repository: Repository, specs: Tuple[AnswerSpec, ...] = ANSWER_SPECS,
+                 refresh_interval: float = app_settings.MATERIALIZED_REFRESH_INTERVAL):
+        self.repository = repository
+        self.specs = {spec.name: spec for spec in specs}
+        self.refresh_interval = refresh_interval
+        self.stats: Dict[str, AnswerStats] = {name: AnswerStats() for name in self.specs}
+        self._entries: Dict[Tuple[str, Optional[int]], AnswerEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+        for table in {table for spec in specs for table in spec.tables}:
+            repository.subscribe(table, self.invalidate_table)
+
+    @classmethod
+    def for_repository(cls, repository: Repository) -> "MaterializedAnswers":
+        return repository.service("materialized_answers", cls)
+
+    def match(self, question: str) -> Optional[AnswerSpec]:
+        text = normalize_question(question).rstrip(".").strip()
+        for spec in self.specs.values():
+            if spec.pattern.fullmatch(text):
+                return spec
+        return None
+
+    def invalidate_table(self, table: str) -> None:
+        names = {name for name, spec in self.specs.items() if table in spec.tables}
+        for key in [key for key in self._entries if key[0] in names]:
+            del self._entries[key]
+
+    async def refresh(self, spec: AnswerSpec, user_id: Optional[int] = None) -> Optional[AnswerEntry]:
+        started = time.perf_counter()
+        try:
+            data, text = await spec.compute(self.repository, user_id)
+        except Exception as e:
+            logger.error(f"Не удалось вычислить ответ '{spec.name}': {e}", exc_info=True)
+            return None
+        stats = self.stats[spec.name]
+        stats.refreshes += 1
+        stats.refresh_ms += (time.perf_counter() - started) * 1000
+        entry = self._entries[(spec.name, user_id if spec.per_user else None)] = AnswerEntry(data, text)
+        return entry
+
+    async def answer(self, question: str, user_id: Optional[int] = None) -> Optional[str]:
+        """Готовый ответ на вопрос или None, если вопрос не из числа типовых."""
+        spec = self.match(question)
+        if spec is None:
+            return None
+        entry = self._entries.get((spec.name, user_id if spec.per_user else None))
+        if entry is None or entry.day != date.today():
+            entry = await self.refresh(spec, user_id)
+            if entry is None:
+                return None
+        self.stats[spec.name].hits += 1
+        return entry.text
+
+    async def refresh_all(self) -> None:
+        """Пересчитывает общие ответы; пользовательские сбрасываются и считаются при обращении."""
+        for key in [key for key in self._entries if key[1] is not None]:
+            del self._entries[key]
+        for spec in self.specs.values():
+            if not spec.per_user:
+                await self.refresh(spec)
+
+    def report(self) -> str:
+        lines = ["Заранее вычисленные ответы (обращения / пересчеты / средняя стоимость пересчета):"]
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].hits, reverse=True):
+            verdict = "выгодно" if stats.worth_keeping else "не окупается"
+            lines.append(f"- {name}: {stats.hits} / {stats.refreshes} / {stats.avg_refresh_ms:.0f} мс — {verdict}")
+        return "\n".join(lines)
+
+    # ---- Расписание ----
+
+    def _seconds_until_next_run(self) -> float:
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return max(1.0, min(self.refresh_interval, (midnight - now).total_seconds()))
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh_all()
+            logger.info(self.report())
+            await asyncio.sleep(self._seconds_until_next_run())
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="materialized-answers")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from bot.config import app_settings
+from bot.tenants import profile_path
+from bot.utils.availability import parse_time
+from bot.utils.birthday_index import BirthdayService
+from bot.utils.event_calendar import EventCalendarService
+from bot.utils.outbound import MAX_RETRY_AFTER_WAIT, get_outbound
+from bot.utils.periods import parse_date
+from bot.utils.rate_limit import KeyedTokenBuckets, TokenBucket
+from bot.utils.repository import Repository
+from bot.utils.row_store import RowStore
+from bot.utils.timing_wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+# Как часто пересобирать план напоминаний (и сразу после изменения таблиц)
+PLAN_INTERVAL = 600
+# Сколько дней помнить доставленные уведомления
+DELIVERY_LOG_DAYS = 7
+
+
+@dataclass(frozen=True)
+class Notification:
+    """Одно сообщение одному чату; key — ключ идемпотентности доставки."""
+    key: str
+    chat_id: int
+    text: str
+
+
+class DeliveryLog:
+    """
+    Журнал доставленных уведомлений в SQLite.
+
+    Ключи последних дней держатся в памяти, запись на диск идет пачками.
+    После перезапуска уже доставленные уведомления не отправляются повторно.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._delivered: Set[str] = set()
+        self._pending: List[tuple] = []
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS delivered (key TEXT PRIMARY KEY, chat_id INTEGER, sent_at REAL)"
+        )
+        cutoff = time.time() - DELIVERY_LOG_DAYS * 86400
+        self._conn.execute("DELETE FROM delivered WHERE sent_at < ?", (cutoff,))
+        self._conn.commit()
+        self._delivered = {row[0] for row in self._conn.execute("SELECT key FROM delivered")}
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._open)
+        logger.info(f"Журнал уведомлений открыт: {len(self._delivered)} доставленных за {DELIVERY_LOG_DAYS} дн.")
+
+    def delivered(self, key: str) -> bool:
+        return key in self._delivered
+
+    def mark(self, key: str, chat_id: int) -> None:
+        self._delivered.add(key)
+        self._pending.append((key, chat_id, time.time()))
+
+    def _write(self, rows: List[tuple]) -> None:
+        self._conn.executemany("INSERT OR IGNORE INTO delivered (key, chat_id, sent_at) VALUES (?, ?, ?)", rows)
+        self._conn.commit()
+
+    async def flush(self) -> None:
+        if not self._pending or self._conn is None:
+            return
+        rows, self._pending = self._pending, []
+        await asyncio.to_thread(self._write, rows)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class NotificationSender:
+    """
+    Рассылка уведомлений в фоне.
+
+    Очередь разбирают несколько воркеров; каждое сообщение ждет токен
+    глобальной корзины (запас под интерактивные ответы) и корзины своего
+    чата. TelegramRetryAfter ставит глобальную корзину на паузу и
+    повторяет отправку. Доставленное пишется в журнал пачками.
+    """
+
+    def __init__(self, bot: Bot, log: DeliveryLog, global_rate: float, chat_rate: float,
+                 workers: int = 8, max_attempts: int = 3, flush_interval: float = 1.0,
+                 global_bucket: Optional[TokenBucket] = None):
+        self.bot = bot
+        self.log = log
+        # Общая корзина с исходящей очередью ответов, если она есть: лимит Telegram один на бота
+        self.global_bucket = global_bucket or TokenBucket(global_rate)
+        self.chat_buckets = KeyedTokenBuckets(chat_rate, capacity=1)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.stats: Dict[str, int] = {"sent": 0, "failed": 0, "retried": 0, "skipped": 0}
+        self._queue: "asyncio.Queue[Notification]" = asyncio.Queue()
+        self._in_flight: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def enqueue(self, notification: Notification) -> bool:
+        """Ставит уведомление в очередь; уже доставленные или ожидающие пропускаются."""
+        if self.log.delivered(notification.key) or notification.key in self._in_flight:
+            self.stats["skipped"] += 1
+            return False
+        self._in_flight.add(notification.key)
+        self._queue.put_nowait(notification)
+        return True
+
+    async def _send(self, notification: Notification) -> None:
+        attempt = 0
+        waited = 0.0
+        while attempt < self.max_attempts:
+            # Сначала корзина чата: ожидание одного чата не должно держать глобальный токен
+            await self.chat_buckets.acquire(notification.chat_id)
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(notification.chat_id, notification.text)
+            except TelegramRetryAfter as e:
+                # Не считается попыткой: Telegram явно сказал, когда можно повторить, но общее ожидание ограничено
+                self.stats["retried"] += 1
+                waited += e.retry_after
+                if waited > MAX_RETRY_AFTER_WAIT:
+                    logger.error(f"Уведомление {notification.key} отброшено: flood control дольше {MAX_RETRY_AFTER_WAIT} с")
+                    break
+                logger.warning(f"Flood control при рассылке, пауза {e.retry_after} с")
+                self.global_bucket.pause(e.retry_after)
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат не найден — повторять бессмысленно
+                logger.info(f"Уведомление {notification.key} не доставлено в чат {notification.chat_id}: {e}")
+                self.log.mark(notification.key, notification.chat_id)
+                self.stats["failed"] += 1
+                return
+            except Exception as e:
+                attempt += 1
+                logger.error(f"Ошибка отправки уведомления {notification.key} (попытка {attempt}): {e}")
+                await asyncio.sleep(attempt)
+                continue
+            self.log.mark(notification.key, notification.chat_id)
+            self.stats["sent"] += 1
+            return
+        self.stats["failed"] += 1
+
+    async def _worker(self) -> None:
+        while True:
+            notification = await self._queue.get()
+            try:
+                await self._send(notification)
+            finally:
+                self._in_flight.discard(notification.key)
+                self._queue.task_done()
+
+    async def _flusher(self) -> None:
+        # Останавливается событием, а не отменой: запись в SQLite не должна обрываться на середине
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.log.flush()
+            except Exception as e:
+                logger.error(f"Не удалось записать журнал уведомлений: {e}", exc_info=True)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"notify-{i}") for i in range(self.workers)]
+        self._flush_task = asyncio.create_task(self._flusher(), name="notify-flush")
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше drain_timeout), останавливает воркеров и сбрасывает журнал."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Рассылка остановлена, не отправлено: {self._queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._stopping.set()
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+
+
+def _telegram_ids(employees: RowStore) -> List[int]:
+    return [row["telegram_id"] for row in employees if row.get("telegram_id")]
+
+
+def _chat_ids(employees: RowStore, ids: Iterable[Any]) -> List[int]:
+    """Telegram-чаты по id сотрудников (или уже Telegram ID — так бот сохраняет организатора)."""
+    telegram_ids = set(_telegram_ids(employees))
+    chats: List[int] = []
+    for value in ids:
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            continue
+        row = employees.get(value)
+        chat = row.get("telegram_id") if row is not None else None
+        if not chat and value in telegram_ids:
+            chat = value
+        if chat and chat not in chats:
+            chats.append(chat)
+    return chats
+
+
+def _at(day: date, hour: int, minute: int = 0) -> float:
+    return datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute).timestamp()
+
+
+class NotificationScheduler:
+    """
+    Планировщик напоминаний: дни рождения, мероприятия участникам, дедлайны задач.
+
+    План на ближайшие сутки раскладывается по колесу таймеров; по
+    наступлении таймера уведомление уходит в NotificationSender.
+    План пересобирается раз в PLAN_INTERVAL и после изменений таблиц;
+    повторная постановка с тем же ключом заменяет таймер.
+    """
+
+    def __init__(self, repository: Repository, sender: NotificationSender):
+        self.repository = repository
+        self.sender = sender
+        self.wheel: TimingWheel[Notification] = TimingWheel(tick=1.0, slots=3600)
+        self._replan = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        for table in ("employees", "events", "tasks"):
+            repository.subscribe(table, lambda _: self._replan.set())
+
+    def _schedule(self, when: float, notification: Notification) -> None:
+        if self.sender.log.delivered(notification.key):
+            return
+        self.wheel.schedule(notification.key, when, notification)
+
+    async def plan(self) -> int:
+        employees, tasks = await asyncio.gather(
+            self.repository.load_store("employees"), self.repository.load_store("tasks")
+        )
+        if employees is None:
+            return 0
+        before = len(self.wheel)
+        now = datetime.now()
+        today = now.date()
+        all_chats = _telegram_ids(employees)
+
+        # Дни рождения: всем коллегам в NOTIFY_HOUR (сегодня, если час еще не прошел, и завтра)
+        for day in (today, today + timedelta(days=1)):
+            when = _at(day, app_settings.NOTIFY_HOUR)
+            if when < now.timestamp():
+                continue  # поздравлять после перезапуска посреди дня уже поздно
+            for _, employee in await BirthdayService.for_repository(self.repository).between(day, day):
+                text = f"🎂 Сегодня день рождения у {employee.get('name', 'коллеги')}! Не забудьте поздравить."
+                for chat in all_chats:
+                    if chat != employee.get("telegram_id"):
+                        self._schedule(when, Notification(f"birthday:{employee['id']}:{day}:{chat}", chat, text))
+
+        # Мероприятия: участникам за EVENT_REMINDER_MINUTES до начала или в NOTIFY_HOUR для событий без времени
+        calendar = await EventCalendarService.for_repository(self.repository).get()
+        for event in calendar.between(today, today + timedelta(days=1)) if calendar else []:
+            day = parse_date(event.get("date"))
+            start = parse_time(event.get("time"))
+            if start:
+                when = _at(day, *start) - app_settings.EVENT_REMINDER_MINUTES * 60
+                if when + app_settings.EVENT_REMINDER_MINUTES * 60 < now.timestamp():
+                    continue
+                text = f"📅 Скоро мероприятие «{event.get('title', '')}» в {start[0]:02d}:{start[1]:02d}"
+            else:
+                when = _at(day, app_settings.NOTIFY_HOUR)
+                if when < now.timestamp():
+                    continue
+                text = f"📅 Сегодня мероприятие «{event.get('title', '')}»"
+            if event.get("location"):
+                text += f", место: {event['location']}"
+            for chat in _chat_ids(employees, [event.get("organizer_id"), *(event.get("participants") or [])]):
+                self._schedule(when, Notification(f"event:{event['id']}:{day}:{chat}", chat, text))
+
+        # Задачи: исполнителю в NOTIFY_HOUR накануне срока
+        for task in tasks or []:
+            due = parse_date(task.get("due_date"))
+            if due is None or task.get("status") == "completed" or not today <= due <= today + timedelta(days=1):
+                continue
+            text = f"⏰ Срок задачи «{task.get('title', '')}» — {due:%d.%m.%Y}"
+            for chat in _chat_ids(employees, [task.get("assignee_id")]):
+                self._schedule(_at(due - timedelta(days=1), app_settings.NOTIFY_HOUR),
+                               Notification(f"task:{task['id']}:{due}:{chat}", chat, text))
+
+        logger.info(f"План уведомлений обновлен: {len(self.wheel)} в колесе ({len(self.wheel) - before:+d})")
+        return len(self.wheel)
+
+    async def _run(self) -> None:
+        while True:
+            self._replan.clear()
+            try:
+                await self.plan()
+            except Exception as e:
+                logger.error(f"Ошибка планирования уведомлений: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._replan.wait(), timeout=PLAN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _on_due(self, notification: Notification) -> None:
+        self.sender.enqueue(notification)
+
+    def start(self) -> None:
+        self.sender.start()
+        self.wheel.start(self._on_due)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="notification-planner")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.wheel.stop()
+        await self.sender.stop()
+        await self.sender.log.close()
+
+
+async def setup_notifications(bot: Bot, repository: Repository) -> NotificationScheduler:
+    outbound = get_outbound(bot)
+    # У каждого бота свой журнал доставки: одно и то же уведомление разных ботов — разные доставки
+    log = DeliveryLog(profile_path(app_settings.NOTIFICATIONS_DB, bot))
+    await log.open()
+    sender = NotificationSender(
+        bot, log,
+        global_rate=app_settings.NOTIFY_GLOBAL_RATE,
+        chat_rate=app_settings.NOTIFY_CHAT_RATE,
+        workers=app_settings.NOTIFY_WORKERS,
+        global_bucket=outbound.global_bucket if outbound else None,
+    )
+    scheduler = NotificationScheduler(repository, sender)
+    scheduler.start()
+    return scheduler
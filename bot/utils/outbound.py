@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import Message
+
+from bot.config import app_settings
+from bot.utils.rate_limit import KeyedTokenBuckets, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Жесткий предел длины сообщения в Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Сколько последних отправок учитывать в метриках задержки
+METRICS_WINDOW = 1000
+# Окно (секунды) для подсчета пропускной способности
+THROUGHPUT_WINDOW = 60.0
+# Сколько секунд в сумме сообщение может ждать по retry_after от Telegram, прежде чем от него откажемся
+MAX_RETRY_AFTER_WAIT = 120
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+_ENTITY_MAX = 10
+
+
+def _track_tags(stack: List[Tuple[str, str]], text: str) -> List[Tuple[str, str]]:
+    """Стек открытых тегов (имя, открывающий тег) после text."""
+    stack = list(stack)
+    for match in _TAG_RE.finditer(text):
+        name = match.group(2).lower()
+        if not match.group(1):
+            stack.append((name, match.group(0)))
+            continue
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                del stack[i]
+                break
+    return stack
+
+
+def _safe_cut(text: str, size: int) -> int:
+    """Позиция разреза не дальше size, не попадающая внутрь тега или HTML-сущности."""
+    cut = size
+    space = text.rfind(" ", 0, cut)
+    if space > size // 2:
+        cut = space + 1
+    tag_open = text.rfind("<", 0, cut)
+    if tag_open > text.rfind(">", 0, cut):
+        cut = tag_open
+    amp = text.rfind("&", max(0, cut - _ENTITY_MAX), cut)
+    if amp != -1 and ";" not in text[amp:cut]:
+        cut = amp
+    if cut <= 0:
+        # Тег или сущность в начале длиннее куска — режем сразу после них
+        end = text.find(">" if text.startswith("<") else ";")
+        cut = end + 1 if end != -1 else size
+    return cut
+
+
+def _pieces(text: str, size: int) -> List[str]:
+    """Строки текста; слишком длинные строки режутся по пробелам."""
+    pieces = []
+    for line in text.splitlines(keepends=True):
+        while len(line) > size:
+            cut = _safe_cut(line, size)
+            pieces.append(line[:cut])
+            line = line[cut:]
+        if line:
+            pieces.append(line)
+    return pieces
+
+
+def split_html(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Делит HTML-текст на куски не длиннее limit по границам строк.
+
+    Теги, открытые на границе куска, закрываются в его конце и снова
+    открываются в начале следующего, поэтому каждый кусок — корректный HTML.
+    """
+    if len(text) <= limit:
+        return [text]
+    chunks = []
+    start_tags: List[Tuple[str, str]] = []
+    body = ""
+    body_tags: List[Tuple[str, str]] = []
+
+    def close(tags: List[Tuple[str, str]]) -> str:
+        return "".join(f"</{name}>" for name, _ in reversed(tags))
+
+    pending = deque(_pieces(text, max(1, limit // 2)))
+    while pending:
+        piece = pending.popleft()
+        prefix = "".join(tag for _, tag in start_tags)
+        tags_after = _track_tags(body_tags, piece)
+        if len(prefix) + len(body) + len(piece) + len(close(tags_after)) <= limit:
+            body += piece
+            body_tags = tags_after
+            continue
+        if body:
+            chunks.append(prefix + body + close(body_tags))
+            start_tags = body_tags
+            body = ""
+            pending.appendleft(piece)
+            continue
+        # Кусок не помещается даже один (мешают переоткрытые теги) — режем мельче
+        room = limit - len(prefix) - len(close(tags_after))
+        cut = _safe_cut(piece, min(room, len(piece) - 1)) if room > 0 and len(piece) > 1 else 0
+        if 0 < cut < len(piece):
+            pending.appendleft(piece[cut:])
+            pending.appendleft(piece[:cut])
+        else:
+            body = piece
+            body_tags = tags_after
+    if body:
+        chunks.append("".join(tag for _, tag in start_tags) + body + close(body_tags))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _percentile(values: Deque[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class _Outgoing:
+    chat_id: int
+    chunks: List[str]
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    messages: List[Message] = field(default_factory=list)
+
+
+class OutboundSender:
+    """
+    Единая очередь исходящих сообщений.
+
+    send() режет текст на куски и сразу возвращает управление обработчику.
+    Сообщения одного чата уходят строго по порядку, разные чаты
+    обслуживаются по кругу несколькими воркерами. Каждый кусок ждет токен
+    корзины своего чата и глобальной корзины; TelegramRetryAfter ставит
+    корзины на паузу и повторяет отправку, не теряя сообщение.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float, chat_rate: float, chat_burst: float = 3,
+                 workers: int = 16, max_length: int = TELEGRAM_MESSAGE_LIMIT, max_attempts: int = 3):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = KeyedTokenBuckets(chat_rate, capacity=chat_burst)
+        self.workers = workers
+        self.max_length = min(max_length, TELEGRAM_MESSAGE_LIMIT)
+        self.max_attempts = max_attempts
+        self.stats: Dict[str, int] = {"queued": 0, "sent": 0, "failed": 0, "retried": 0}
+        self.queue_latency: Deque[float] = deque(maxlen=METRICS_WINDOW)
+        self.send_latency: Deque[float] = deque(maxlen=METRICS_WINDOW)
+        self._sent_at: Deque[float] = deque()
+        self._lanes: Dict[int, Deque[_Outgoing]] = {}
+        self._ready: "asyncio.Queue[int]" = asyncio.Queue()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        """Сообщений в очереди (еще не отправленных полностью)."""
+        return self._pending
+
+    def send(self, chat_id: int, text: str, **kwargs: Any) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь. Клавиатура (reply_markup) прикрепляется к последнему куску.
+
+        Returns:
+            Future со списком отправленных Message (пустой, если доставить не удалось)
+        """
+        future = asyncio.get_running_loop().create_future()
+        chunks = split_html(text, self.max_length) if text else []
+        if not chunks:
+            future.set_result([])
+            return future
+        item = _Outgoing(chat_id, chunks, kwargs, future)
+        self._pending += 1
+        self._idle.clear()
+        self.stats["queued"] += 1
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            self._lanes[chat_id] = deque([item])
+            self._ready.put_nowait(chat_id)
+        else:
+            lane.append(item)
+        return future
+
+    async def _deliver(self, item: _Outgoing, text: str, last: bool) -> Optional[Message]:
+        kwargs = item.kwargs if last else {k: v for k, v in item.kwargs.items() if k != "reply_markup"}
+        attempt = 0
+        waited = 0.0
+        while attempt < self.max_attempts:
+            await self.chat_buckets.acquire(item.chat_id)
+            await self.global_bucket.acquire()
+            started = time.monotonic()
+            try:
+                message = await self.bot.send_message(item.chat_id, text, **kwargs)
+            except TelegramRetryAfter as e:
+                self.stats["retried"] += 1
+                waited += e.retry_after
+                if waited > MAX_RETRY_AFTER_WAIT:
+                    # Иначе чат, который все время получает 429, занимал бы полосу бесконечно
+                    logger.error(f"Сообщение в чат {item.chat_id} отброшено: flood control дольше {MAX_RETRY_AFTER_WAIT} с")
+                    return None
+                logger.warning(f"Flood control для чата {item.chat_id}, пауза {e.retry_after} с")
+                self.global_bucket.pause(e.retry_after)
+                self.chat_buckets.get(item.chat_id).pause(e.retry_after)
+                continue
+            except TelegramForbiddenError as e:
+                logger.info(f"Чат {item.chat_id} недоступен: {e}")
+                return None
+            except TelegramBadRequest as e:
+                if "parse entities" in str(e) and kwargs.get("parse_mode", ...) is not None:
+                    # Битая разметка — лучше отправить как есть, чем не отправить
+                    logger.warning(f"Ошибка разметки, отправка без форматирования: {e}")
+                    kwargs = {**kwargs, "parse_mode": None}
+                    attempt += 1
+                    continue
+                logger.error(f"Сообщение в чат {item.chat_id} отклонено: {e}")
+                return None
+            except Exception as e:
+                attempt += 1
+                logger.error(f"Ошибка отправки в чат {item.chat_id} (попытка {attempt}): {e}")
+                await asyncio.sleep(attempt)
+                continue
+            now = time.monotonic()
+            self.send_latency.append(now - started)
+            self._sent_at.append(now)
+            return message
+        return None
+
+    def _finish(self, item: _Outgoing, ok: bool) -> None:
+        self.stats["sent" if ok else "failed"] += 1
+        if not item.future.done():
+            item.future.set_result(item.messages)
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            lane = self._lanes[chat_id]
+            item = lane[0]
+            index = len(item.messages)
+            if index == 0:
+                self.queue_latency.append(time.monotonic() - item.enqueued_at)
+            try:
+                message = await self._deliver(item, item.chunks[index], last=index == len(item.chunks) - 1)
+            except asyncio.CancelledError:
+                self._ready.put_nowait(chat_id)
+                raise
+            if message is not None:
+                item.messages.append(message)
+            if message is None or len(item.messages) == len(item.chunks):
+                lane.popleft()
+                self._finish(item, message is not None)
+            # Следующий кусок этого чата — в конец очереди, чтобы чаты чередовались
+            if lane:
+                self._ready.put_nowait(chat_id)
+            else:
+                del self._lanes[chat_id]
+
+    def throughput(self) -> float:
+        """Отправлено сообщений в секунду за последние THROUGHPUT_WINDOW секунд."""
+        cutoff = time.monotonic() - THROUGHPUT_WINDOW
+        while self._sent_at and self._sent_at[0] < cutoff:
+            self._sent_at.popleft()
+        return len(self._sent_at) / THROUGHPUT_WINDOW
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            **self.stats,
+            "pending": self._pending,
+            "queue_p50_ms": _percentile(self.queue_latency, 0.5) * 1000,
+            "queue_p95_ms": _percentile(self.queue_latency, 0.95) * 1000,
+            "send_p50_ms": _percentile(self.send_latency, 0.5) * 1000,
+            "send_p95_ms": _percentile(self.send_latency, 0.95) * 1000,
+            "throughput_per_s": self.throughput(),
+        }
+
+    def report(self) -> str:
+        m = self.metrics()
+        return (
+            "📤 <b>Исходящие сообщения</b>\n"
+            f"В очереди: {m['pending']}, отправлено: {m['sent']}, ошибок: {m['failed']}, "
+            f"повторов после 429: {m['retried']}\n"
+            f"Ожидание в очереди: p50 {m['queue_p50_ms']:.0f} мс, p95 {m['queue_p95_ms']:.0f} мс\n"
+            f"Отправка: p50 {m['send_p50_ms']:.0f} мс, p95 {m['send_p95_ms']:.0f} мс\n"
+            f"Пропускная способность: {m['throughput_per_s']:.2f} сообщ./с"
+        )
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(), name=f"outbound-{i}") for i in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше drain_timeout) и останавливает воркеров."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Исходящая очередь остановлена, не отправлено: {self._pending}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def setup_outbound(bot: Bot, processes: int = 1) -> OutboundSender:
+    """
+    Создает и запускает исходящую очередь и привязывает ее к боту (bot.outbound).
+
+    Лимит Telegram общий для бота, поэтому при processes процессах с
+    одним токеном каждый получает свою долю OUTBOUND_GLOBAL_RATE. Лимит
+    на чат не делится: чат всегда обслуживает один воркер.
+    """
+    sender = OutboundSender(
+        bot,
+        global_rate=app_settings.OUTBOUND_GLOBAL_RATE / max(1, processes),
+        chat_rate=app_settings.OUTBOUND_CHAT_RATE,
+        chat_burst=app_settings.OUTBOUND_CHAT_BURST,
+        workers=app_settings.OUTBOUND_WORKERS,
+        max_length=app_settings.MAX_RESPONSE_LENGTH,
+    )
+    sender.start()
+    bot.outbound = sender
+    return sender
+
+
+def get_outbound(bot) -> Optional[OutboundSender]:
+    """Возвращает исходящую очередь, привязанную к боту при запуске (bot.outbound)."""
+    return getattr(bot, "outbound", None)
+
+
+async def answer(message: Message, text: str, wait: bool = False, **kwargs: Any) -> Optional[Message]:
+    """
+    Ответ в чат сообщения через исходящую очередь.
+
+    По умолчанию не ждет отправки. С wait=True дожидается ее и возвращает
+    последнее отправленное сообщение (например, чтобы потом его
+    отредактировать) или None, если доставить не удалось. Если очередь не
+    запущена, куски отправляются напрямую.
+    """
+    sender = get_outbound(message.bot)
+    if sender is not None:
+        future = sender.send(message.chat.id, text, **kwargs)
+        if not wait:
+            return None
+        sent = await future
+        return sent[-1] if sent else None
+    chunks = split_html(text, min(app_settings.MAX_RESPONSE_LENGTH, TELEGRAM_MESSAGE_LIMIT))
+    sent = None
+    for i, chunk in enumerate(chunks):
+        last = i == len(chunks) - 1
+        sent = await message.answer(chunk, **(kwargs if last else {k: v for k, v in kwargs.items() if k != "reply_markup"}))
+    return sent
@@ -0,0 +1,105 @@
+import calendar
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+# Префиксы названий месяцев (именительный и родительный падеж: "март", "марта")
+_MONTH_PREFIXES = (
+    ("январ", 1), ("феврал", 2), ("март", 3), ("апрел", 4), ("мая", 5), ("май", 5), ("мае", 5), ("июн", 6),
+    ("июл", 7), ("август", 8), ("сентябр", 9), ("октябр", 10), ("ноябр", 11), ("декабр", 12),
+    ("jan", 1), ("feb", 2), ("mar", 3), ("apr", 4), ("may", 5), ("jun", 6),
+    ("jul", 7), ("aug", 8), ("sep", 9), ("oct", 10), ("nov", 11), ("dec", 12),
+)
+
+# Префиксы дней недели ("пятница", "по пятницам", "friday") -> номер дня (0 — понедельник)
+_WEEKDAY_PREFIXES = (
+    ("понедельн", 0), ("вторн", 1), ("сред", 2), ("четверг", 3), ("пятниц", 4), ("суббот", 5), ("воскресен", 6),
+    ("mon", 0), ("tue", 1), ("wed", 2), ("thu", 3), ("fri", 4), ("sat", 5), ("sun", 6),
+)
+
+_DATE_RE = re.compile(r"^\d{2}\.\d{2}\.\d{4}$")
+
+
+def parse_date(value) -> Optional[date]:
+    """Разбирает дату из dd.mm.yyyy, ISO-строки или date/datetime; None при ошибке."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text[:10], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def month_range(year: int, month: int) -> Tuple[date, date]:
+    """Первый и последний день месяца."""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def resolve_month(text: str) -> Optional[int]:
+    text = text.strip().lower()
+    for prefix, month in _MONTH_PREFIXES:
+        if text.startswith(prefix) or f" {prefix}" in f" {text}":
+            return month
+    return None
+
+
+def resolve_weekday(text: str) -> Optional[int]:
+    text = str(text).strip().lower()
+    if text.isdigit() and 0 <= int(text) <= 6:
+        return int(text)
+    for prefix, weekday in _WEEKDAY_PREFIXES:
+        if text.startswith(prefix) or f" {prefix}" in f" {text}":
+            return weekday
+    return None
+
+
+def resolve_period(period: Optional[str], today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """
+    Переводит период из запроса в интервал дат (включительно).
+
+    Поддерживаются: today/сегодня, tomorrow/завтра, this_week/эта неделя,
+    next_week/следующая неделя, this_month/этот месяц, next_month,
+    название месяца ("март", "в марте" — ближайший такой месяц) и
+    конкретная дата дд.мм.гггг.
+
+    Returns:
+        (начало, конец) или None, если период не распознан
+    """
+    if not period:
+        return None
+    today = today or date.today()
+    text = str(period).strip().lower().replace("ё", "е")
+
+    if _DATE_RE.match(text):
+        day = parse_date(text)
+        return (day, day) if day else None
+    if text in ("today", "сегодня"):
+        return today, today
+    if text in ("tomorrow", "завтра"):
+        tomorrow = today + timedelta(days=1)
+        return tomorrow, tomorrow
+
+    week_start = today - timedelta(days=today.weekday())
+    if text in ("this_week", "week") or ("недел" in text and ("эт" in text or "текущ" in text)):
+        return week_start, week_start + timedelta(days=6)
+    if text == "next_week" or ("недел" in text and "след" in text):
+        return week_start + timedelta(days=7), week_start + timedelta(days=13)
+    if text in ("this_month", "month") or ("месяц" in text and ("эт" in text or "текущ" in text)):
+        return month_range(today.year, today.month)
+    if text == "next_month" or ("месяц" in text and "след" in text):
+        year, month = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+        return month_range(year, month)
+
+    month = resolve_month(text)
+    if month:
+        # Ближайший такой месяц: текущий или в будущем
+        year = today.year if month >= today.month else today.year + 1
+        return month_range(year, month)
+    return None
@@ -0,0 +1,84 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from bot.config import app_settings
+from bot.utils.aggregation import resolve_target
+
+logger = logging.getLogger(__name__)
+
+# Минимальные наборы колонок по таблицам
+EMPLOYEE_LIST_COLUMNS = ("id", "name", "job_title", "department")
+EMPLOYEE_DETAIL_COLUMNS = ("id", "name", "job_title", "department", "hire_date", "education", "phone_number")
+EVENT_COLUMNS = ("id", "title", "description", "date", "time", "location", "type")
+TASK_COLUMNS = ("id", "title", "description", "due_date", "status", "priority", "project", "assignee_id")
+
+# Колонки для конкретного типа информации о сотруднике (entity info_type)
+INFO_TYPE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "phone_number": ("id", "name", "phone_number"),
+    "education": ("id", "name", "education"),
+    "hire_date": ("id", "name", "hire_date"),
+    "job_title": ("id", "name", "job_title"),
+}
+
+# Интенты поиска сотрудников
+EMPLOYEE_INTENTS = ("find_employee", "find_by_position", "find_by_department")
+
+# Таблица и колонки по умолчанию для остальных интентов
+INTENT_COLUMNS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "event_info": ("events", EVENT_COLUMNS),
+    "task_info": ("tasks", TASK_COLUMNS),
+    "availability": ("employees", EMPLOYEE_LIST_COLUMNS),
+}
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """План запроса: таблица, минимальный набор колонок и ограничение строк."""
+    table: str
+    columns: Tuple[str, ...]
+    limit: int
+    count_only: bool = False
+
+    @property
+    def select(self) -> str:
+        """Строка колонок для select()."""
+        return ", ".join(self.columns)
+
+    def with_columns(self, *extra: str) -> "QueryPlan":
+        """Возвращает план с дополнительными колонками (без дублей)."""
+        columns = self.columns + tuple(c for c in extra if c not in self.columns)
+        return QueryPlan(self.table, columns, self.limit, self.count_only)
+
+
+def plan_query(intent: Optional[str], entities: Optional[Dict[str, Any]] = None) -> Optional[QueryPlan]:
+    """
+    Сопоставляет интент и сущности с минимальным планом запроса.
+
+    Args:
+        intent: Интент, извлеченный NLU
+        entities: Словарь сущностей
+
+    Returns:
+        План запроса или None, если интент не требует обращения к БД
+    """
+    entities = entities or {}
+    limit = app_settings.MAX_QUERY_RESULTS
+    info_type = entities.get("info_type")
+
+    if intent == "count_info":
+        plan = QueryPlan(resolve_target(entities), (), 0, count_only=True)
+    elif info_type == "count":
+        table = INTENT_COLUMNS.get(intent, ("employees",))[0]
+        plan = QueryPlan(table, (), 0, count_only=True)
+    elif intent in EMPLOYEE_INTENTS:
+        columns = INFO_TYPE_COLUMNS.get(info_type, EMPLOYEE_DETAIL_COLUMNS)
+        plan = QueryPlan("employees", columns, limit)
+    elif intent in INTENT_COLUMNS:
+        table, columns = INTENT_COLUMNS[intent]
+        plan = QueryPlan(table, columns, limit)
+    else:
+        return None
+
+    logger.debug(f"План запроса для интента '{intent}' (info_type={info_type}): {plan}")
+    return plan
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class TokenBucket:
+    """
+    Корзина токенов: в среднем rate операций в секунду, всплеск до capacity.
+
+    acquire() ждет ровно столько, сколько нужно до появления токена; ожидающие
+    обслуживаются по очереди. pause() запрещает выдачу токенов до момента
+    времени (например, после retry_after от Telegram).
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_paused_until", "_lock")
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """Сколько секунд ждать, чтобы получить tokens токенов (0 — можно сейчас)."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self._paused_until - now)
+        if self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) / self.rate)
+        return wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        if self.delay(tokens) > 0:
+            return False
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while (wait := self.delay(tokens)) > 0:
+                await asyncio.sleep(wait)
+            self._tokens -= tokens
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class KeyedTokenBuckets:
+    """Отдельная корзина на ключ (чат, пользователь); число корзин ограничено, вытесняются давно неиспользуемые."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 10_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def acquire(self, key: Hashable, tokens: float = 1.0) -> None:
+        await self.get(key).acquire(tokens)
@@ -0,0 +1,135 @@
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.enums import ChatType
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Основы слов предметной области бота и их вес в классификаторе
+DOMAIN_STEMS: Dict[str, float] = {
+    "сотрудник": 2.0, "коллег": 1.5, "отдел": 2.0, "департамент": 2.0, "должност": 2.0,
+    "руководител": 1.5, "начальник": 1.5, "телефон": 1.5, "почт": 1.0, "email": 1.0, "контакт": 1.5,
+    "мероприят": 2.0, "встреч": 1.5, "событи": 1.0, "созвон": 1.5, "календар": 1.5,
+    "задач": 2.0, "дедлайн": 2.0, "срок": 1.0, "статус": 1.0, "проект": 1.5,
+    "день рожден": 2.5, "др": 1.0, "обед": 1.5, "навык": 1.5, "свобод": 1.5, "занят": 1.5,
+    "отпуск": 1.5, "работает": 1.0, "найди": 1.5, "покажи": 1.5, "напомни": 1.5, "бот": 1.5,
+}
+# Основы, которые засчитываются только целым словом
+WHOLE_WORDS = frozenset({"др"})
+# Слова, которые начинаются с основы, но к предметной области не относятся
+STEM_EXCEPTIONS: Dict[str, Tuple[str, ...]] = {"почт": ("почти",), "отдел": ("отдельн",)}
+# Вопросительные слова и просьбы (в начале фразы)
+QUESTION_WORDS = ("кто", "у кого", "где", "когда", "какой", "какая", "какие", "каком", "сколько", "чей", "есть ли",
+                  "как ", "покажи", "найди", "подскажи", "напомни")
+# Реплики, на которые бот в группе точно не должен отвечать
+CHATTER = re.compile(r"^(ок|окей|ага|да|нет|спасибо|спс|пасиб|привет|пока|понял|ясно|\+|лол|хах\w*|👍|🙏|😂)[.!)\s]*$",
+                     re.IGNORECASE)
+
+_BIAS = -3.0
+_QUESTION_MARK = 1.5
+_QUESTION_WORD = 1.5
+_SHORT_PENALTY = -1.5
+_WORD = re.compile(r"\w+")
+# Основа -> ее слова: "день рожден" должна совпасть с двумя словами подряд
+_STEM_PARTS = {stem: tuple(stem.split()) for stem in DOMAIN_STEMS}
+
+
+def _word_matches(word: str, stem: str) -> bool:
+    if stem in WHOLE_WORDS:
+        return word == stem
+    return word.startswith(stem) and not word.startswith(STEM_EXCEPTIONS.get(stem, ()))
+
+
+def _has_stem(words: List[str], stem: str) -> bool:
+    """Есть ли в тексте слова, начинающиеся с основы (по границам слов, а не подстрокой)."""
+    parts = _STEM_PARTS[stem]
+    return any(
+        all(_word_matches(words[start + offset], part) for offset, part in enumerate(parts))
+        for start in range(len(words) - len(parts) + 1)
+    )
+
+
+def relevance_score(text: str) -> float:
+    """
+    Вероятность того, что сообщение в группе — вопрос к боту.
+
+    Крошечная логистическая модель с ручными весами: слова предметной
+    области, вопросительные слова и знак вопроса повышают оценку, короткие
+    реплики понижают. Работает локально за микросекунды.
+    """
+    lowered = " ".join(text.lower().split()) + " "
+    if CHATTER.match(lowered.strip()):
+        return 0.0
+    words = _WORD.findall(lowered)
+    z = _BIAS + sum(weight for stem, weight in DOMAIN_STEMS.items() if _has_stem(words, stem))
+    if "?" in lowered:
+        z += _QUESTION_MARK
+    if lowered.startswith(QUESTION_WORDS):
+        z += _QUESTION_WORD
+    if len(lowered.split()) < 3:
+        z += _SHORT_PENALTY
+    return 1 / (1 + math.exp(-z))
+
+
+class RelevanceGate:
+    """
+    Решает, стоит ли отправлять сообщение в AI-конвейер.
+
+    Личные чаты проходят всегда. В группах проходят упоминания бота,
+    ответы на его сообщения и (если включено) сообщения, которые
+    классификатор считает вопросом к боту; остальное отбрасывается без
+    обращения к модели.
+    """
+
+    def __init__(self, threshold: float = 0.7, use_classifier: bool = True):
+        self.threshold = threshold
+        self.use_classifier = use_classifier
+        self.stats: Dict[str, int] = {
+            "private": 0, "mention": 0, "reply": 0, "classifier": 0, "dropped": 0,
+        }
+
+    async def check(self, message: Message, bot: Bot) -> Optional[str]:
+        """Текст запроса (без упоминания бота) или None, если сообщение не к боту."""
+        text = message.text or ""
+        if message.chat.type == ChatType.PRIVATE:
+            self.stats["private"] += 1
+            return text
+
+        me = await bot.me()
+        mention = f"@{me.username}".lower() if me.username else None
+        for entity in message.entities or []:
+            value = entity.extract_from(text)
+            if (entity.type == "mention" and mention and value.lower() == mention) or \
+                    (entity.type == "text_mention" and entity.user and entity.user.id == me.id):
+                self.stats["mention"] += 1
+                return (text.replace(value, " ") if entity.type == "mention" else text).strip() or text
+
+        reply = message.reply_to_message
+        if reply and reply.from_user and reply.from_user.id == me.id:
+            self.stats["reply"] += 1
+            return text
+
+        if self.use_classifier and relevance_score(text) >= self.threshold:
+            self.stats["classifier"] += 1
+            return text
+
+        self.stats["dropped"] += 1
+        logger.debug(f"Сообщение в чате {message.chat.id} не адресовано боту, пропущено")
+        return None
+
+    def report(self) -> str:
+        passed = sum(v for k, v in self.stats.items() if k != "dropped")
+        total = passed + self.stats["dropped"]
+        rate = passed / total * 100 if total else 0.0
+        return (
+            "🚦 <b>Фильтр сообщений</b>\n"
+            f"Пропущено в AI: {passed} из {total} ({rate:.0f}%)\n"
+            f"Личные чаты: {self.stats['private']}, упоминания: {self.stats['mention']}, "
+            f"ответы боту: {self.stats['reply']}, классификатор: {self.stats['classifier']}\n"
+            f"Отброшено: {self.stats['dropped']}"
+        )
+
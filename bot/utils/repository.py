@@ -0,0 +1,438 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from supabase import Client
+
+from bot.utils.aggregation import aggregate
+from bot.utils.database import count_supabase_rows, db_limiter, execute_supabase_query, run_query
+from bot.utils.fanout import multi_value_filter
+from bot.utils.query_planner import EMPLOYEE_DETAIL_COLUMNS, EVENT_COLUMNS, TASK_COLUMNS
+from bot.utils.row_store import TABLE_SPECS, RowStore
+
+logger = logging.getLogger(__name__)
+
+QueryResult = Tuple[Optional[List[Dict[str, Any]]], Optional[str]]
+
+# Размер страницы при полной выгрузке таблицы в локальное хранилище
+STORE_PAGE_SIZE = 1000
+# Сколько секунд локальное хранилище считается актуальным
+STORE_TTL = 300
+
+
+def _freeze(value: Any) -> Hashable:
+    """Превращает фильтры (списки словарей) в хешируемый ключ."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+@dataclass
+class Page:
+    """Страница строк при keyset-пагинации по id."""
+    rows: List[Dict[str, Any]]
+    has_prev: bool
+    has_next: bool
+
+    @property
+    def first_id(self) -> Optional[int]:
+        return self.rows[0]["id"] if self.rows else None
+
+    @property
+    def last_id(self) -> Optional[int]:
+        return self.rows[-1]["id"] if self.rows else None
+
+
+@dataclass
+class CallStats:
+    """Статистика вызовов одной операции репозитория."""
+    calls: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    @property
+    def avg_ms(self) -> float:
+        executed = self.calls - self.coalesced
+        return self.total_ms / executed if executed else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "avg_ms": round(self.avg_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые запросы в один.
+
+    Пока запрос с ключом выполняется, остальные вызовы с тем же ключом ждут
+    его результат вместо повторного обращения к базе. Результат общий —
+    вызывающий код не должен его изменять.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Выполняет factory() или присоединяется к уже идущему вызову с тем же ключом.
+
+        Returns:
+            Кортеж (результат, был ли вызов объединен с уже выполняющимся)
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не должна отменять запрос для остальных
+        return await asyncio.shield(task), shared
+
+
+class Repository:
+    """
+    Единая точка доступа к таблицам employees, events и tasks.
+
+    Все обработчики ходят в Supabase через репозиторий: одинаковые
+    одновременные запросы объединяются (single-flight), задержка каждого
+    вызова учитывается в статистике, а полные выгрузки таблиц кешируются
+    в колоночных хранилищах и сбрасываются при изменениях.
+    """
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+        self._flight = SingleFlight()
+        self._stats: Dict[str, CallStats] = {}
+        self._stores: Dict[str, Tuple[float, RowStore]] = {}
+        self._listeners: Dict[str, List[Callable[[str], Any]]] = {}
+        self._row_listeners: Dict[str, List[Callable[[Optional[List[Dict[str, Any]]]], Any]]] = {}
+        self._publishers: List[Callable[[str], Any]] = []
+        self._services: Dict[str, Any] = {}
+
+    # ---- Инфраструктура ----
+
+    async def _run(self, operation: str, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        stats = self._stats.setdefault(operation, CallStats())
+        started = time.perf_counter()
+        result, shared = await self._flight.do(key, factory)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        stats.calls += 1
+        if shared:
+            stats.coalesced += 1
+        else:
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            if isinstance(result, tuple) and len(result) == 2 and result[1]:
+                stats.errors += 1
+        logger.debug(f"Репозиторий: {operation} {'(объединен) ' if shared else ''}{elapsed_ms:.0f} мс")
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Снимок статистики по операциям и состояния ограничителя параллелизма."""
+        snapshot = {operation: stats.as_dict() for operation, stats in self._stats.items()}
+        snapshot["limiter"] = db_limiter.snapshot()
+        return snapshot
+
+    async def query(
+            self,
+            table: str,
+            columns: str = "*",
+            filters: Optional[List[Dict[str, Any]]] = None,
+            order_by: Optional[Tuple[str, str]] = None,
+            limit: Optional[int] = None,
+    ) -> QueryResult:
+        """Выполняет запрос через execute_supabase_query с объединением одинаковых вызовов."""
+        key = ("query", table, columns, _freeze(filters), order_by, limit)
+        return await self._run(
+            f"{table}.query", key,
+            lambda: execute_supabase_query(self.supabase, table, columns, filters, order_by, limit),
+        )
+
+    async def count(self, table: str, filters: Optional[List[Dict[str, Any]]] = None) -> Tuple[Optional[int], Optional[str]]:
+        """Серверный подсчет строк с объединением одинаковых вызовов."""
+        key = ("count", table, _freeze(filters))
+        return await self._run(f"{table}.count", key, lambda: count_supabase_rows(self.supabase, table, filters))
+
+    async def iter_pages(
+            self,
+            table: str,
+            columns: str = "*",
+            filters: Optional[List[Dict[str, Any]]] = None,
+            page_size: int = STORE_PAGE_SIZE,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Постранично выгружает таблицу (keyset по id), не держа ее целиком в памяти.
+
+        Yields:
+            Списки строк размером не больше page_size
+        """
+        if columns != "*" and "id" not in [c.strip() for c in columns.split(",")]:
+            columns = f"id, {columns}"
+        last_id = None
+        while True:
+            page_filters = list(filters or [])
+            if last_id is not None:
+                page_filters.append({"column": "id", "operator": "gt", "value": last_id})
+            rows, error = await self.query(table, columns, page_filters, ("id", "asc"), page_size)
+            if error:
+                raise RuntimeError(error)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["id"]
+
+    async def page(
+            self,
+            table: str,
+            columns: Sequence[str],
+            page_size: int,
+            after_id: Optional[int] = None,
+            before_id: Optional[int] = None,
+    ) -> Tuple[Optional[Page], Optional[str]]:
+        """
+        Возвращает страницу таблицы по курсору (keyset по id), без OFFSET.
+
+        Args:
+            table: Имя таблицы
+            columns: Колонки (id добавляется автоматически)
+            page_size: Размер страницы
+            after_id: Следующая страница — строки с id > after_id
+            before_id: Предыдущая страница — строки с id < before_id
+
+        Returns:
+            Кортеж (страница, ошибка)
+        """
+        select = ", ".join(["id"] + [c for c in columns if c != "id"])
+        backward = before_id is not None and after_id is None
+        filters = []
+        if backward:
+            filters.append({"column": "id", "operator": "lt", "value": before_id})
+        elif after_id is not None:
+            filters.append({"column": "id", "operator": "gt", "value": after_id})
+
+        # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+        rows, error = await self.query(
+            table, select, filters, ("id", "desc" if backward else "asc"), page_size + 1
+        )
+        if error:
+            return None, error
+
+        rows = list(rows or [])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backward:
+            rows.reverse()
+            return Page(rows, has_prev=has_more, has_next=True), None
+        return Page(rows, has_prev=after_id is not None, has_next=has_more), None
+
+    # ---- Локальные колоночные хранилища ----
+
+    def cached_store(self, table: str, max_age: float = STORE_TTL) -> Optional[RowStore]:
+        """Возвращает уже загруженное и актуальное хранилище таблицы, не обращаясь к базе."""
+        entry = self._stores.get(table)
+        if entry and time.monotonic() - entry[0] < max_age:
+            return entry[1]
+        return None
+
+    def cached_stores(self) -> Dict[str, RowStore]:
+        """Все актуальные хранилища по именам таблиц."""
+        return {table: store for table in TABLE_SPECS if (store := self.cached_store(table)) is not None}
+
+    async def load_store(self, table: str, max_age: float = STORE_TTL) -> Optional[RowStore]:
+        """
+        Загружает таблицу целиком в колоночное хранилище (или берет из кеша).
+
+        Args:
+            table: Имя таблицы (employees, events, tasks)
+            max_age: Допустимый возраст кеша в секундах
+
+        Returns:
+            Хранилище или None при ошибке загрузки
+        """
+        store = self.cached_store(table, max_age)
+        if store is not None:
+            return store
+
+        async def load() -> Optional[RowStore]:
+            rows: List[Dict[str, Any]] = []
+            try:
+                async for page in self.iter_pages(table):
+                    rows.extend(page)
+            except RuntimeError as e:
+                logger.error(f"Не удалось загрузить таблицу '{table}' в локальное хранилище: {e}")
+                return None
+            loaded = RowStore.from_rows(TABLE_SPECS[table], rows)
+            self._stores[table] = (time.monotonic(), loaded)
+            logger.info(f"Таблица '{table}' загружена в локальное хранилище: {len(loaded)} строк")
+            return loaded
+
+        return await self._run(f"{table}.load", ("load", table), load)
+
+    def service(self, name: str, factory: Callable[["Repository"], Any]) -> Any:
+        """
+        Возвращает производную структуру (индекс, кеш ответов), общую для всех обработчиков.
+
+        Создается один раз на репозиторий вызовом factory(repository).
+
+        Область действия — один процесс. При WORKERS > 1 каждый воркер сам
+        загружает таблицы и строит свои индексы (память и запросы к базе
+        растут в WORKERS раз); сброс после записи передается остальным
+        воркерам через InvalidationRelay.
+        """
+        service = self._services.get(name)
+        if service is None:
+            service = self._services[name] = factory(self)
+        return service
+
+    def subscribe(self, table: str, callback: Callable[[str], Any]) -> None:
+        """Подписывает callback(table) на изменения таблицы (вставка, обновление, сброс кеша)."""
+        self._listeners.setdefault(table, []).append(callback)
+
+    def subscribe_rows(self, table: str, callback: Callable[[Optional[List[Dict[str, Any]]]], Any]) -> None:
+        """
+        Подписывает callback(rows) на изменения таблицы с самими измененными строками.
+
+        rows — строки после вставки или обновления через репозиторий; None,
+        если изменившиеся строки неизвестны (изменение в другом процессе) —
+        тогда подписчику нужно перечитать таблицу целиком.
+        """
+        self._row_listeners.setdefault(table, []).append(callback)
+
+    def publish(self, callback: Callable[[str], Any]) -> None:
+        """Подписывает callback(table) на изменения, сделанные этим процессом (для передачи другим)."""
+        self._publishers.append(callback)
+
+    def invalidate(self, table: str, remote: bool = False, rows: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Сбрасывает локальное хранилище таблицы и уведомляет подписчиков.
+
+        Args:
+            table: Имя таблицы
+            remote: Изменение сделано другим процессом (не передается дальше)
+            rows: Измененные строки, если известны (для subscribe_rows)
+        """
+        self._stores.pop(table, None)
+        if not remote:
+            for publisher in self._publishers:
+                try:
+                    publisher(table)
+                except Exception as e:
+                    logger.error(f"Не удалось передать изменение таблицы '{table}': {e}", exc_info=True)
+        for callback in self._listeners.get(table, []):
+            try:
+                result = callback(table)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике изменения таблицы '{table}': {e}", exc_info=True)
+        for callback in self._row_listeners.get(table, []):
+            try:
+                callback(rows)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике изменения строк '{table}': {e}", exc_info=True)
+
+    # ---- Запись ----
+
+    async def insert(self, table: str, row: Dict[str, Any]) -> QueryResult:
+        """Вставляет строку и сбрасывает кеши таблицы."""
+        try:
+            response = await run_query(self.supabase.table(table).insert(row))
+        except Exception as e:
+            logger.error(f"Ошибка вставки в '{table}': {e}", exc_info=True)
+            return None, str(e)
+        self.invalidate(table, rows=response.data or None)
+        return response.data, None
+
+    async def update(self, table: str, values: Dict[str, Any], key: Any) -> QueryResult:
+        """Обновляет строку по id и сбрасывает кеши таблицы."""
+        try:
+            response = await run_query(self.supabase.table(table).update(values).eq("id", key))
+        except Exception as e:
+            logger.error(f"Ошибка обновления '{table}' (id={key}): {e}", exc_info=True)
+            return None, str(e)
+        self.invalidate(table, rows=response.data or None)
+        return response.data, None
+
+    # ---- Предметные запросы ----
+
+    async def find_employees(
+            self,
+            names: Sequence[str] = (),
+            departments: Sequence[str] = (),
+            positions: Sequence[str] = (),
+            projects: Sequence[str] = (),
+            columns: Sequence[str] = EMPLOYEE_DETAIL_COLUMNS,
+            limit: Optional[int] = None,
+    ) -> QueryResult:
+        """
+        Ищет сотрудников по именам, отделам, должностям и проектам.
+
+        Несколько значений одного критерия объединяются через ИЛИ в одном
+        запросе; для проектов это пересечение массивов (ov), как и при
+        подсчете в bot.utils.aggregation.
+        """
+        filters = [
+            f for f in (
+                multi_value_filter("name", "ilike", names),
+                multi_value_filter("department", "ilike", departments),
+                multi_value_filter("job_title", "ilike", positions),
+            ) if f
+        ]
+        if projects:
+            filters.append({"column": "projects", "operator": "ov", "value": list(projects)})
+        return await self.query("employees", ", ".join(columns), filters, limit=limit)
+
+    async def find_events(
+            self,
+            dates: Sequence[str] = (),
+            types: Sequence[str] = (),
+            columns: Sequence[str] = EVENT_COLUMNS,
+            limit: Optional[int] = None,
+    ) -> QueryResult:
+        """Ищет мероприятия по датам и типам."""
+        filters = [
+            f for f in (
+                multi_value_filter("date", "eq", dates),
+                multi_value_filter("type", "eq", types),
+            ) if f
+        ]
+        return await self.query("events", ", ".join(columns), filters, ("date", "asc"), limit)
+
+    async def find_tasks(
+            self,
+            keywords: Sequence[str] = (),
+            columns: Sequence[str] = TASK_COLUMNS,
+            limit: Optional[int] = None,
+    ) -> QueryResult:
+        """Ищет задачи по ключевым словам в описании."""
+        filters = [f for f in (multi_value_filter("description", "ilike", keywords),) if f]
+        return await self.query("tasks", ", ".join(columns), filters, ("due_date", "asc"), limit)
+
+    async def aggregate(self, entities: Dict[str, Any]) -> Dict[str, Any]:
+        """Ответ на вопрос "сколько": по локальным хранилищам, если они загружены, иначе на сервере."""
+        return await self._run(
+            "aggregate", ("aggregate", _freeze(entities)),
+            lambda: aggregate(self.supabase, entities, self.cached_stores(), pages=self.iter_pages),
+        )
+
+
+def get_repository(bot) -> Optional[Repository]:
+    """Возвращает репозиторий, привязанный к боту при запуске (bot.repository)."""
+    return getattr(bot, "repository", None)
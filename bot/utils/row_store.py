@@ -0,0 +1,218 @@
+import sys
+import logging
+from array import array
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Значение-заглушка для NULL в целочисленных колонках (array('q') не хранит None)
+_NULL_INT = -(2 ** 63)
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    """Описание таблицы для колоночного хранилища."""
+    table: str
+    interned: Tuple[str, ...] = ()
+    int_columns: Tuple[str, ...] = ()
+    key: str = "id"
+
+
+EMPLOYEES_SPEC = TableSpec(
+    table="employees",
+    interned=("department", "job_title"),
+    int_columns=("id", "telegram_id"),
+)
+
+EVENTS_SPEC = TableSpec(
+    table="events",
+    interned=("type", "location"),
+    int_columns=("id", "organizer_id"),
+)
+
+TASKS_SPEC = TableSpec(
+    table="tasks",
+    interned=("status", "priority", "project"),
+    int_columns=("id", "assignee_id"),
+)
+
+TABLE_SPECS: Dict[str, TableSpec] = {
+    spec.table: spec for spec in (EMPLOYEES_SPEC, EVENTS_SPEC, TASKS_SPEC)
+}
+
+
+class RowView(Mapping):
+    """
+    Легковесное представление одной строки хранилища.
+
+    Не копирует данные: чтение идет напрямую из колонок. Поддерживает
+    интерфейс словаря (`row['name']`, `row.get('name')`), поэтому подходит
+    для существующего кода обработчиков.
+    """
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: "RowStore", index: int):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, column: str) -> Any:
+        try:
+            values = self._store.columns[column]
+        except KeyError:
+            raise KeyError(column) from None
+        value = values[self._index]
+        if value == _NULL_INT and column in self._store.spec.int_columns:
+            return None
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.columns)
+
+    def __len__(self) -> int:
+        return len(self._store.columns)
+
+    def __repr__(self) -> str:
+        return f"RowView({self._store.spec.table}#{self._index})"
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Материализует строку в обычный словарь (например, для json.dumps)."""
+        return {column: self[column] for column in self._store.columns}
+
+
+class StoreView(Sequence):
+    """Выборка строк хранилища по списку индексов без копирования данных."""
+    __slots__ = ("_store", "_indices")
+
+    def __init__(self, store: "RowStore", indices: array):
+        self._store = store
+        self._indices = indices
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return StoreView(self._store, self._indices[item])
+        return RowView(self._store, self._indices[item])
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def filter(self, predicate: Callable[[RowView], bool]) -> "StoreView":
+        return StoreView(
+            self._store,
+            array("l", (i for i in self._indices if predicate(RowView(self._store, i)))),
+        )
+
+    def where(self, column: str, value: Any) -> "StoreView":
+        """Фильтр на равенство по колонке; для интернированных строк сравнение дешевое."""
+        values = self._store.columns.get(column)
+        if values is None:
+            return StoreView(self._store, array("l"))
+        if isinstance(value, str) and column in self._store.spec.interned:
+            value = sys.intern(value)
+        return StoreView(self._store, array("l", (i for i in self._indices if values[i] == value)))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [row.to_dict() for row in self]
+
+
+class RowStore:
+    """
+    Колоночное хранилище строк таблицы Supabase.
+
+    Строится за один проход по сырому ответу API. Строковые категориальные
+    колонки (отдел, должность, статус, приоритет) интернируются, целочисленные
+    хранятся в `array('q')`. Обработчики получают `RowView`/`StoreView`
+    вместо pydantic-моделей.
+    """
+    __slots__ = ("spec", "columns", "_size", "_key_index")
+
+    def __init__(self, spec: TableSpec):
+        self.spec = spec
+        self.columns: Dict[str, Any] = {}
+        self._size = 0
+        self._key_index: Dict[Any, int] = {}
+
+    @classmethod
+    def from_rows(cls, spec: TableSpec, rows: Iterable[Dict[str, Any]]) -> "RowStore":
+        """
+        Строит хранилище из списка словарей, полученного от Supabase.
+
+        Args:
+            spec: Описание таблицы
+            rows: Сырые строки ответа API
+
+        Returns:
+            Заполненное хранилище
+        """
+        store = cls(spec)
+        columns: Dict[str, list] = {}
+        interned = spec.interned
+        size = 0
+
+        for row in rows:
+            for column, value in row.items():
+                values = columns.get(column)
+                if values is None:
+                    values = columns[column] = [None] * size
+                if column in interned and isinstance(value, str):
+                    value = sys.intern(value)
+                values.append(value)
+            size += 1
+            # Колонки, отсутствующие в этой строке, дополняем None
+            for values in columns.values():
+                if len(values) < size:
+                    values.append(None)
+
+        for column, values in columns.items():
+            if column in spec.int_columns:
+                columns[column] = cls._pack_ints(spec.table, column, values)
+
+        store.columns = columns
+        store._size = size
+        store._reindex()
+        logger.debug(f"Построено колоночное хранилище '{spec.table}': {size} строк, {len(columns)} колонок")
+        return store
+
+    @staticmethod
+    def _pack_ints(table: str, column: str, values: list):
+        try:
+            return array("q", (_NULL_INT if v is None else int(v) for v in values))
+        except (TypeError, ValueError, OverflowError):
+            logger.warning(f"Колонка '{table}.{column}' не целочисленная, оставлена списком")
+            return values
+
+    def _reindex(self) -> None:
+        keys = self.columns.get(self.spec.key)
+        self._key_index = {} if keys is None else {key: i for i, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[RowView]:
+        for i in range(self._size):
+            yield RowView(self, i)
+
+    def __getitem__(self, index: int) -> RowView:
+        if not -self._size <= index < self._size:
+            raise IndexError(index)
+        return RowView(self, index % self._size)
+
+    def column(self, name: str) -> Sequence[Any]:
+        """Возвращает колонку целиком (без копирования)."""
+        return self.columns.get(name, ())
+
+    def get(self, key: Any) -> Optional[RowView]:
+        """Строка по первичному ключу или None."""
+        index = self._key_index.get(key)
+        return None if index is None else RowView(self, index)
+
+    def view(self, indices: Optional[Iterable[int]] = None) -> StoreView:
+        """Выборка по индексам; без аргументов — все строки."""
+        if indices is None:
+            indices = range(self._size)
+        return StoreView(self, array("l", indices))
@@ -0,0 +1,277 @@
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from bot.utils.cache import make_cache
+
+logger = logging.getLogger(__name__)
+
+
+class UnsafeQueryError(ValueError):
+    """Сгенерированный SQL не прошел проверку на безопасность (не только чтение)."""
+
+
+@dataclass(frozen=True)
+class Slot:
+    """Параметр шаблона: имя, тип значения и допустимые варианты для enum."""
+    name: str
+    kind: str = "text"  # text | like | int | date | enum
+    choices: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class SqlTemplate:
+    """Параметризованный запрос для типового вопроса."""
+    name: str
+    description: str
+    sql: str
+    slots: Tuple[Slot, ...] = field(default_factory=tuple)
+
+
+TASK_STATUSES = ("pending", "in_progress", "completed")
+TASK_PRIORITIES = ("low", "medium", "high")
+
+TEMPLATES: Dict[str, SqlTemplate] = {t.name: t for t in (
+    SqlTemplate(
+        "count_employees",
+        "Сколько всего сотрудников",
+        "SELECT count(*) AS count FROM employees",
+    ),
+    SqlTemplate(
+        "count_employees_in_department",
+        "Сколько сотрудников в отделе",
+        "SELECT count(*) AS count FROM employees WHERE department ILIKE {department}",
+        (Slot("department", "like"),),
+    ),
+    SqlTemplate(
+        "employees_in_department",
+        "Список сотрудников отдела",
+        "SELECT name, job_title, department FROM employees WHERE department ILIKE {department} ORDER BY name",
+        (Slot("department", "like"),),
+    ),
+    SqlTemplate(
+        "employees_by_position",
+        "Сотрудники с указанной должностью",
+        "SELECT name, job_title, department FROM employees WHERE job_title ILIKE {position} ORDER BY name",
+        (Slot("position", "like"),),
+    ),
+    SqlTemplate(
+        "employees_on_project",
+        "Кто работает над проектом",
+        "SELECT name, job_title, department FROM employees WHERE {project} = ANY(projects) ORDER BY name",
+        (Slot("project", "text"),),
+    ),
+    SqlTemplate(
+        "events_between",
+        "Мероприятия в интервале дат (включительно)",
+        "SELECT title, date, time, location, type FROM events "
+        "WHERE date BETWEEN {date_from} AND {date_to} ORDER BY date, time",
+        (Slot("date_from", "date"), Slot("date_to", "date")),
+    ),
+    SqlTemplate(
+        "events_this_week",
+        "Мероприятия на текущей неделе",
+        "SELECT title, date, time, location, type FROM events "
+        "WHERE date >= date_trunc('week', current_date) AND date < date_trunc('week', current_date) + interval '7 days' "
+        "ORDER BY date, time",
+    ),
+    SqlTemplate(
+        "events_by_type",
+        "Ближайшие мероприятия указанного типа",
+        "SELECT title, date, time, location FROM events WHERE type = {event_type} AND date >= current_date "
+        "ORDER BY date, time",
+        (Slot("event_type", "text"),),
+    ),
+    SqlTemplate(
+        "count_tasks",
+        "Сколько задач с указанным статусом и приоритетом",
+        "SELECT count(*) AS count FROM tasks WHERE status = ANY({statuses}) AND priority = ANY({priorities})",
+        (Slot("statuses", "enum", TASK_STATUSES), Slot("priorities", "enum", TASK_PRIORITIES)),
+    ),
+    SqlTemplate(
+        "tasks_by_status_priority",
+        "Список задач с указанным статусом и приоритетом",
+        "SELECT title, due_date, status, priority, project FROM tasks "
+        "WHERE status = ANY({statuses}) AND priority = ANY({priorities}) ORDER BY due_date",
+        (Slot("statuses", "enum", TASK_STATUSES), Slot("priorities", "enum", TASK_PRIORITIES)),
+    ),
+    SqlTemplate(
+        "tasks_due_between",
+        "Задачи со сроком в интервале дат (включительно)",
+        "SELECT title, due_date, status, priority, project FROM tasks "
+        "WHERE due_date::date BETWEEN {date_from} AND {date_to} ORDER BY due_date",
+        (Slot("date_from", "date"), Slot("date_to", "date")),
+    ),
+)}
+
+
+def describe_templates() -> str:
+    """Описание библиотеки шаблонов для промпта модели."""
+    lines = []
+    for template in TEMPLATES.values():
+        slots = ", ".join(
+            f"{slot.name}: {slot.kind}" + (f" из [{', '.join(slot.choices)}]" if slot.choices else "")
+            for slot in template.slots
+        )
+        lines.append(f"- {template.name}({slots}): {template.description}")
+    return "\n".join(lines)
+
+
+# ---- Подстановка параметров ----
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _parse_date(value: Any) -> date:
+    if isinstance(value, date):
+        return value
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Некорректная дата: {value}")
+
+
+def _render_slot(slot: Slot, value: Any) -> str:
+    if value is None or value == "" or value == []:
+        raise ValueError(f"Не заполнен параметр '{slot.name}'")
+    if slot.kind == "int":
+        return str(int(value))
+    if slot.kind == "date":
+        return f"{_quote(_parse_date(value).isoformat())}::date"
+    if slot.kind == "like":
+        return _quote(f"%{_escape_like(str(value).strip())}%")
+    if slot.kind == "enum":
+        values = value if isinstance(value, list) else [value]
+        values = [str(v).strip().lower() for v in values]
+        invalid = [v for v in values if v not in slot.choices]
+        if invalid:
+            raise ValueError(f"Недопустимые значения '{slot.name}': {invalid}")
+        return "ARRAY[" + ", ".join(_quote(v) for v in values) + "]::text[]"
+    return _quote(str(value).strip())
+
+
+def render_template(name: str, params: Dict[str, Any]) -> str:
+    """
+    Подставляет параметры в шаблон с экранированием.
+
+    Raises:
+        KeyError: шаблон не найден
+        ValueError: параметр отсутствует или некорректен
+    """
+    template = TEMPLATES[name]
+    rendered = {slot.name: _render_slot(slot, params.get(slot.name)) for slot in template.slots}
+    return template.sql.format(**rendered)
+
+
+# ---- Проверки произвольного SQL ----
+
+_FORBIDDEN_SQL = re.compile(
+    r"\b(insert|update|delete|merge|upsert|drop|alter|create|truncate|grant|revoke|copy|call|do|execute|"
+    r"vacuum|analyze|refresh|reindex|cluster|comment|lock|listen|notify|set|reset|into|pg_sleep|"
+    r"pg_read_file|pg_terminate_backend|dblink)\b",
+    re.IGNORECASE,
+)
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_CODE_FENCE = re.compile(r"^```(?:sql|json)?\s*|\s*```$", re.IGNORECASE)
+
+
+def ensure_read_only(sql: str) -> str:
+    """
+    Проверяет, что SQL — один запрос только на чтение (SELECT/WITH).
+
+    Returns:
+        Очищенный запрос без комментариев и завершающей точки с запятой
+
+    Raises:
+        UnsafeQueryError: если запрос может изменить данные или состоит из нескольких операторов
+    """
+    cleaned = _CODE_FENCE.sub("", sql.strip())
+    cleaned = _COMMENTS.sub(" ", cleaned).strip().rstrip(";").strip()
+    if not cleaned:
+        raise UnsafeQueryError("Пустой запрос")
+    if ";" in cleaned:
+        raise UnsafeQueryError("Допускается только один SQL-оператор")
+    if not re.match(r"^(select|with)\b", cleaned, re.IGNORECASE):
+        raise UnsafeQueryError("Разрешены только запросы SELECT")
+    # Строковые литералы не проверяем на ключевые слова (например, 'update' в тексте задачи)
+    without_literals = re.sub(r"'(?:[^']|'')*'", "''", cleaned)
+    forbidden = _FORBIDDEN_SQL.search(without_literals)
+    if forbidden:
+        raise UnsafeQueryError(f"Недопустимая операция в запросе: {forbidden.group(0).upper()}")
+    return cleaned
+
+
+def enforce_limit(sql: str, max_rows: int) -> str:
+    """Оборачивает запрос так, чтобы он вернул не больше max_rows строк."""
+    return f"SELECT * FROM ({sql}) AS limited_query LIMIT {int(max_rows)}"
+
+
+# ---- Кеш вопросов ----
+
+_PUNCTUATION = re.compile(r"[^\w\s.]", re.UNICODE)
+
+
+def normalize_question(question: str) -> str:
+    """Приводит вопрос к каноническому виду для ключа кеша."""
+    text = question.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return " ".join(text.split())
+
+
+class TemplateCache:
+    """
+    Кеш: (дата, нормализованный вопрос) -> (имя шаблона, параметры); общий
+    для всех воркеров, если он настроен.
+
+    Модель заполняет параметры абсолютными датами относительно сегодняшнего
+    дня ("завтра" -> дд.мм.гггг), поэтому выбор действителен только в тот
+    день, когда он сделан.
+    """
+
+    def __init__(self, max_size: int = 2048, ttl: float = 24 * 3600):
+        self._cache = make_cache("sql_templates", max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def _key(question: str, today: Optional[date]) -> str:
+        return f"{(today or date.today()).isoformat()}|{normalize_question(question)}"
+
+    async def get(self, question: str, today: Optional[date] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return await self._cache.aget(self._key(question, today))
+
+    async def set(self, question: str, template: str, params: Dict[str, Any], today: Optional[date] = None) -> None:
+        await self._cache.aset(self._key(question, today), (template, dict(params)))
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "hits": self._cache.hits, "misses": self._cache.misses}
+
+
+def parse_template_choice(raw: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Разбирает ответ модели вида {"template": "...", "params": {...}}.
+
+    Returns:
+        (имя шаблона, параметры) или None, если подходящего шаблона нет
+    """
+    raw = _CODE_FENCE.sub("", raw.strip())
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        logger.warning(f"Модель вернула не JSON при выборе шаблона: {raw[:200]}")
+        return None
+    if not isinstance(data, dict):
+        return None
+    name = data.get("template")
+    params = data.get("params") or {}
+    if not name or name not in TEMPLATES or not isinstance(params, dict):
+        return None
+    return name, params
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TimingWheel(Generic[T]):
+    """
+    Колесо таймеров для большого числа отложенных напоминаний.
+
+    Время разбито на тики длиной tick секунд; колесо из slots ячеек
+    покрывает slots * tick секунд, более дальние таймеры хранят число
+    оставшихся оборотов. Постановка и отмена — O(1), за тик
+    просматривается только одна ячейка. Повторная постановка с тем же
+    ключом заменяет прежний таймер.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 3600):
+        self.tick = tick
+        self.slots = slots
+        self._wheel: List[Dict[Hashable, Tuple[int, T]]] = [{} for _ in range(slots)]
+        self._where: Dict[Hashable, int] = {}
+        self._cursor = 0
+        self._ticks = 0  # сколько тиков колесо уже отсчитало
+        self._started = time.time()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def _current_tick(self) -> int:
+        return int((time.time() - self._started) // self.tick)
+
+    def schedule(self, key: Hashable, when: float, item: T) -> None:
+        """Ставит item на момент when (unix time); прошедшее время — ближайший тик."""
+        self.cancel(key)
+        target = math.ceil((when - self._started) / self.tick)
+        ticks = max(1, target - self._ticks)
+        rounds, offset = divmod(ticks - 1, self.slots)
+        slot = (self._cursor + offset + 1) % self.slots
+        self._wheel[slot][key] = (rounds, item)
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        self._wheel[slot].pop(key, None)
+        return True
+
+    def advance(self) -> List[T]:
+        """Сдвигает колесо на один тик и возвращает наступившие элементы."""
+        self._cursor = (self._cursor + 1) % self.slots
+        self._ticks += 1
+        bucket = self._wheel[self._cursor]
+        due = []
+        for key, (rounds, item) in list(bucket.items()):
+            if rounds:
+                bucket[key] = (rounds - 1, item)
+                continue
+            del bucket[key]
+            del self._where[key]
+            due.append(item)
+        return due
+
+    async def run(self, on_due: Callable[[T], Awaitable[Any]]) -> None:
+        """Крутит колесо в реальном времени; пропущенные тики (после паузы цикла) догоняются."""
+        while True:
+            await asyncio.sleep(self.tick)
+            while self._ticks < self._current_tick():
+                for item in self.advance():
+                    try:
+                        await on_due(item)
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки таймера: {e}", exc_info=True)
+
+    def start(self, on_due: Callable[[T], Awaitable[Any]]) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(on_due), name="timing-wheel")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import signal
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot.config import app_settings
+from bot.middlewares.inflight import InflightMiddleware
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATH = "/healthz"
+
+
+def webhook_secret() -> str:
+    """
+    Секрет вебхука из WEBHOOK_SECRET.
+
+    Без секрета любой, кто знает адрес вебхука, может подделать апдейт
+    от имени любого пользователя, поэтому прием без него не запускается.
+
+    Raises:
+        RuntimeError: если WEBHOOK_SECRET не задан
+    """
+    secret = app_settings.WEBHOOK_SECRET.get_secret_value() if app_settings.WEBHOOK_SECRET else ""
+    if not secret:
+        raise RuntimeError("Для DELIVERY_MODE=webhook нужен WEBHOOK_SECRET")
+    return secret
+
+
+class WebhookServer:
+    """
+    Прием апдейтов через вебхук (aiohttp).
+
+    Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются.
+    /healthz отдает 200, пока инстанс принимает апдейты, и 503 во время
+    остановки — балансировщик успевает снять его с ротации, пока
+    дорабатываются уже принятые апдейты.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str, secret: str, drain_timeout: float = 20.0):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self.inflight = InflightMiddleware()
+        dp.update.outer_middleware.register(self.inflight)
+        self.handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret)
+        self.app = self._build_app()
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(HEALTH_PATH, self.health)
+        app.router.add_post(self.path, self.receive)
+        setup_application(app, self.dp, bot=self.bot)
+        return app
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "status": "draining" if self.draining else "ok",
+                "inflight": self.inflight.inflight,
+                "processed": self.inflight.processed,
+            },
+            status=503 if self.draining else 200,
+        )
+
+    async def receive(self, request: web.Request) -> web.StreamResponse:
+        if self.draining:
+            # Telegram повторит доставку; за балансировщиком апдейт уйдет на другой инстанс
+            return web.Response(status=503, text="draining")
+        return await self.handler.handle(request)
+
+    async def drain(self) -> None:
+        """Перестает принимать апдейты и ждет завершения начатых (не дольше drain_timeout)."""
+        self.draining = True
+        logger.info(f"Остановка вебхука: ожидание {self.inflight.inflight} апдейтов в обработке...")
+        if not await self.inflight.wait_idle(self.drain_timeout):
+            logger.warning(f"Не дождались завершения {self.inflight.inflight} апдейтов за {self.drain_timeout} с")
+
+
+async def register_webhook(bot: Bot, secret: str, allowed_updates: Optional[List[str]]) -> None:
+    """Регистрирует вебхук WEBHOOK_BASE_URL + WEBHOOK_PATH в Telegram (накопившиеся апдейты сохраняются)."""
+    if not app_settings.WEBHOOK_BASE_URL:
+        raise RuntimeError("Для DELIVERY_MODE=webhook нужен WEBHOOK_BASE_URL")
+    url = app_settings.WEBHOOK_BASE_URL.rstrip("/") + app_settings.WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        allowed_updates=allowed_updates,
+        drop_pending_updates=False,
+    )
+    logger.info(f"Вебхук зарегистрирован: {url}")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Запускает aiohttp-сервер вебхука и работает до SIGTERM/SIGINT.
+
+    Вебхук регистрируется в Telegram, только если WEBHOOK_SET_ON_START
+    (при нескольких инстансах за балансировщиком — на одном из них).
+    """
+    secret = webhook_secret()
+    server = WebhookServer(dp, bot, app_settings.WEBHOOK_PATH, secret, app_settings.WEBHOOK_DRAIN_TIMEOUT)
+    runner = web.AppRunner(server.app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, app_settings.WEBHOOK_HOST, app_settings.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Вебхук слушает {app_settings.WEBHOOK_HOST}:{app_settings.WEBHOOK_PORT}{app_settings.WEBHOOK_PATH}")
+
+    if app_settings.WEBHOOK_SET_ON_START:
+        await register_webhook(bot, secret, dp.resolve_used_update_types())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        await server.drain()
+        await runner.cleanup()
+        logger.info("Сервер вебхука остановлен.")
@@ -1,12 +1,15 @@
 import asyncio
 import logging
-from typing import Optional
+import os
+import signal
+from typing import Any, List, Optional, Sequence
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from supabase import create_client, Client
 
@@ -17,10 +20,32 @@ from bot.handlers import start
 from bot.handlers import help as help_command
 from bot.handlers import ai_query as ai_query_handler  # Переименовано для ясности
 from bot.handlers import employees_handler
+from bot.handlers import export_handler
 from bot.handlers import nlu_handler  # Оригинальный обработчик NLU
+from bot.handlers import ai_db_query_handler  # /query: шаблоны SQL и text-to-SQL
+from bot.handlers import search
 from bot.handlers import ai_intent_handler  # Новый обработчик AI интентов
+from bot.handlers.ai_intent_handler import run_ai_pipeline
 
+from bot.fsm_storage import create_fsm_storage
 from bot.middlewares.auth import AuthMiddleware
+from bot.middlewares.deadline import DeadlineMiddleware
+from bot.middlewares.relevance import RelevanceMiddleware
+from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.utils.invalidation import InvalidationRelay
+from bot.utils.jobs import setup_jobs
+from bot.utils.materialized import MaterializedAnswers
+from bot.utils.notifications import setup_notifications
+from bot.utils.outbound import setup_outbound
+from bot.utils.relevance import RelevanceGate
+from bot.utils.repository import Repository
+from bot.polling import run_polling
+from bot.sharding import run_supervisor, serve_shard
+from bot.tenants import BotProfile, get_profile, load_bot_profiles
+from bot.webhook import run_webhook
+
+# Общий кеш воркеров, если SHARED_CACHE_PATH не задан явно
+DEFAULT_SHARED_CACHE_PATH = "shared_cache.sqlite3"
 
 
 def convert_date_format(dmy_date_str: str) -> Optional[str]:
@@ -68,7 +93,7 @@ def register_router(dp: Dispatcher, module, module_name: str) -> bool:
 
 async def setup_supabase(bot: Bot) -> None:
     """
-    Настраивает подключение к Supabase и добавляет клиент в объект бота
+    Настраивает подключение к Supabase и добавляет клиент и репозиторий в объект бота
 
     Args:
         bot: Экземпляр бота
@@ -88,28 +113,66 @@ async def setup_supabase(bot: Bot) -> None:
         logging.error(f"Ошибка подключения к Supabase: {e}", exc_info=True)
         bot.supabase_client = None
 
+    # Единый репозиторий данных для всех обработчиков
+    bot.repository = Repository(bot.supabase_client) if bot.supabase_client else None
 
-async def main():
-    # Настройка логирования
+
+ROUTER_MODULES = [
+    (start, "bot.handlers.start"),
+    (help_command, "bot.handlers.help"),
+    (ai_query_handler, "bot.handlers.ai_query"),
+    (employees_handler, "bot.handlers.employees_handler"),
+    (export_handler, "bot.handlers.export_handler"),
+    (nlu_handler, "bot.handlers.nlu_handler"),  # Оригинальный NLU обработчик
+    (ai_db_query_handler, "bot.handlers.ai_db_query_handler"),  # до ai_intent_handler: перехватывает /query
+    (search, "bot.handlers.search"),
+    (ai_intent_handler, "bot.handlers.ai_intent_handler")  # Дополнительный новый обработчик AI интентов
+]
+
+
+def setup_logging() -> None:
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(name)s - %(module)s.%(funcName)s: %(message)s",
     )
-    logging.info("Запуск бота...")
 
-    # Инициализация бота и диспетчера
-    storage = MemoryStorage()
-    bot = Bot(
-        token=app_settings.BOT_TOKEN.get_secret_value(),
+
+def create_session() -> AiohttpSession:
+    """HTTP-сессия Bot API (с альтернативным сервером, если он задан); может быть общей для нескольких ботов"""
+    if app_settings.TELEGRAM_API_URL:
+        return AiohttpSession(api=TelegramAPIServer.from_base(app_settings.TELEGRAM_API_URL))
+    return AiohttpSession()
+
+
+def create_bot(token: Optional[str] = None, session: Optional[AiohttpSession] = None) -> Bot:
+    """Создает бота (по умолчанию — BOT_TOKEN со своей сессией)"""
+    return Bot(
+        token=token or app_settings.BOT_TOKEN.get_secret_value(),
+        session=session or create_session(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+
+
+def create_dispatcher(profiles: Sequence[BotProfile] = ()) -> Dispatcher:
+    """
+    Создает диспетчер с авторизацией и всеми роутерами
+
+    Args:
+        profiles: Профили ботов, если диспетчер общий для нескольких ботов (у каждого свой список ID)
+    """
+    storage = create_fsm_storage()
     dp = Dispatcher(storage=storage)
 
+    # Срок ответа отсчитывается с получения апдейта, поэтому этот middleware — первый
+    dp.update.outer_middleware.register(DeadlineMiddleware(app_settings.DEFAULT_RESPONSE_TIMEOUT))
+
     # Настройка авторизации
-    if app_settings.ALLOWED_USER_IDS:
+    if app_settings.ALLOWED_USER_IDS or any(profile.allowed_user_ids for profile in profiles):
         logging.info(
             f"Авторизация по ID включена. Разрешенные ID: {app_settings.ALLOWED_USER_IDS}"
         )
+        for profile in profiles if len(profiles) > 1 else ():
+            logging.info(f"Разрешенные ID бота {profile.name}: {profile.allowed_user_ids or 'без ограничений'}")
         dp.update.outer_middleware.register(
             AuthMiddleware(allowed_ids=app_settings.ALLOWED_USER_IDS)
         )
@@ -118,35 +181,159 @@ async def main():
             "ALLOWED_USER_IDS не настроен или пуст. Авторизация по ID отключена."
         )
 
-    # Настройка Supabase
-    await setup_supabase(bot)
+    # Сообщения групп, адресованные не боту, отсекаются до AI (и до учета лимитов)
+    relevance_gate = RelevanceGate(
+        threshold=app_settings.GROUP_RELEVANCE_THRESHOLD,
+        use_classifier=app_settings.GROUP_CLASSIFIER_ENABLED,
+    )
+    dp["relevance_gate"] = relevance_gate
+    dp.message.outer_middleware.register(RelevanceMiddleware(relevance_gate))
+
+    # Ограничение частоты сообщений (устаревшие запросы отменяет JobExecutor)
+    dp.message.outer_middleware.register(ThrottlingMiddleware(
+        rate=app_settings.THROTTLE_RATE,
+        burst=app_settings.THROTTLE_BURST,
+        duplicate_window=app_settings.THROTTLE_DUPLICATE_WINDOW,
+        max_users=app_settings.THROTTLE_MAX_USERS,
+    ))
 
     # Регистрация обработчиков
     logging.info("Регистрация хендлеров...")
-
-    # Список модулей с роутерами для регистрации
-    router_modules = [
-        (start, "bot.handlers.start"),
-        (help_command, "bot.handlers.help"),
-        (ai_query_handler, "bot.handlers.ai_query"),
-        (employees_handler, "bot.handlers.employees_handler"),
-        (nlu_handler, "bot.handlers.nlu_handler"),  # Оригинальный NLU обработчик
-        (ai_intent_handler, "bot.handlers.ai_intent_handler")  # Дополнительный новый обработчик AI интентов
-    ]
-
-    # Регистрация всех роутеров
-    for module, module_name in router_modules:
+    for module, module_name in ROUTER_MODULES:
         register_router(dp, module, module_name)
+    return dp
 
-    # Запуск бота
-    await bot.delete_webhook(drop_pending_updates=True)
-    logging.info("Начинаем поллинг...")
 
+async def start_services(bots: Sequence[Bot], worker: Optional[int] = None) -> List[Any]:
+    """
+    Запускает фоновые сервисы ботов процесса.
+
+    Args:
+        bots: Боты с общим репозиторием
+        worker: Номер процесса-воркера в режиме нескольких процессов (None — один процесс)
+
+    Returns:
+        Список запущенных сервисов (у каждого есть async stop()), в порядке запуска
+    """
+    # Исходящие сообщения: у каждого бота своя очередь — лимиты Telegram считаются по боту
+    # (воркеры одного бота делят общий лимит поровну)
+    processes = app_settings.WORKERS if worker is not None else 1
+    services: List[Any] = [setup_outbound(bot, processes) for bot in bots]
+    repository = bots[0].repository
+    if not repository:
+        return services
+
+    # Воркеры сообщают друг другу о записях в таблицы, чтобы не отдавать устаревшие данные
+    if worker is not None and app_settings.SHARED_CACHE_PATH:
+        relay = InvalidationRelay(repository, app_settings.SHARED_CACHE_PATH)
+        await relay.start()
+        services.append(relay)
+
+    # Заранее вычисляемые ответы на частые вопросы (общие для всех ботов)
+    materialized = MaterializedAnswers.for_repository(repository)
+    materialized.start()
+    services.append(materialized)
+
+    # Фоновое выполнение AI-запросов: один пул на все боты
+    services.append(setup_jobs(bots, lambda job, deadline: run_ai_pipeline(repository, job.text, deadline), worker))
+
+    # Проактивные уведомления (NOTIFICATIONS_ENABLED или настройка бота); при нескольких процессах — только в первом
+    for bot in bots:
+        profile = get_profile(bot)
+        if not worker and (profile.notifications if profile else app_settings.NOTIFICATIONS_ENABLED):
+            services.append(await setup_notifications(bot, repository))
+    return services
+
+
+async def stop_services(services: List[Any]) -> None:
+    # В обратном порядке: исходящая очередь останавливается последней и успевает отправить ответы
+    for service in reversed(services):
+        try:
+            await service.stop()
+        except Exception as e:
+            logging.error(f"Ошибка остановки сервиса {type(service).__name__}: {e}", exc_info=True)
+
+
+async def run_worker(index: int, queue) -> None:
+    """
+    Воркер в режиме нескольких процессов: свой бот, диспетчер и репозиторий,
+    апдейты своего шарда из очереди супервизора.
+
+    Уведомления рассылает только воркер 0, иначе каждый процесс отправил бы их заново.
+    Хранилища таблиц и индексы у каждого воркера свои; о записях других
+    воркеров он узнает через InvalidationRelay.
+    """
+    bot = create_bot()
+    dp = create_dispatcher()
+    await setup_supabase(bot)
+    services = await start_services([bot], worker=index)
     try:
-        await dp.start_polling(bot)
+        await serve_shard(index, queue, bot, dp)
     finally:
-        logging.info("Остановка бота...")
+        await stop_services(services)
         await bot.session.close()
+
+
+def worker_main(index: int, queue) -> None:
+    """Точка входа процесса-воркера (должна импортироваться по имени — используется spawn)"""
+    setup_logging()
+    # Сигналы останавливают супервизор, а он — воркеры через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, queue))
+
+
+async def main():
+    # Настройка логирования
+    setup_logging()
+    logging.info("Запуск бота...")
+
+    try:
+        profiles = load_bot_profiles()
+    except ValueError as e:
+        logging.error(str(e))
+        return
+    if len(profiles) > 1 and (app_settings.WORKERS > 1 or app_settings.DELIVERY_MODE == "webhook"):
+        logging.error("Несколько ботов в одном процессе поддерживаются только в режиме поллинга с WORKERS=1")
+        return
+
+    if app_settings.WORKERS > 1:
+        # Воркеры получают настройки через окружение: общий кеш должен быть задан до их запуска
+        if not app_settings.SHARED_CACHE_PATH:
+            app_settings.SHARED_CACHE_PATH = DEFAULT_SHARED_CACHE_PATH
+        os.environ["SHARED_CACHE_PATH"] = app_settings.SHARED_CACHE_PATH
+        logging.info(f"Режим нескольких процессов: {app_settings.WORKERS} воркеров")
+        await run_supervisor(app_settings.WORKERS, worker_main, create_dispatcher().resolve_used_update_types())
+        return
+
+    # Инициализация ботов и диспетчера: пул HTTP-соединений, Supabase и кеши общие для всех ботов
+    session = create_session()
+    bots = []
+    for profile in profiles:
+        bot = create_bot(profile.token, session)
+        bot.profile = profile
+        bots.append(bot)
+    dp = create_dispatcher(profiles)
+
+    # Настройка Supabase
+    await setup_supabase(bots[0])
+    for bot in bots[1:]:
+        bot.supabase_client = bots[0].supabase_client
+        bot.repository = bots[0].repository
+
+    services = await start_services(bots)
+
+    # Запуск бота
+    try:
+        if app_settings.DELIVERY_MODE == "webhook":
+            logging.info("Запуск в режиме вебхука...")
+            await run_webhook(dp, bots[0])
+        else:
+            logging.info("Начинаем поллинг...")
+            await run_polling(dp, *bots)
+    finally:
+        logging.info("Остановка бота...")
+        await stop_services(services)
+        await session.close()
         logging.info("Сессия бота закрыта.")
 
 
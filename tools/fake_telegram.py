@@ -0,0 +1,121 @@
+"""
+Локальная проверка режима вебхука без Telegram.
+
+Поднимает поддельный Bot API (отвечает ok на любой метод и запоминает
+sendMessage) и отправляет в вебхук бота текстовые апдейты с секретным
+заголовком, как это делает Telegram. Печатает задержку от отправки
+апдейта до ответа бота.
+
+Запуск бота:
+    DELIVERY_MODE=webhook WEBHOOK_SET_ON_START=false WEBHOOK_SECRET=test \\
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+
+Запуск проверки:
+    python tools/fake_telegram.py --webhook http://127.0.0.1:8080/telegram/webhook --secret test
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.replies: Dict[int, asyncio.Future] = {}
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == "application/json":
+            payload = await request.json()
+        else:
+            payload = dict(await request.post())
+
+        result: object = True
+        if method.lower() == "sendmessage":
+            chat_id = int(payload.get("chat_id"))
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": payload.get("text", ""),
+            }
+            future = self.replies.get(chat_id)
+            if future and not future.done():
+                future.set_result(time.perf_counter())
+        elif method.lower() == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--webhook", default="http://127.0.0.1:8080/telegram/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--text", default="/start")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    latencies: List[float] = []
+    async with aiohttp.ClientSession() as session:
+        async def send(i: int) -> None:
+            chat_id = 100_000 + i
+            future = api.replies[chat_id] = asyncio.get_running_loop().create_future()
+            started = time.perf_counter()
+            async with session.post(args.webhook, json=make_update(i + 1, chat_id, args.text), headers=headers) as resp:
+                if resp.status != 200:
+                    print(f"update {i + 1}: HTTP {resp.status}")
+                    return
+            try:
+                replied = await asyncio.wait_for(future, timeout=args.timeout)
+                latencies.append((replied - started) * 1000)
+            except asyncio.TimeoutError:
+                print(f"update {i + 1}: нет ответа за {args.timeout} с")
+
+        await asyncio.gather(*(send(i) for i in range(args.updates)))
+
+        # Запрос с неверным секретом должен быть отклонен
+        async with session.post(args.webhook, json=make_update(0, 1, "/start"),
+                                headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as resp:
+            print(f"неверный секрет: HTTP {resp.status}")
+
+    await runner.cleanup()
+    if latencies:
+        print(f"ответов: {len(latencies)}/{args.updates}, задержка мс: "
+              f"медиана {statistics.median(latencies):.1f}, максимум {max(latencies):.1f}")
+    print(f"вызовы Bot API: {api.calls}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Локальная замена Redis для проверки FSM_STORAGE=redis без настоящего сервера.
+
+Понимает только команды, которые использует bot.fsm_storage.RedisStorage
+(PING, AUTH, SELECT, GET, SET [EX], DEL, DBSIZE); данные хранятся в памяти.
+
+Запуск:
+    python tools/resp_server.py --port 6379
+    FSM_STORAGE=redis FSM_REDIS_URL=redis://127.0.0.1:6379/0 python main.py
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RespServer:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+    def _alive(self, key: bytes) -> Optional[bytes]:
+        record = self.data.get(key)
+        if record is None:
+            return None
+        value, expires_at = record
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def dispatch(self, args: List[bytes]) -> Any:
+        command = args[0].upper()
+        if command in (b"PING", b"AUTH", b"SELECT"):
+            return "PONG" if command == b"PING" else "OK"
+        if command == b"GET":
+            return self._alive(args[1])
+        if command == b"SET":
+            expires_at = None
+            if len(args) >= 5 and args[3].upper() == b"EX":
+                expires_at = time.monotonic() + int(args[4])
+            self.data[args[1]] = (args[2], expires_at)
+            return "OK"
+        if command == b"DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        if command == b"DBSIZE":
+            return sum(1 for key in list(self.data) if self._alive(key) is not None)
+        return RuntimeError(f"ERR unknown command '{command.decode()}'")
+
+    @staticmethod
+    def encode(reply: Any) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Exception):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                count = int(line[1:-2])
+                args = []
+                for _ in range(count):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self.encode(self.dispatch(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(RespServer().handle, args.host, args.port)
+    print(f"RESP-сервер слушает {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())